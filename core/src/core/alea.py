@@ -133,22 +133,47 @@ def run_and_display(component, inputs, gui=False, pm=None):
         start_qt(factory, node)
 
 
-def run(component, inputs, pm=None, vtx_id=-1):
+def run(component, inputs, pm=None, vtx_id=-1, quiet=True):
     """ Run component with inputs. can exit by exception.
 
     If node_id is given, eval the dataflow from that node and return the result.
+    If quiet is True, nodes do not send notifications during the evaluation.
     """
+    from openalea.core.observer import quiet_notifications
 
     _factory, node = get_node(component, inputs, pm)
 
     if vtx_id < 0:
-        node.eval()
+        if quiet:
+            with quiet_notifications():
+                node.eval()
+        else:
+            node.eval()
         return _outputs(node)
     else:
-        node.eval_as_expression(vtx_id)
+        node.eval_as_expression(vtx_id, quiet=quiet)
         return _outputs(node.node(vtx_id))
 
 
+def run_batch(component, filename, workers=1, ordered=False, pm=None,
+              executor='thread'):
+    """ Run component for each line of the csv file filename.
+
+    The first line of the file gives the input names. Outputs are printed
+    as csv lines starting with the record index, failures are reported on
+    stderr without stopping the batch. The workers are threads, or
+    processes if executor is 'process' (see batch.map_node).
+    Return the number of failed records.
+    """
+    from openalea.core.batch import map_node, read_csv, write_results
+
+    factory, node = get_node(component, None, pm)
+    results = map_node(node, read_csv(filename), workers=workers,
+                       ordered=ordered, instantiate=factory.instantiate,
+                       executor=executor, quiet=True)
+    return write_results(results)
+
+
 def query(component, pm=None):
     """ show help of component """
 
@@ -304,6 +329,8 @@ def main():
 %prog [-r|-q] package_id[:node_id] [-i key1=val1 key2=val2 ...]
 or
 %prog [-r|-q] package_id[/node_id] [-i key1=val1 key2=val2 ...]
+or
+%prog -r package_id:node_id --batch inputs.csv [-w nb_workers] [--processes]
 """
     parser = OptionParser(usage=usage)
 
@@ -331,6 +358,28 @@ or
                        help="Specify inputs as KEY=VALUE, KEY=VALUE...",
                        dest="input")
 
+    parser.add_option("-b", "--batch", dest="batch",
+                       help="Run component for each line of a csv file "
+                            "whose first line gives the input names.",
+                       metavar="FILE", default=None)
+
+    parser.add_option("-w", "--workers", dest="workers", type="int",
+                       help="Number of workers used in batch mode. The "
+                            "workers are threads, hence only the nodes "
+                            "releasing the GIL run in parallel, unless "
+                            "--processes is given.",
+                       default=1)
+
+    parser.add_option("--processes", dest="processes",
+                       help="Use worker processes in batch mode (the "
+                            "component, its inputs and outputs must be "
+                            "picklable).",
+                       action="store_true", default=False)
+
+    parser.add_option("--ordered", dest="ordered",
+                       help="Output batch results in the order of the file.",
+                       action="store_true", default=False)
+
     try:
         (options, args)= parser.parse_args()
     except Exception, error:
@@ -348,7 +397,14 @@ or
         import openalea.core.data
         openalea.core.data.PackageData.__local__ = True
 
-    if(options.run):
+    if(options.run and options.batch):
+        executor = 'process' if options.processes else 'thread'
+        nb_errors = run_batch(component, options.batch,
+                              options.workers, options.ordered,
+                              executor=executor)
+        if nb_errors:
+            sys.exit(1)
+    elif(options.run):
         run_and_display(component, options.input, options.gui)
     else:
         query(component, )
@@ -20,102 +20,27 @@ __license__ = "Cecill-C"
 __revision__ = " $Id$ "
 
 import sys
-from time import clock
+import heapq
+import Queue
+import itertools
+import threading
+from time import clock, time
 import traceback as tb
+from multiprocessing import cpu_count
 from openalea.core import ScriptLibrary
 
 from openalea.core.dataflow import SubDataflow
+from openalea.core.executor import executors
 from openalea.core.interface import IFunction
+from openalea.core.observer import notifications_enabled, quiet_notifications
+from openalea.core.profiler import get_profiler
 
 
 PROVENANCE = False
 
 # Implement provenance in OpenAlea
-db_conn = None
-
-import sqlite3
-from openalea.core.path import path
-from openalea.core import settings
-
-def db_create(cursor):
-    cur = cursor
-    #-prospective provenance-#
-    #User table creation
-    cur.execute("CREATE TABLE IF NOT EXISTS User (userid INTEGER,createtime DATETIME,name varchar (25), firstname varchar (25), email varchar (25), password varchar (25),PRIMARY KEY(userid))")
-
-    # CompositeNode table creation
-    cur.execute("CREATE TABLE IF NOT EXISTS CompositeNode (CompositeNodeid INTEGER, creatime DATETIME, name varchar (25), description varchar (25),userid INTEGER,PRIMARY KEY(CompositeNodeid),FOREIGN KEY(userid) references User)")
-    #Cr?ation de la table Node
-    cur.execute("CREATE TABLE IF NOT EXISTS Node (Nodeid INTEGER, createtime DATETIME, name varchar (25), NodeFactory varchar (25),CompositeNodeid INTEGER,PRIMARY KEY(Nodeid),FOREIGN KEY(CompositeNodeid) references CompsiteNode)")
-    #Cr?ation de la table Input
-    cur.execute("CREATE TABLE IF NOT EXISTS Input (Inputid INTEGER, createtime DATETIME, name varchar (25), typedata varchar (25), InputPort INTEGER,PRIMARY KEY (Inputid))")
-    #Cr?ation de la table Output
-    cur.execute("CREATE TABLE IF NOT EXISTS Output (Outputid INTEGER, createtime DATETIME, name varchar (25), typedata varchar (25), OutputPort INTEGER,PRIMARY KEY (Outputid))")
-    #Cr?ation de la table elt_connection
-    cur.execute("CREATE TABLE IF NOT EXISTS elt_connection (elt_connectionid INTEGER, createtime DATETIME,srcNodeid INTEGER, srcNodeOutputPortid INTEGER, targetNodeid INTEGER, targetNodeInputPortid INTEGER ,PRIMARY KEY (elt_connectionid))")
-
-    #- retrospective provenance -#
-    #- CompositeNodeExec table creation
-    cur.execute("CREATE TABLE IF NOT EXISTS CompositeNodeExec (CompositeNodeExecid INTEGER, createtime DATETIME, endtime DATETIME,userid INTEGER,CompositeNodeid INTEGER,PRIMARY KEY(CompositeNodeExecid),FOREIGN KEY(CompositeNodeid) references CompositeNode,FOREIGN KEY(userid) references User)")
-    #- NodeExec 
-    cur.execute("CREATE TABLE IF NOT EXISTS NodeExec (NodeExecid INTEGER, createtime DATETIME, endtime DATETIME,Nodeid INTEGER,CompositeNodeExecid INTEGER,dataid INTEGER,PRIMARY KEY(NodeExecid),FOREIGN KEY(Nodeid) references Node, FOREIGN KEY (CompositeNodeExecid) references CompositeNodeExec, FOREIGN KEY (dataid) references Data)")
-    #- History
-    cur.execute("CREATE TABLE IF NOT EXISTS Histoire (Histoireid INTEGER, createtime DATETIME, name varchar (25), description varchar (25),userid INTEGER,CompositeNodeExecid INTEGER,PRIMARY KEY (Histoireid), FOREIGN KEY(Userid) references User, FOREIGN KEY(CompositeNodeExecid) references CompositeNodeExec)")
-    #- Data
-    cur.execute("CREATE TABLE IF NOT EXISTS Data (dataid INTEGER, createtime DATETIME,NodeExecid INTEGER, PRIMARY KEY(dataid),FOREIGN KEY(NodeExecid) references NodeExec)")
-    #- Tag
-    cur.execute("CREATE TABLE IF NOT EXISTS Tag (CompositeNodeExecid INTEGER, createtime DATETIME, name varchar(25),userid INTEGER,PRIMARY KEY(CompositeNodeExecid),FOREIGN KEY(userid) references User)")
-    return cur
-
-def get_database_name():
-    db_fn = path(settings.get_openalea_home_dir())/'provenance.sq3'
-    return db_fn
-
-def db_connexion():
-    """ Return a curso on the database.
-
-    If the database does not exists, create it.
-    """
-    global db_conn
-    if db_conn is None:
-        db_fn = get_database_name()
-        if not db_fn.exists():
-            db_conn=sqlite3.connect(db_fn)
-            cur = db_conn.cursor()
-            cur = db_create(cur)
-            return cur
-    else:
-        cur = db_conn.cursor()
-        return cur
-
-class Provenance(object):
-    def __init__(self, workflow):
-        self.clear()
-        self.workflow = workflow
-
-    def edges(self):
-        cn = self.workflow
-        edges= list(cn.edges())
-        sources=map(cn.source,edges)
-        targets = map(cn.target,edges)
-        source_ports=[cn.local_id(cn.source_port(eid)) for eid in edges]
-        target_ports=[cn.local_id(cn.target_port(eid)) for eid in edges]
-        _edges = dict(zip(edges,zip(sources,source_ports,targets, target_ports)))
-        return _edges
-
-    def clear(self):
-        self.nodes = []
-
-    def start_time(self):
-        pass
-    def end_time(self):
-        pass
-    def workflow_exec(self, *args):
-        pass
-    def node_exec(self, vid, node, start_time, end_time, *args):
-        pass
-    def write(self):
-        """ Write the provenance in db """
+from openalea.core.provenance import (Provenance, db_create, db_connexion,
+                                      get_database_name)
 
 class PrintProvenance(Provenance):
     def workflow_exec(self, *args):
@@ -123,6 +48,8 @@ class PrintProvenance(Provenance):
     def node_exec(self, vid, node, start_time, end_time, *args):
         provenance(vid, node, start_time, end_time)
 
+# class of the Provenance objects created by the evaluation algorithms
+provenance_class = PrintProvenance
 
 def provenance(vid, node, start_time, end_time):
     #from service import db
@@ -192,6 +119,79 @@ def cmp_posx(x, y):
     return ret
 
 
+class ExecutionPlan(object):
+    """ Topological information of a dataflow used by the evaluation
+    algorithms: input ports of the vertices and nodes connected to them,
+    sorted by position.
+
+    The plan is computed at once and never modified, hence it is shared by
+    all the evaluations (and threads) of the dataflow while its topology
+    (vertices, ports, edges and actors) and the positions of the nodes
+    connected to a same input port are not modified.
+    """
+
+    def __init__(self, dataflow):
+        self._dataflow = dataflow
+        self._version = dataflow.topology_version()
+        self._in_ports = {}
+        self._parents = {}
+        self._inputs = {}
+        # {id(actor): (actor, ad hoc dict, position version)} of the nodes
+        # sorted by position
+        self._positions = {}
+
+        df = dataflow
+        for vid in df.vertices():
+            pids = self._in_ports[vid] = list(df.in_ports(vid))
+            inputs = self._inputs[vid] = []
+            for pid in pids:
+                npids = [(npid, df.vertex(npid), df.actor(df.vertex(npid)))
+                         for npid in df.connected_ports(pid)]
+                if len(npids) > 1:
+                    for npid, nvid, nactor in npids:
+                        meta = nactor.get_ad_hoc_dict()
+                        self._positions[id(nactor)] = \
+                            (nactor, meta, meta.position_version)
+                    npids.sort(cmp=cmp_posx)
+                self._parents[pid] = npids
+                if npids:
+                    inputs.append((df.local_id(pid),
+                                   [(nactor, df.local_id(npid))
+                                    for npid, nvid, nactor in npids]))
+
+        self._leaves = [vid for vid in df.vertices()
+                        if df.nb_out_edges(vid) == 0]
+
+    def is_valid(self):
+        """ Return True if the dataflow has not been modified since the
+        plan has been computed. """
+        if self._version != self._dataflow.topology_version():
+            return False
+        for actor, meta, version in self._positions.itervalues():
+            if actor.get_ad_hoc_dict() is not meta or \
+                    meta.position_version != version:
+                return False
+        return True
+
+    def in_ports(self, vid):
+        """ Return the list of input port ids of vid """
+        return self._in_ports[vid]
+
+    def parent_nodes(self, pid):
+        """ Return the list of (port_pid, node_pid, actor) connected
+        to the input port pid. """
+        return self._parents[pid]
+
+    def inputs(self, vid):
+        """ Return the list of (local input port id, [(actor, local output
+        port id)]) of the connected input ports of vid """
+        return self._inputs[vid]
+
+    def leaves(self):
+        """ Return the list of vertices without out edges """
+        return self._leaves
+
+
 # Evaluation Algoithm
 
 """ Abstract evaluation algorithm """
@@ -203,8 +203,8 @@ class AbstractEvaluation(object):
         :param dataflow: to be done
         """
         self._dataflow = dataflow
-        if PROVENANCE:
-            self.provenance = PrintProvenance(dataflow)
+        # created on demand when PROVENANCE is enabled
+        self.provenance = None
 
     def eval(self, *args):
         """todo"""
@@ -221,22 +221,25 @@ class AbstractEvaluation(object):
         """
 
         node = self._dataflow.actor(vid)
+        profiler = get_profiler()
 
         try:
-            t0 = clock()
-            ret = node.eval()
-            t1 = clock()
-
             if PROVENANCE:
-                self.provenance.node_exec(vid, node, t0,t1)
-                #provenance(vid, node, t0,t1)
-            
+                t0 = time()
+            if profiler is None:
+                ret = self.eval_actor(node)
+            else:
+                ret = profiler.eval_actor(self, vid, node)
+            if PROVENANCE:
+                self.get_provenance().node_exec(vid, node, t0, time())
+
             # When an exception is raised, a flag is set.
             # So we remove it when evaluation is ok.
             node.raise_exception = False
             # if hasattr(node, 'raise_exception'):
             #     del node.raise_exception
-            node.notify_listeners(('data_modified', None, None))
+            if notifications_enabled():
+                node.notify_listeners(('data_modified', None, None))
             return ret
 
         except EvaluationException, e:
@@ -255,21 +258,55 @@ class AbstractEvaluation(object):
                 tb.format_tb(sys.exc_info()[2]))
 
 
+    def eval_actor(self, actor):
+        """ Run the evaluation of an actor.
+
+        Derived algorithms can override it to evaluate the actor elsewhere.
+        """
+        return actor.eval()
+
+    def get_plan(self):
+        """ Return the execution plan of the dataflow.
+
+        The plan is kept by the dataflow, and shared by the evaluations,
+        until its topology is modified.
+        """
+        df = self._dataflow
+        plan = df.__dict__.get('_execution_plan')
+        if plan is None or not plan.is_valid():
+            plan = df._execution_plan = ExecutionPlan(df)
+        return plan
+
+    def in_ports(self, vid):
+        """ Return the list of input ports of vid """
+        return self.get_plan().in_ports(vid)
+
     def get_parent_nodes(self, pid):
         """
         Return the list of parent node connected to pid
         The list contains tuples (port_pid, node_pid, actor)
         This list is sorted by the x value of the node
         """
+        return self.get_plan().parent_nodes(pid)
 
-        df = self._dataflow
+    def set_vertex_inputs(self, vid):
+        """ Copy the outputs of the parents of vid on its inputs """
+        actor = self._dataflow.actor(vid)
 
-        # For each connected node
-        npids = [(npid, df.vertex(npid), df.actor(df.vertex(npid))) \
-                     for npid in df.connected_ports(pid)]
-        npids.sort(cmp=cmp_posx)
+        for port, parents in self.get_plan().inputs(vid):
+            # set input as a list or a simple value
+            if len(parents) == 1:
+                nactor, nport = parents[0]
+                actor.set_input(port, nactor.get_output(nport))
+            else:
+                actor.set_input(port, [nactor.get_output(nport)
+                                       for nactor, nport in parents])
 
-        return npids
+    def get_provenance(self):
+        """ Return the Provenance object of the evaluation """
+        if self.provenance is None:
+            self.provenance = provenance_class(self._dataflow)
+        return self.provenance
 
     def set_provenance(self, provenance):
         self.provenance = provenance
@@ -311,7 +348,7 @@ class BrutEvaluation(AbstractEvaluation):
         self._evaluated.add(vid)
 
         # For each inputs
-        for pid in df.in_ports(vid):
+        for pid in self.in_ports(vid):
             inputs = []
 
             cpt = 0
@@ -334,18 +371,18 @@ class BrutEvaluation(AbstractEvaluation):
 
     def eval(self, *args):
         """ Evaluate the whole dataflow starting from leaves"""
-        t0 = clock()
+        t0 = clock() if quantify else 0
         df = self._dataflow
 
         # Unvalidate all the nodes
         self._evaluated.clear()
 
         # Eval from the leaf
-        for vid in (vid for vid in df.vertices() if df.nb_out_edges(vid)==0):
+        for vid in self.get_plan().leaves():
             self.eval_vertex(vid)
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
 
 
@@ -355,7 +392,7 @@ class PriorityEvaluation(BrutEvaluation):
 
     def eval(self, vtx_id=None, *args, **kwds):
         """todo"""
-        t0 = clock()
+        t0 = clock() if quantify else 0
 
         is_subdataflow = False if not kwds else kwds.get('is_subdataflow', False)
         df = self._dataflow
@@ -369,8 +406,7 @@ class PriorityEvaluation(BrutEvaluation):
             return self.eval_vertex(vtx_id, *args)
 
         # Select the leaves (list of (vid, actor))
-        leaves = [(vid, df.actor(vid))
-              for vid in df.vertices() if df.nb_out_edges(vid)==0]
+        leaves = [(vid, df.actor(vid)) for vid in self.get_plan().leaves()]
 
         leaves.sort(cmp_priority)
 
@@ -378,8 +414,8 @@ class PriorityEvaluation(BrutEvaluation):
         for vid, actor in leaves:
             self.eval_vertex(vid, *args)
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
 
 
@@ -417,7 +453,7 @@ class GeneratorEvaluation(AbstractEvaluation):
         self._evaluated.add(vid)
 
         # For each inputs
-        for pid in df.in_ports(vid):
+        for pid in self.in_ports(vid):
             inputs = []
 
             cpt = 0
@@ -444,7 +480,7 @@ class GeneratorEvaluation(AbstractEvaluation):
             self.reeval = ret
 
     def eval(self, vtx_id=None, step=False):
-        t0 = clock()
+        t0 = clock() if quantify else 0
 
         df = self._dataflow
 
@@ -453,11 +489,13 @@ class GeneratorEvaluation(AbstractEvaluation):
 
         else:
             # Select the leafs (list of (vid, actor))
-            leafs = [(vid, df.actor(vid))
-                for vid in df.vertices() if df.nb_out_edges(vid)==0]
+            leafs = [(vid, df.actor(vid)) for vid in self.get_plan().leaves()]
 
         leafs.sort(cmp_priority)
 
+        # nodes evaluated by a previous call
+        self.clear()
+
         # Execute
         for vid, actor in leafs:
             if not self.is_stopped(vid, actor):
@@ -466,12 +504,223 @@ class GeneratorEvaluation(AbstractEvaluation):
                     self.clear()
                     self.eval_vertex(vid)
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
         return False
 
 
+class PrefetchIterator(object):
+    """ Iterator reading ahead at most size items of an iterator in a
+    thread. The thread waits while the buffer is full (back-pressure). """
+
+    def __init__(self, iterator, size):
+        self._source = iterator
+        self._buffer = Queue.Queue(size)
+        self._closed = False
+        # entry read by the thread after close
+        self._left = []
+        self._thread = threading.Thread(target=self._fill)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, entry):
+        while not self._closed:
+            try:
+                self._buffer.put(entry, timeout=0.05)
+                return True
+            except Queue.Full:
+                pass
+        self._left.append(entry)
+        return False
+
+    def _fill(self):
+        try:
+            for item in self._source:
+                if not self._put(('item', item)):
+                    return
+        except Exception:
+            self._put(('error', sys.exc_info()))
+        else:
+            self._put(('end', None))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        kind, value = self._buffer.get()
+        if kind == 'item':
+            return value
+        # the following calls stop the iteration
+        self._buffer.put(('end', None))
+        if kind == 'error':
+            raise value[0], value[1], value[2]
+        raise StopIteration
+
+    def detach(self):
+        """ Stop reading ahead and return an iterator on the remaining
+        items """
+        self._closed = True
+        self._thread.join()
+        entries = []
+        while not self._buffer.empty():
+            entries.append(self._buffer.get_nowait())
+        entries += self._left
+
+        items = [value for kind, value in entries if kind == 'item']
+        ends = [(kind, value) for kind, value in entries if kind != 'item']
+        if not ends:
+            return itertools.chain(items, self._source)
+
+        def remaining():
+            for item in items:
+                yield item
+            kind, value = ends[0]
+            if kind == 'error':
+                raise value[0], value[1], value[2]
+        return remaining()
+
+
+class StreamEvaluation(GeneratorEvaluation):
+    """ Streaming evaluation of generator pipelines.
+
+    The dataflow is first evaluated as by GeneratorEvaluation. Then, while
+    a node asks for a reevaluation (e.g. IterNode), only these nodes and
+    the nodes downstream of them are evaluated again for each item: the
+    nodes upstream of the generators are not visited anymore, hence the
+    cost of an item is proportional to the size of the downstream subgraph.
+
+    The items are pulled by the pipeline, a generator produces the next
+    one once the previous one is processed. With prefetch > 0, the
+    iterators of the IterNode are read ahead in a thread, in a buffer of
+    prefetch items.
+    """
+    __evaluators__.append("StreamEvaluation")
+
+    # size of the read ahead buffer of the iterators (0 for no thread)
+    prefetch = 0
+
+    def __init__(self, dataflow, prefetch=-1):
+        """
+        :param prefetch: size of the read ahead buffer (default is the
+            class attribute prefetch)
+        """
+        GeneratorEvaluation.__init__(self, dataflow)
+        if prefetch != -1:
+            self.prefetch = prefetch
+        # {vid: evaluation order} of the nodes reached from the leaf
+        self._order = {}
+        # nodes asking for a reevaluation
+        self._generators = set()
+        # nodes to evaluate for each item, sorted by evaluation order
+        self._schedule = None
+        self._prefetchers = []
+
+    def clear(self):
+        """ Clear evaluation variable """
+        GeneratorEvaluation.clear(self)
+        self._order.clear()
+        self._generators.clear()
+        self._schedule = None
+
+    def eval_vertex(self, vid):
+        """ Evaluate the vertex vid after the nodes it depends on """
+        self._evaluated.add(vid)
+
+        for pid in self.in_ports(vid):
+            for npid, nvid, nactor in self.get_parent_nodes(pid):
+                if not self.is_stopped(nvid, nactor):
+                    self.eval_vertex(nvid)
+
+        self._order[vid] = len(self._order)
+        self.set_vertex_inputs(vid)
+        self.eval_node(vid)
+
+    def eval_node(self, vid):
+        """ Evaluate the node vid and record if it is a generator """
+        ret = self.eval_vertex_code(vid)
+        if ret:
+            self.reeval = ret
+            if vid not in self._generators:
+                self._generators.add(vid)
+                self._schedule = None
+            if self.prefetch > 0:
+                self.prefetch_iterator(vid)
+
+    def prefetch_iterator(self, vid):
+        """ Read ahead the iterator of the node vid (see IterNode) """
+        actor = self._dataflow.actor(vid)
+        iterator = getattr(actor, 'iterable', None)
+        if (hasattr(iterator, 'next') and
+                not isinstance(iterator, PrefetchIterator)):
+            prefetcher = PrefetchIterator(iterator, self.prefetch)
+            actor.iterable = prefetcher
+            self._prefetchers.append((actor, prefetcher))
+
+    def release_prefetchers(self):
+        """ Stop the threads of the iterators which are not exhausted """
+        for actor, prefetcher in self._prefetchers:
+            if actor.iterable is prefetcher:
+                actor.iterable = prefetcher.detach()
+        del self._prefetchers[:]
+
+    def schedule(self):
+        """ Return the generators and the nodes downstream of them reached
+        from the leaf, sorted by evaluation order """
+        if self._schedule is not None:
+            return self._schedule
+        df = self._dataflow
+        order = self._order
+        nodes = set(self._generators)
+        stack = list(nodes)
+        while stack:
+            for nvid in df.out_neighbors(stack.pop()):
+                if nvid in order and nvid not in nodes:
+                    nodes.add(nvid)
+                    stack.append(nvid)
+        self._schedule = sorted(nodes, key=order.get)
+        return self._schedule
+
+    def stream(self, vid):
+        """ Evaluate vid, then push the items of the generators through the
+        nodes downstream of them """
+        self.clear()
+        self.eval_vertex(vid)
+        df = self._dataflow
+        while self.reeval:
+            self.reeval = False
+            for nvid in self.schedule():
+                if df.actor(nvid).block:
+                    continue
+                self.set_vertex_inputs(nvid)
+                self.eval_node(nvid)
+
+    def eval(self, vtx_id=None, step=False):
+        t0 = clock() if quantify else 0
+
+        df = self._dataflow
+
+        if (vtx_id is not None):
+            leafs = [(vtx_id, df.actor(vtx_id))]
+        else:
+            # Select the leafs (list of (vid, actor))
+            leafs = [(vid, df.actor(vid)) for vid in self.get_plan().leaves()]
+
+        leafs.sort(cmp_priority)
+
+        try:
+            for vid, actor in leafs:
+                if not self.is_stopped(vid, actor):
+                    self.stream(vid)
+        finally:
+            self.release_prefetchers()
+            self.clear()
+
+        if quantify:
+            t1 = clock()
+            print "Evaluation time: %s"%(t1-t0)
+        return False
+
 
 class LambdaEvaluation(PriorityEvaluation):
     """ Evaluation algorithm with support of lambda / priority and selection"""
@@ -510,7 +759,7 @@ class LambdaEvaluation(PriorityEvaluation):
         use_lambda = False
 
         # For each inputs
-        for pid in df.in_ports(vid):
+        for pid in self.in_ports(vid):
 
             input_index = df.local_id(pid)
             inputs = []
@@ -596,10 +845,10 @@ class LambdaEvaluation(PriorityEvaluation):
         :param vtx_id: vertex id to start the evaluation
         :param context: list a value to assign to lambda variables
         """
-        t0 = clock()
+        t0 = clock() if quantify else 0
         if PROVENANCE and (not is_subdataflow):
-            self.provenance.workflow_exec()
-            self.provenance.start_time()
+            self.get_provenance().workflow_exec()
+            self.get_provenance().start_time()
 
         self.lambda_value.clear()
 
@@ -611,11 +860,11 @@ class LambdaEvaluation(PriorityEvaluation):
         PriorityEvaluation.eval(self, vtx_id, context, self.lambda_value, is_subdataflow=is_subdataflow)
         self.lambda_value.clear() # do not keep context in memory
         
-        if PROVENANCE:
-            self.provenance.end_time()
+        if PROVENANCE and (not is_subdataflow):
+            self.get_provenance().end_time()
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
 
         if not is_subdataflow:
@@ -784,73 +1033,259 @@ DefaultEvaluation = LambdaEvaluation
 
 
 
-# from openalea.core.threadmanager import ThreadManager
-# import thread
+class ParallelEvaluation(PriorityEvaluation):
+    """ Evaluate independent nodes of the dataflow concurrently.
 
-# class ParallelEvaluation(LambdaEvaluation):
-#     """ Parallel execution of a dataflow """
+    The upstream closure of the vertices to evaluate is first scanned to
+    compute the dependencies of each node. Nodes whose parents have all
+    been evaluated are put in a ready queue (sorted by priority) and
+    dispatched to an executor (see openalea.core.executor). Inputs are set
+    and results are collected in the calling thread.
 
+    With the 'process' executor, the nodes declared as pure by their
+    factory are computed in worker processes.
 
-#     def get_output_value(self, nvid, nactor, npid):
-#             """ Return the value of a node output """
+    Block, lazy and priority semantics are the ones of PriorityEvaluation.
+    Lambda (SubDataflow) resolution is not supported by this algorithm.
+    """
+    __evaluators__.append("ParallelEvaluation")
+
+    # Number of workers used to evaluate the nodes.
+    # None means one worker per available cpu.
+    nb_workers = None
+    # Name of the executor: 'thread' or 'process'
+    executor = 'thread'
+
+    def __init__(self, dataflow, nb_workers=None, executor=None):
+        PriorityEvaluation.__init__(self, dataflow)
+        if nb_workers is not None:
+            self.nb_workers = nb_workers
+        if executor is not None:
+            self.executor = executor
+        self._executor = None
+        # quiet mode of the calling thread, set in the workers
+        self._quiet = False
+
+    def get_nb_workers(self):
+        """ Return the number of workers used to evaluate the dataflow """
+        if self.nb_workers:
+            return self.nb_workers
+        try:
+            return cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def scan_vertex(self, vid, parents, done):
+        """ Compute the dependencies of vid and of all its ancestors.
+
+        Fill parents with a dict vid -> set of parent vids that have to be
+        evaluated before vid. Cycles are broken like the recursive algorithms
+        do: a parent already being scanned is not considered as a dependency.
+        """
+        df = self._dataflow
+        deps = parents[vid] = set()
+
+        for pid in self.in_ports(vid):
+            for npid, nvid, nactor in self.get_parent_nodes(pid):
+                if self.is_stopped(nvid, nactor):
+                    continue
+                if nvid not in parents:
+                    self.scan_vertex(nvid, parents, done)
+                if nvid in done:
+                    deps.add(nvid)
 
-#             l = self.locks[nvid]
+        done.add(vid)
 
-#             l.acquire()
-#             v = nactor.get_output(self._dataflow.local_id(npid))
-#             l.release()
+    def eval_actor(self, actor):
+        if self._executor is None:
+            return actor.eval()
+        return self._executor.eval_node(actor)
 
-#             return v
+    def _eval_task(self, vid):
+        """ Worker function: evaluate vid and return (vid, exc_info).
 
+        All the exceptions are caught, so that a failing worker always
+        sends its result to the scheduler, which raises it again.
+        """
+        try:
+            if self._quiet:
+                with quiet_notifications():
+                    self.eval_vertex_code(vid)
+            else:
+                self.eval_vertex_code(vid)
+        except BaseException:
+            return vid, sys.exc_info()
+        return vid, None
 
-#     def eval_one_vertex (self, vid, context, lambda_value):
-#         """ Evaluate only one vertex
-#         @param vid: id of vertex to evalaute
-#         @param context: list of values to assign to variables
-#         @param lambda_value: dictionary of previous assigned values
-#         """
-#         LambdaEvaluation.eval_one_vertex(self, vid, context, lambda_value)
-#         self.locks[vid].release()
+    def eval_vertices(self, vids):
+        """ Evaluate the vertices vids and all their ancestors """
+        df = self._dataflow
 
+        parents = {}
+        done = set()
+        for vid in vids:
+            if vid not in parents:
+                self.scan_vertex(vid, parents, done)
+
+        # Compute in-degrees and children
+        children = dict((vid, []) for vid in parents)
+        in_degree = {}
+        for vid, deps in parents.iteritems():
+            in_degree[vid] = len(deps)
+            for nvid in deps:
+                children[nvid].append(vid)
+
+        def priority(vid):
+            return -df.actor(vid).internal_data.get('priority', 0)
+
+        ready = [(priority(vid), vid) for vid, d in in_degree.iteritems()
+                 if d == 0]
+        heapq.heapify(ready)
+
+        nb_workers = min(self.get_nb_workers(), len(parents))
+        self._quiet = not notifications_enabled()
+        if nb_workers > 1:
+            pool = executors[self.executor](nb_workers)
+        else:
+            pool = None
+        self._executor = pool
+        results = Queue.Queue()
+        running = 0
+        error = None
 
+        try:
+            while ready or running:
+                # Dispatch all the ready nodes
+                while ready and error is None:
+                    p, vid = heapq.heappop(ready)
+                    self._evaluated.add(vid)
+                    self.set_vertex_inputs(vid)
+                    if pool is None:
+                        results.put(self._eval_task(vid))
+                    else:
+                        pool.apply_async(self._eval_task, (vid, ),
+                                         callback=results.put)
+                    running += 1
 
-#     def eval_vertex (self, vid, context, *args):
-#         """ Evaluate the graph starting at the vertex vid
-#         @param vid: starting vertex id
-#         @param context list of values to assign to variables
-#         """
+                if not running:
+                    break
 
-#         lambda_value = {}
+                vid, exc = results.get()
+                running -= 1
 
-#         tm = ThreadManager()
-#         tm.clear()
+                if exc is not None:
+                    if error is None:
+                        error = exc
+                    continue
 
-#         # Get the node order
-#         process_list = self.scan_graph(vid, context)
+                for nvid in children[vid]:
+                    in_degree[nvid] -= 1
+                    if in_degree[nvid] == 0:
+                        heapq.heappush(ready, (priority(nvid), nvid))
+        finally:
+            self._executor = None
+            if pool is not None:
+                pool.close()
 
-#         # Synchronisation locks
-#         self.locks = {}
+        if error is not None:
+            raise error[0], error[1], error[2]
 
-#         for vid, context in process_list:
+    def eval_vertex(self, vid, *args):
+        """ Evaluate the vertex vid and its ancestors """
+        self.eval_vertices([vid])
 
-#             if (self.locks.has_key(vid)): continue
-#             l = thread.allocate_lock()
-#             l.acquire()
-#             self.locks[vid] = l
+    def eval(self, vtx_id=None, *args, **kwds):
+        """ Evaluate the dataflow from vtx_id or from the leaves """
+        t0 = clock() if quantify else 0
 
+        df = self._dataflow
+        self._evaluated.clear()
 
-#         # Eval each node
-#         scanned = set()
+        if vtx_id is not None:
+            self.eval_vertices([vtx_id])
+        else:
+            leaves = [(vid, df.actor(vid))
+                      for vid in self.get_plan().leaves()]
+            leaves.sort(cmp_priority)
+            self.eval_vertices([vid for vid, actor in leaves])
+
+        if quantify:
+            t1 = clock()
+            print "Evaluation time: %s"%(t1-t0)
 
-#         for vid, context in process_list:
-#             if (vid not in scanned):
-#                 tm.add_task( self.eval_one_vertex, (vid, context, lambda_value))
-#             scanned.add(vid)
 
+class IncrementalEvaluation(PriorityEvaluation):
+    """ Evaluate only the nodes which are dirty.
+
+    The dataflow keeps track of dirty vertices: modifying the inputs of a
+    node (or invalidating it) marks it and all the vertices downstream of
+    it as dirty (see DataFlow.mark_dirty). An evaluation visits only the
+    dirty ancestors of the evaluated vertices, in topological order, and
+    cleans them. Hence the cost of a reevaluation is proportional to what
+    actually changed, not to the size of the graph.
+    """
+    __evaluators__.append("IncrementalEvaluation")
+
+    def dirty_schedule(self, vids):
+        """ Return the dirty ancestors of vids (and vids) sorted in
+        topological order.
+        """
+        df = self._dataflow
+        dirty = df.dirty_vertices()
+        order = []
+        visited = set()
+
+        def visit(vid):
+            visited.add(vid)
+            for nvid in df.in_neighbors(vid):
+                if (nvid in dirty and nvid not in visited and
+                        not self.is_stopped(nvid, df.actor(nvid))):
+                    visit(nvid)
+            order.append(vid)
+
+        for vid in vids:
+            if vid not in visited:
+                visit(vid)
+        return order
+
+    def eval_vertices(self, vids):
+        """ Evaluate the dirty ancestors of vids and vids """
+        df = self._dataflow
+        dirty = df.dirty_vertices()
+
+        for vid in self.dirty_schedule(vids):
+            self._evaluated.add(vid)
+            self.set_vertex_inputs(vid)
+            self.eval_vertex_code(vid)
+
+            # A vertex stays dirty while one of its parents is (e.g. blocked)
+            if not any(nvid in dirty for nvid in df.in_neighbors(vid)):
+                df.clean(vid)
+
+    def eval_vertex(self, vid, *args):
+        """ Evaluate the vertex vid and its dirty ancestors """
+        self.eval_vertices([vid])
+
+    def eval(self, vtx_id=None, *args, **kwds):
+        """ Evaluate vtx_id or all the dirty leaves of the dataflow """
+        t0 = clock() if quantify else 0
+
+        df = self._dataflow
+        self._evaluated.clear()
+
+        if vtx_id is not None:
+            self.eval_vertices([vtx_id])
+        else:
+            leaves = [(vid, df.actor(vid)) for vid in df.dirty_vertices()
+                      if df.nb_out_edges(vid) == 0]
+            leaves.sort(cmp_priority)
+            self.eval_vertices([vid for vid, actor in leaves])
+
+        if quantify:
+            t1 = clock()
+            print "Evaluation time: %s"%(t1-t0)
 
 
-# DefaultEvaluation = ParallelEvaluation
-# #DefaultEvaluation = LambdaEvaluation
 class ToScriptEvaluation(AbstractEvaluation):
     """ Basic transformation into script algorithm """
     __evaluators__.append("ToScriptEvaluation")
@@ -875,7 +1310,7 @@ class ToScriptEvaluation(AbstractEvaluation):
 
         script = ""
         # For each inputs
-        for pid in df.in_ports(vid):
+        for pid in self.in_ports(vid):
             # For each connected node
             for npid, nvid, nactor in self.get_parent_nodes(pid):
                 if not self.is_stopped(nvid, nactor):
@@ -907,24 +1342,41 @@ class ToScriptEvaluation(AbstractEvaluation):
 # The objective is to take
 
 class DiscreteTimeEvaluation(AbstractEvaluation):
-    """ Evaluation algorithm with generator / priority and selection"""
-    __evaluators__.append("DiscreteTimeEvaluation")
+    """ Discrete event simulation of a dataflow.
 
-    def __init__(self, dataflow):
+    The dataflow is first evaluated from its leaves. Then, when a node
+    returns a delay d at time t (e.g. Delay, IterWithDelayNode), an event
+    is scheduled at time t + d: only the nodes whose events occur and the
+    nodes downstream of them are evaluated again, and the time jumps from
+    one event to the next one.
 
+    The simulation stops when there are no more events, when a node whose
+    event occurs returns no delay, or after the horizon.
+    """
+    __evaluators__.append("DiscreteTimeEvaluation")
+
+    def __init__(self, dataflow, horizon=None):
+        """
+        :param horizon: time of the last events, default is the horizon of
+            the composite node (see CompositeNodeFactory), None for no limit
+        """
         AbstractEvaluation.__init__(self, dataflow)
+        if horizon is None:
+            horizon = getattr(dataflow, 'horizon', None)
+        # time after which the simulation is stopped (None for no limit)
+        self.horizon = horizon
         # a property to specify if the node has already been evaluated
         self._evaluated = set()
-        self.reeval = False # Flag to force reevaluation (for generator)
-
-        # CPL
-        # At each evaluation of the dataflow, increase the current cycle of
-        # one unit.
 
         self._current_cycle = 0
-        # timed nodes are a dict with vid, time >0
-        # when time is 0, remove the node from the dict
-        self._timed_nodes = dict()
+        # scheduled events: heap of (time, evaluation order, vid)
+        self._events = []
+        # {vid: time of its next event}
+        self._timed_nodes = {}
+        # {vid: evaluation order} of the nodes reached from the leaves
+        self._order = {}
+        # {vid: nodes downstream of vid, sorted by evaluation order}
+        self._downstream = {}
         self._stop = False
         self._nodes_to_reset = []
 
@@ -941,120 +1393,148 @@ class DiscreteTimeEvaluation(AbstractEvaluation):
         return stopped
 
     def clear(self):
-        """ Clear evaluation variable """
+        """ Clear the scheduler """
         self._evaluated.clear()
-        self.reeval = False
+        self._current_cycle = 0
+        del self._events[:]
+        self._timed_nodes.clear()
+        self._order.clear()
+        self._downstream.clear()
         self._stop = False
         self._nodes_to_reset = []
 
-    def next_step(self):
-        """ Update the scheduler of one step. """
-        self._current_cycle += 1
-        for vid in self._timed_nodes:
-            self._timed_nodes[vid] -= 1
+    def schedule(self, vid, delay):
+        """ Schedule an evaluation of vid after delay """
+        time = self._current_cycle + int(delay)
+        self._timed_nodes[vid] = time
+        heapq.heappush(self._events, (time, self._order.get(vid, 0), vid))
 
     def eval_vertex(self, vid):
-        """ Evaluate the vertex vid """
-
-        #print "Step ", self._current_cycle
-
+        """ Evaluate the vertex vid after the nodes it depends on """
         df = self._dataflow
-        actor = df.actor(vid)
 
         self._evaluated.add(vid)
 
         # For each inputs
-        # Compute the inputs of the node
-        for pid in df.in_ports(vid):
-            inputs = []
-
-            cpt = 0
+        for pid in self.in_ports(vid):
             # For each connected node
             for npid, nvid, nactor in self.get_parent_nodes(pid):
                 # Do no reevaluate the same node
                 if not self.is_stopped(nvid, nactor):
                     self.eval_vertex(nvid)
 
-                inputs.append(nactor.get_output(df.local_id(npid)))
-                cpt += 1
+        self._order[vid] = len(self._order)
+        self.set_vertex_inputs(vid)
+        self.eval_node(vid, False)
 
-            # set input as a list or a simple value
-            if (cpt == 1):
-                inputs = inputs[0]
-            if (cpt > 0):
-                actor.set_input(df.local_id(pid), inputs)
+    def eval_node(self, vid, expired):
+        """ Evaluate the node vid and schedule its next evaluation
 
-        # Eval the node
-        delay = 0
-        # When a node return no delay, we stopped the simulation
-        stop_when_finished = False
+        :param expired: True if vid is evaluated because its delay expired
+        """
+        delay = self.eval_vertex_code(vid)
+        if delay:
+            self.schedule(vid, delay)
+        elif expired:
+            # When a node return no delay, we stopped the simulation
+            self._stop = True
+            self._nodes_to_reset.append(vid)
 
-        if vid in self._timed_nodes:
-            delay = self._timed_nodes[vid]
-            if delay == 0:
-                del self._timed_nodes[vid]
-                stop_when_finished = True
+    def downstream(self, vid):
+        """ Return the nodes reached from the leaves which depend on vid,
+        sorted by evaluation order """
+        try:
+            return self._downstream[vid]
+        except KeyError:
+            pass
+        df = self._dataflow
+        order = self._order
+        nodes = set([vid])
+        stack = [vid]
+        while stack:
+            for nvid in df.out_neighbors(stack.pop()):
+                if nvid in order and nvid not in nodes:
+                    nodes.add(nvid)
+                    stack.append(nvid)
+        nodes = self._downstream[vid] = sorted(nodes, key=order.get)
+        return nodes
+
+    def next_step(self):
+        """ Process the events of the next time.
+        Return False if there is no more event before the horizon. """
+        events = self._events
+        while events and self._timed_nodes.get(events[0][2]) != events[0][0]:
+            heapq.heappop(events)  # evaluation rescheduled
+        if not events:
+            return False
+        time = events[0][0]
+        if self.horizon is not None and time > self.horizon:
+            self._stop = True
+            return False
 
-        if delay == 0:
-            delay = self.eval_vertex_code(vid)
+        self._current_cycle = time
+        expired = set()
+        while events and events[0][0] == time:
+            t, order, vid = heapq.heappop(events)
+            if self._timed_nodes.get(vid) == time:
+                del self._timed_nodes[vid]
+                expired.add(vid)
 
+        nodes = set()
+        for vid in expired:
+            nodes.update(self.downstream(vid))
 
-        # Reevaluation flag
-        # TODO: Add the node to the scheduler rather to execute
-        if (delay):
-            self._timed_nodes[vid] = int(delay)
-            self.reeval = delay
-        elif stop_when_finished:
-            self._stop = True
-            self._nodes_to_reset.append(vid)
-        elif self._current_cycle > 1000:
-            self._stop = True
+        df = self._dataflow
+        for vid in sorted(nodes, key=self._order.get):
+            # nodes waiting for their own delay are not evaluated
+            if vid in self._timed_nodes or df.actor(vid).block:
+                continue
+            self.set_vertex_inputs(vid)
+            self.eval_node(vid, vid in expired)
+        return True
 
     def eval(self, vtx_id=None, step=False):
-        t0 = clock()
+        """ Run the simulation.
 
-        self.clear()
+        :param step: process only the first evaluation or the events of the
+            next time, and keep the scheduler for the next call.
+        """
+        t0 = clock() if quantify else 0
 
         df = self._dataflow
 
-        if (vtx_id is not None):
-            leafs = [(vtx_id, df.actor(vtx_id))]
-
+        if step and self._events and not self._stop:
+            self.next_step()
         else:
-            # Select the leafs (list of (vid, actor))
-            leafs = [(vid, df.actor(vid))
-                for vid in df.vertices() if df.nb_out_edges(vid)==0]
+            self.clear()
+            if (vtx_id is not None):
+                leafs = [(vtx_id, df.actor(vtx_id))]
+            else:
+                # Select the leafs (list of (vid, actor))
+                leafs = [(vid, df.actor(vid))
+                         for vid in self.get_plan().leaves()]
 
-        leafs.sort(cmp_priority)
+            leafs.sort(cmp_priority)
 
-        # Execute
-        for vid, actor in leafs:
-            if not self.is_stopped(vid, actor):
-                self.reeval = True
-                if not step:
-                    while(self.reeval and not self._stop):
-                        self.clear()
-                        self.eval_vertex(vid)
-                        self.next_step()
-                elif (self.reeval and not self._stop):
-                    self.clear()
+            for vid, actor in leafs:
+                if not self.is_stopped(vid, actor):
                     self.eval_vertex(vid)
-                    self.next_step()
+
+            if not step:
+                while not self._stop and self.next_step():
+                    pass
 
         if self._stop:
             self._nodes_to_reset.extend(self._timed_nodes)
             for vid in self._nodes_to_reset:
                 df.actor(vid).reset()
 
-        #print 'Run %d times the dataflow'%(self._current_cycle,)
-
         # Reset the state
-        if not step:
+        if not step or self._stop:
             self.clear()
-            self._current_cycle = 0
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
 
         return False
@@ -1129,7 +1609,7 @@ class SciFlowareEvaluation(AbstractEvaluation):
 
         # For each inputs
         # Compute the nodes
-        for pid in df.in_ports(vid):
+        for pid in self.in_ports(vid):
             inputs = []
 
             is_dataflow = False
@@ -1170,7 +1650,7 @@ class SciFlowareEvaluation(AbstractEvaluation):
 
 
     def eval(self, vtx_id=None, **kwds):
-        t0 = clock()
+        t0 = clock() if quantify else 0
 
         df = self._dataflow
         self.scifloware_actors()
@@ -1188,8 +1668,8 @@ class SciFlowareEvaluation(AbstractEvaluation):
         for vid, actor in leafs:
             self.eval_vertex(vid)
 
-        t1 = clock()
         if quantify:
+            t1 = clock()
             print "Evaluation time: %s"%(t1-t0)
 
         return False
@@ -0,0 +1,411 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module maps a node (typically a CompositeNode) over many input records.
+
+Each worker owns its own instance of the node, which is reused for all the
+records it evaluates, unless the workers share a composite node and only
+own the DataflowState of the record they evaluate. Results are yielded as
+soon as they are available and a failing record does not abort the batch::
+
+    for res in map_node(node, [dict(x=1), dict(x=2)], workers=2):
+        if res.error is None:
+            print res.index, res.outputs
+
+The workers are threads by default: because of the GIL, only the nodes
+which release it (e.g. numpy or C extensions) run in parallel. With
+executor='process', each worker is a process with its own unpickled copy
+of the node, hence pure python graphs use several cores too, provided the
+node, the records and the outputs can be pickled.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import ast
+import csv
+import copy
+import cPickle
+import sys
+import threading
+import traceback
+import Queue
+from cStringIO import StringIO
+from multiprocessing import Pool
+
+from openalea.core.observer import quiet_notifications
+
+
+class BatchResult(object):
+    """ Result of the evaluation of one record """
+
+    def __init__(self, index, inputs, outputs=None, error=None, tb=None):
+        """
+        :param index: position of the record in the input iterable
+        :param inputs: the record
+        :param outputs: list of node outputs, None on failure
+        :param error: the exception raised by the evaluation, if any
+        :param tb: formatted traceback of error
+        """
+        self.index = index
+        self.inputs = inputs
+        self.outputs = outputs
+        self.error = error
+        self.traceback = tb
+
+    def __repr__(self):
+        if self.error is not None:
+            return "BatchResult(%d, error=%r)" % (self.index, self.error)
+        return "BatchResult(%d, %r)" % (self.index, self.outputs)
+
+
+def clone_node(node):
+    """ Return a new instance of node to be used by another worker
+
+    The node is deep copied to keep its modifications since it has been
+    instantiated, it is instantiated again from its factory if the copy
+    fails.
+    """
+    # factories are shared, not copied
+    nodes = [node]
+    if hasattr(node, 'vertices'):
+        nodes.extend(node.actor(vid) for vid in node.vertices())
+    memo = {}
+    for n in nodes:
+        factory = getattr(n, 'factory', None)
+        if factory is not None:
+            memo[id(factory)] = factory
+
+    try:
+        new = copy.deepcopy(node, memo)
+    except Exception:
+        factory = getattr(node, 'factory', None)
+        if factory is None:
+            raise
+        return factory.instantiate()
+
+    # weak references to the composite node are shared by deepcopy
+    if hasattr(new, 'vertices'):
+        for vid in new.vertices():
+            new.actor(vid).set_compositenode(new)
+    return new
+
+
+def eval_record(node, index, record, defaults=()):
+    """ Set record as node inputs, evaluate node and return a BatchResult.
+
+    :param record: a dict {input name or index: value} or a sequence of
+        values for the first inputs.
+    :param defaults: values restored on the inputs before setting record,
+        so that a record does not see the inputs of the previous one.
+    """
+    try:
+        for i, value in enumerate(defaults):
+            node.set_input(i, value)
+        if hasattr(record, 'iteritems'):
+            items = record.iteritems()
+        else:
+            items = enumerate(record)
+        for key, value in items:
+            node.set_input(key, value)
+
+        node.eval()
+        outputs = [node.output(i) for i in range(node.get_nb_output())]
+    except Exception, e:
+        return BatchResult(index, record, error=e,
+                           tb=traceback.format_exc())
+
+    return BatchResult(index, record, outputs)
+
+
+def eval_state(algo, index, record):
+    """ Evaluate a composite node for record in a new state and return
+    a BatchResult.
+
+    :param algo: a CompositeEvaluation of the composite node.
+    :param record: see eval_record.
+    """
+    try:
+        state = algo.new_state(record)
+        algo.eval(None, state)
+        outputs = algo.get_outputs(state)
+    except Exception, e:
+        return BatchResult(index, record, error=e,
+                           tb=traceback.format_exc())
+
+    return BatchResult(index, record, outputs)
+
+
+def dumps_node(node):
+    """ Pickle node to be evaluated in another process.
+
+    The factories and the composite node containing node are not sent (see
+    executor.dumps_call), they are replaced by None.
+    """
+    nodes = [node]
+    if hasattr(node, 'vertices'):
+        nodes.extend(node.actor(vid) for vid in node.vertices())
+    excluded = set(id(n.factory) for n in nodes
+                   if getattr(n, 'factory', None) is not None)
+    if getattr(node, '_composite_node', None) is not None:
+        excluded.add(id(node._composite_node))
+
+    def persistent_id(obj):
+        if id(obj) in excluded:
+            return 'excluded'
+        return None
+
+    f = StringIO()
+    pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(node)
+    return f.getvalue()
+
+
+def loads_node(data):
+    """ Return the node pickled by dumps_node """
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = lambda pid: None
+    return unpickler.load()
+
+
+# (node, input defaults, quiet) of a worker process
+_process_state = None
+# (error, traceback) if the node can not be loaded in the worker process
+_process_error = None
+
+
+def _init_process(data, defaults, quiet):
+    """ Initializer of the worker processes.
+
+    It does not raise: the pool would start the failing workers again and
+    again, the error is returned for each record by _process_record.
+    """
+    global _process_state, _process_error
+    try:
+        _process_state = loads_node(data), defaults, quiet
+    except Exception, e:
+        _process_error = e, traceback.format_exc()
+
+
+def _process_record(index, record):
+    """ Evaluate a record in a worker process, return the pickled
+    BatchResult.
+
+    An error which can not be pickled is replaced by the exception it
+    wraps (see EvaluationException) or by a RuntimeError.
+    """
+    if _process_error is not None:
+        error, tb = _process_error
+        res = BatchResult(index, record, error=error, tb=tb)
+    else:
+        node, defaults, quiet = _process_state
+        if quiet:
+            with quiet_notifications():
+                res = eval_record(node, index, record, defaults)
+        else:
+            res = eval_record(node, index, record, defaults)
+    if res.error is not None:
+        error = getattr(res.error, 'exception', res.error)
+        try:
+            cPickle.loads(cPickle.dumps(error, cPickle.HIGHEST_PROTOCOL))
+        except Exception:
+            error = RuntimeError(repr(error))
+        res.error = error
+    try:
+        return cPickle.dumps(res, cPickle.HIGHEST_PROTOCOL)
+    except Exception, e:
+        res = BatchResult(index, record, error=RuntimeError(repr(e)),
+                          tb=traceback.format_exc())
+        return cPickle.dumps(res, cPickle.HIGHEST_PROTOCOL)
+
+
+def map_node(node, records, workers=1, ordered=False, instantiate=None,
+             shared=False, executor='thread', quiet=False):
+    """ Evaluate node for each record and yield BatchResult instances.
+
+    :param node: the node used by the first worker.
+    :param records: iterable of records (see eval_record), consumed lazily.
+    :param workers: number of threads, each one with its own node instance.
+    :param ordered: if True, results are yielded in the order of records,
+        else as soon as they are available.
+    :param instantiate: function returning a new node for the other
+        workers, default is clone_node(node).
+    :param shared: if True, node must be a composite node. It is not
+        modified nor copied: each record is evaluated with its own
+        DataflowState (see dataflow_evaluation.CompositeEvaluation).
+    :param executor: 'thread' or 'process'. The threads only evaluate in
+        parallel the nodes which release the GIL. The processes evaluate
+        their own copy of node (shared and instantiate are not used),
+        node, records and outputs must be picklable. If the node can not
+        be loaded in a worker, the error is returned for each record.
+    :param quiet: if True, the records are evaluated without the
+        evaluation events (see observer.quiet_notifications).
+    """
+    if executor not in ('thread', 'process'):
+        raise ValueError("Unknown executor %r" % (executor, ))
+    if executor == 'process' and workers > 1:
+        for res in _map_processes(node, records, workers, ordered, quiet):
+            yield res
+        return
+
+    if shared:
+        from openalea.core.dataflow_evaluation import CompositeEvaluation
+        algo = CompositeEvaluation(node)
+        evaluate = lambda worker_node, index, record: \
+            eval_state(algo, index, record)
+        instantiate = lambda: node
+    else:
+        defaults = [node.get_input(i) for i in range(node.get_nb_input())]
+        evaluate = lambda worker_node, index, record: \
+            eval_record(worker_node, index, record, defaults)
+
+    if quiet:
+        # the quiet mode is set in each worker thread
+        evaluate_loud = evaluate
+
+        def evaluate(worker_node, index, record):
+            with quiet_notifications():
+                return evaluate_loud(worker_node, index, record)
+
+    if workers <= 1:
+        for index, record in enumerate(records):
+            yield evaluate(node, index, record)
+        return
+
+    if instantiate is None:
+        instantiate = lambda: clone_node(node)
+
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+
+    def work(worker_node):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, record = task
+            results.put(evaluate(worker_node, index, record))
+
+    threads = []
+    for i in range(workers):
+        worker_node = node if i == 0 else instantiate()
+        thread = threading.Thread(target=work, args=(worker_node, ))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    def stop():
+        for thread in threads:
+            tasks.put(None)
+        for thread in threads:
+            thread.join()
+
+    for res in _collect(records, workers, ordered, tasks.put, results, stop):
+        yield res
+
+
+def _map_processes(node, records, workers, ordered, quiet):
+    """ map_node with a pool of worker processes """
+    defaults = [node.get_input(i) for i in range(node.get_nb_input())]
+    data = dumps_node(node)
+    # raise now if the node can not be loaded, rather than in each worker
+    loads_node(data)
+    pool = Pool(workers, _init_process, (data, defaults, quiet))
+    results = Queue.Queue()
+
+    def submit(task):
+        pool.apply_async(_process_record, task,
+                         callback=lambda data: results.put(cPickle.loads(data)))
+
+    def stop():
+        pool.close()
+        pool.join()
+
+    return _collect(records, workers, ordered, submit, results, stop)
+
+
+def _collect(records, workers, ordered, submit, results, stop):
+    """ Submit the (index, record) tasks and yield the BatchResult put
+    in the results queue, stop the workers at the end """
+    pending = {}
+    next_index = [0]
+
+    def flush(res):
+        """ return the results which can be delivered """
+        if not ordered:
+            return [res]
+        pending[res.index] = res
+        ready = []
+        while next_index[0] in pending:
+            ready.append(pending.pop(next_index[0]))
+            next_index[0] += 1
+        return ready
+
+    # keep a bounded number of records in flight
+    max_in_flight = 2 * workers
+    in_flight = 0
+    try:
+        for task in enumerate(records):
+            submit(task)
+            in_flight += 1
+            while in_flight >= max_in_flight:
+                in_flight -= 1
+                for res in flush(results.get()):
+                    yield res
+
+        while in_flight > 0:
+            in_flight -= 1
+            for res in flush(results.get()):
+                yield res
+    finally:
+        stop()
+
+
+def _parse_value(value):
+    """ Evaluate a csv field as a python literal (number, string, tuple,
+    list, dict...), keep it as a string if it is not a literal """
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def read_csv(filename):
+    """ Yield a dict {input name: value} for each line of a csv file.
+
+    The first line gives the input names.
+    """
+    f = open(filename, 'rb')
+    try:
+        for row in csv.DictReader(f):
+            yield dict((k, _parse_value(v)) for k, v in row.iteritems())
+    finally:
+        f.close()
+
+
+def write_results(results, out=None, err=None):
+    """ Write results as csv lines 'index,output1,output2...' on out
+    and the errors on err. Return the number of failed records. """
+    out = out if out is not None else sys.stdout
+    err = err if err is not None else sys.stderr
+    writer = csv.writer(out)
+    nb_errors = 0
+    for res in results:
+        if res.error is None:
+            writer.writerow([res.index] + list(res.outputs))
+        else:
+            nb_errors += 1
+            err.write("Record %d failed: %s\n" % (res.index, res.error))
+        out.flush()
+    return nb_errors
@@ -0,0 +1,297 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module provides a content addressed cache for node outputs.
+
+The outputs of pure nodes (see NodeFactory `pure` flag) are stored
+with a key computed from the factory id, the factory version and a stable
+hash of the node inputs. The cache has an in-memory LRU tier and an
+on-disk tier (in the openalea home directory) limited in size, so that
+results survive the reinstantiation of a graph and the end of the process.
+
+Both tiers store the pickled outputs: each hit returns a new copy, which
+the nodes can modify in place, and the outputs which can not be pickled
+are not cached.
+
+The cache is disabled by default::
+
+    from openalea.core.cache import enable_output_cache
+    enable_output_cache()
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import cPickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+from openalea.core.path import path
+from openalea.core import settings
+
+
+class UncachableError(Exception):
+    """ Raised when a value can not be hashed in a stable way """
+    pass
+
+
+def _update_hash(h, obj):
+    """ Feed the hash h with a stable representation of obj """
+    if obj is None or isinstance(obj, (bool, int, long, float, complex,
+                                       str, unicode)):
+        h.update('%s:%r;' % (type(obj).__name__, obj))
+    elif isinstance(obj, (tuple, list)):
+        h.update('%s:%d(' % (type(obj).__name__, len(obj)))
+        for item in obj:
+            _update_hash(h, item)
+        h.update(')')
+    elif isinstance(obj, dict):
+        items = sorted((stable_hash(k), stable_hash(v))
+                       for k, v in obj.iteritems())
+        h.update('dict:%d(%s)' % (len(items), items))
+    elif isinstance(obj, (set, frozenset)):
+        items = sorted(stable_hash(item) for item in obj)
+        h.update('%s:%d(%s)' % (type(obj).__name__, len(items), items))
+    elif hasattr(obj, 'dtype') and hasattr(obj, 'shape') and \
+            hasattr(obj, 'tostring'):
+        # numpy arrays
+        h.update('array:%s:%s:' % (obj.dtype.str, obj.shape))
+        h.update(obj.tostring())
+    else:
+        try:
+            data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+        except Exception, e:
+            raise UncachableError(str(e))
+        h.update('pickle:%s:' % type(obj).__name__)
+        h.update(data)
+
+
+def stable_hash(obj):
+    """ Return an hexadecimal digest of obj which does not depend
+    on the process (unlike hash)
+
+    Raise UncachableError if obj can not be hashed.
+    """
+    h = hashlib.sha1()
+    _update_hash(h, obj)
+    return h.hexdigest()
+
+
+def factory_key(factory):
+    """ Return a string identifying a factory and its version.
+
+    The version of a factory is the version of its package.
+    """
+    pkg = factory.package
+    if pkg is None:
+        pkg_id, version = None, None
+    else:
+        pkg_id = pkg.get_id()
+        version = pkg.metainfo.get('version', None)
+    return '%s:%s:%s' % (pkg_id, factory.get_id(), version)
+
+
+def get_cache_dir(name='cache'):
+    """ Return the default directory of the on-disk cache """
+    return path(settings.get_openalea_home_dir()) / name
+
+
+class OutputCache(object):
+    """ Two tiers (memory and disk) cache of node outputs """
+
+    def __init__(self, dirname=None, max_items=1000,
+                 max_disk_size=512 * 2 ** 20):
+        """
+        :param dirname: directory of the on-disk tier, default is
+            get_cache_dir(). If False, only the memory tier is used.
+        :param max_items: max number of outputs kept in memory.
+        :param max_disk_size: max size in bytes of the on-disk tier.
+        """
+        if dirname is None:
+            dirname = get_cache_dir()
+        self.dirname = path(dirname) if dirname else None
+        self.max_items = max_items
+        self.max_disk_size = max_disk_size
+
+        self._memory = OrderedDict()
+        self._disk_size = None
+        self._lock = threading.RLock()
+
+    def accept(self, node):
+        """ Return True if the outputs of node can be cached """
+        factory = getattr(node, 'factory', None)
+        return bool(getattr(factory, 'pure', False)) and not node.delay
+
+    def key(self, node, inputs):
+        """ Return the cache key of node for the given inputs
+        or None if the inputs can not be hashed.
+        """
+        try:
+            inputs_hash = stable_hash(list(inputs))
+        except UncachableError:
+            return None
+        return stable_hash((factory_key(node.factory), inputs_hash))
+
+    def get(self, key):
+        """ Return a copy of the value stored with key. Raise KeyError if
+        missing """
+        with self._lock:
+            try:
+                data = self._memory.pop(key)
+            except KeyError:
+                data = self._disk_get(key)
+            self._memory[key] = data
+        try:
+            return cPickle.loads(data)
+        except Exception:
+            raise KeyError(key)
+
+    def set(self, key, value):
+        """ Store a copy of value in both tiers, nothing is stored if value
+        can not be pickled """
+        try:
+            data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+        except Exception:
+            return
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = data
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+            self._disk_set(key, data)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._memory:
+                return True
+            return self.dirname is not None and self._filename(key).exists()
+
+    def clear(self):
+        """ Remove all values in both tiers """
+        with self._lock:
+            self._memory.clear()
+            if self.dirname is not None and self.dirname.exists():
+                for f in self.dirname.files('*.pkl'):
+                    f.remove()
+            self._disk_size = 0
+
+    def call(self, node, call):
+        """ Return call(node.inputs), reusing a previous result if any """
+        key = self.key(node, node.inputs)
+        if key is None:
+            return call(node.inputs)
+
+        try:
+            return self.get(key)
+        except KeyError:
+            pass
+
+        value = call(node.inputs)
+        self.set(key, value)
+        return value
+
+    ################################################
+    # disk tier
+
+    def _filename(self, key):
+        return self.dirname / (key + '.pkl')
+
+    def _disk_get(self, key):
+        if self.dirname is None:
+            raise KeyError(key)
+        fname = self._filename(key)
+        try:
+            f = open(fname, 'rb')
+        except IOError:
+            raise KeyError(key)
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        # mark as recently used
+        os.utime(fname, None)
+        return data
+
+    def _disk_set(self, key, data):
+        if self.dirname is None:
+            return
+        if len(data) > self.max_disk_size:
+            return
+
+        if not self.dirname.exists():
+            self.dirname.makedirs()
+
+        fname = self._filename(key)
+        previous = fname.getsize() if fname.exists() else 0
+        tmp = fname + '.tmp'
+        f = open(tmp, 'wb')
+        f.write(data)
+        f.close()
+        os.rename(tmp, fname)
+
+        self._disk_size = self.disk_size() - previous + len(data)
+        if self._disk_size > self.max_disk_size:
+            self._evict(fname)
+
+    def disk_size(self):
+        """ Return the size in bytes of the on-disk tier """
+        if self._disk_size is None:
+            if self.dirname is None or not self.dirname.exists():
+                self._disk_size = 0
+            else:
+                self._disk_size = sum(f.getsize()
+                                      for f in self.dirname.files('*.pkl'))
+        return self._disk_size
+
+    def _evict(self, keep):
+        """ Remove least recently used files until the disk tier fits in
+        max_disk_size. """
+        files = sorted((f.getmtime(), f) for f in self.dirname.files('*.pkl')
+                       if f != keep)
+        for mtime, f in files:
+            if self._disk_size <= self.max_disk_size:
+                break
+            size = f.getsize()
+            try:
+                f.remove()
+            except OSError:
+                continue
+            self._disk_size -= size
+
+
+_output_cache = None
+
+
+def get_output_cache():
+    """ Return the output cache used by the nodes, None if disabled """
+    return _output_cache
+
+
+def enable_output_cache(cache=None):
+    """ Enable the cache of node outputs.
+
+    :param cache: an OutputCache instance, default one is created if None
+    """
+    global _output_cache
+    if cache is None:
+        cache = OutputCache()
+    _output_cache = cache
+    return cache
+
+
+def disable_output_cache():
+    """ Disable the cache of node outputs """
+    global _output_cache
+    _output_cache = None
@@ -0,0 +1,361 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""Compilation of composite nodes into Python functions.
+
+The dataflow of a composite node is translated into the source of a
+function which calls the functions of the nodes in the evaluation order and
+passes the values between them in local variables: no Node, port list,
+set_input comparison or notification is involved::
+
+    func = compile_composite(factory)   # or factory.compile()
+    outputs = func(1, y=2)              # tuple of the composite outputs
+    print func.source
+
+The arguments which are not given, and the inputs of the nodes which are
+not connected, take the values of the composite node and of its nodes at
+the time of the call.
+
+Only the FuncNode (nodes wrapping a function) and the nested composite
+nodes are compiled. The other nodes are evaluated in place by their own
+eval, and the composite nodes whose evaluation can not be reproduced
+(lambda variables, blocked nodes, cycles, specific evaluation algorithms)
+are evaluated as a whole.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import re
+import linecache
+import itertools
+import weakref
+
+from openalea.core.node import FuncNode
+from openalea.core.compositenode import CompositeNode, CompositeNodeFactory
+from openalea.core.algo.dataflow_evaluation import ExecutionPlan
+
+# evaluation algorithms reproduced by the compiled functions
+COMPILED_ALGOS = ('BrutEvaluation', 'PriorityEvaluation', 'LambdaEvaluation')
+
+# outputs which are not unpacked by Node.eval
+_scalars = frozenset([type(None), bool, int, long, float, complex,
+                      str, unicode])
+
+_counter = itertools.count()
+
+# default value of the arguments of the compiled functions: the current
+# input of the composite node is used
+_unset = object()
+
+# {filename: weakref of the compiled function} of the sources kept in the
+# linecache, removed when the function is collected
+_sources = {}
+
+
+def _forget_source(filename):
+    _sources.pop(filename, None)
+    linecache.cache.pop(filename, None)
+
+
+class CompileError(Exception):
+    """ The dataflow can not be compiled """
+    pass
+
+
+def single_output(outlist):
+    """ Return the output of a node with one output whose __call__ returns
+    outlist, as Node.eval does """
+    try:
+        if hasattr(outlist, "__getitem__") and len(outlist) == 1:
+            return outlist[0]
+    except TypeError:
+        pass
+    return outlist
+
+
+def multiple_outputs(outlist, nb):
+    """ Return the nb outputs of a node whose __call__ returns outlist """
+    if not isinstance(outlist, (tuple, list)):
+        outlist = (outlist, )
+    outlist = tuple(outlist[:nb])
+    return outlist + (None, ) * (nb - len(outlist))
+
+
+def eval_node(node, inputs):
+    """ Evaluate node in place and return the tuple of its outputs
+
+    :param inputs: list of (input index, value) of the connected inputs
+    """
+    for index, value in inputs:
+        node.set_input(index, value)
+    node.eval()
+    return tuple(node.get_output(i) for i in range(node.get_nb_output()))
+
+
+def is_compiled(node):
+    """ Return True if the node function can be called directly """
+    return type(node) is FuncNode and callable(node.func)
+
+
+class CompiledComposite(object):
+    """ Function computing the outputs of a composite node.
+
+    :ivar func: the generated function (positional arguments only)
+    :ivar source: its source code
+    :ivar fallbacks: ids of the vertices evaluated by their node
+    :ivar reason: why the composite node is evaluated as a whole (None if
+        it is compiled)
+    """
+
+    def __init__(self, func, source, input_names, fallbacks=(), reason=None):
+        self.func = func
+        self.source = source
+        self.input_names = list(input_names)
+        self.fallbacks = list(fallbacks)
+        self.reason = reason
+
+    def __call__(self, *args, **kwds):
+        if kwds:
+            values = list(args)
+            values += self.func.func_defaults[len(values):]
+            for name, value in kwds.iteritems():
+                try:
+                    values[self.input_names.index(name)] = value
+                except ValueError:
+                    raise TypeError("unexpected input %r" % name)
+            args = values
+        return self.func(*args)
+
+    def is_compiled(self):
+        return self.reason is None
+
+
+class Compiler(object):
+    """ Generate the function of a composite node """
+
+    def __init__(self, composite):
+        self.composite = composite
+        self.plan = ExecutionPlan(composite)
+        self.namespace = dict(_single=single_output, _multi=multiple_outputs,
+                              _eval=eval_node, _scalars=_scalars,
+                              _unset=_unset)
+        self.fallbacks = []
+
+    def inputs(self):
+        """ Return the list of the names of the composite inputs """
+        cn = self.composite
+        if cn.id_in is None:
+            return []
+        return [desc['name'] for desc in cn.input_desc]
+
+    def check(self):
+        """ Raise CompileError if the evaluation of the composite node can
+        not be reproduced """
+        from openalea.core.system.systemnodes import LambdaVar
+
+        cn = self.composite
+        algo = type(cn.get_eval_algo()).__name__
+        if algo not in COMPILED_ALGOS:
+            raise CompileError("evaluated by %s" % algo)
+        for vid in cn.vertices():
+            node = cn.node(vid)
+            if isinstance(node, LambdaVar):
+                raise CompileError("lambda variable %d" % vid)
+            if node.block:
+                raise CompileError("blocked node %d" % vid)
+
+    def order(self):
+        """ Return the vertices to evaluate, in evaluation order """
+        cn = self.composite
+        if cn.id_out is not None and cn.get_nb_output() > 0:
+            leaves = [cn.id_out]
+        else:
+            leaves = self.plan.leaves()
+
+        plan = self.plan
+
+        def parents(vid):
+            for pid in plan.in_ports(vid):
+                for npid, nvid, nactor in plan.parent_nodes(pid):
+                    yield nvid
+
+        # depth first post order, as the evaluation from the leaves
+        order = []
+        visited = set()
+        for leaf in leaves:
+            if leaf in visited:
+                continue
+            visited.add(leaf)
+            stack = [(leaf, parents(leaf))]
+            running = set([leaf])
+            while stack:
+                vid, it = stack[-1]
+                for nvid in it:
+                    if nvid in running:
+                        raise CompileError("cycle through %d" % nvid)
+                    if nvid not in visited:
+                        visited.add(nvid)
+                        running.add(nvid)
+                        stack.append((nvid, parents(nvid)))
+                        break
+                else:
+                    stack.pop()
+                    running.discard(vid)
+                    order.append(vid)
+        return order
+
+    def var(self, vid, index):
+        if vid == self.composite.id_in:
+            return 'i%d' % index
+        return 'v%d_%d' % (vid, index)
+
+    def const(self, name, value):
+        self.namespace[name] = value
+        return name
+
+    def input_values(self, vid):
+        """ Return {input index: expression} of the connected inputs """
+        cn = self.composite
+        values = {}
+        for pid in self.plan.in_ports(vid):
+            args = [self.var(nvid, cn.local_id(npid))
+                    for npid, nvid, nactor in self.plan.parent_nodes(pid)]
+            if len(args) == 1:
+                values[cn.local_id(pid)] = args[0]
+            elif args:
+                values[cn.local_id(pid)] = '[%s]' % ', '.join(args)
+        return values
+
+    def arguments(self, vid, node):
+        """ Return the list of the expressions of all the inputs, the inputs
+        which are not connected are read from the node """
+        values = self.input_values(vid)
+        return [values[i] if i in values else
+                '%s.get_input(%d)' % (self.const('n%d' % vid, node), i)
+                for i in range(node.get_nb_input())]
+
+    def outputs(self, vid, node):
+        return [self.var(vid, i) for i in range(node.get_nb_output())]
+
+    def compile_vertex(self, vid):
+        """ Return the source lines of the evaluation of vid """
+        cn = self.composite
+        node = cn.node(vid)
+        if vid == cn.id_in:
+            return []
+        if vid == cn.id_out:
+            return ['return (%s)' % ''.join(a + ', ' for a in
+                                            self.arguments(vid, node))]
+
+        outputs = self.outputs(vid, node)
+        if is_compiled(node):
+            call = '%s(%s)' % (self.const('f%d' % vid, node.func),
+                               ', '.join(self.arguments(vid, node)))
+            if len(outputs) == 1:
+                out = outputs[0]
+                return ['%s = %s' % (out, call),
+                        'if %s.__class__ not in _scalars: %s = _single(%s)'
+                        % (out, out, out)]
+            elif outputs:
+                return ['%s = _multi(%s, %d)' % (', '.join(outputs), call,
+                                                 len(outputs))]
+            return [call]
+
+        if isinstance(node, CompositeNode):
+            try:
+                func = compile_composite(node, strict=True).func
+            except CompileError:
+                pass
+            else:
+                call = '%s(%s)' % (self.const('f%d' % vid, func),
+                                   ', '.join(self.arguments(vid, node)))
+                if outputs:
+                    return ['%s, = %s' % (', '.join(outputs), call)]
+                return [call]
+
+        # evaluated by the node itself
+        self.fallbacks.append(vid)
+        values = sorted(self.input_values(vid).iteritems())
+        call = '_eval(%s, (%s))' % (self.const('n%d' % vid, node),
+                                    ''.join('(%d, %s), ' % v
+                                            for v in values))
+        if outputs:
+            return ['%s, = %s' % (', '.join(outputs), call)]
+        return [call]
+
+    def source(self, name):
+        """ Return the source of the function name """
+        cn = self.composite
+        inputs = self.inputs()
+        params = ', '.join('i%d=_unset' % i for i in range(len(inputs)))
+        head = []
+        if inputs:
+            node = self.const('n%d' % cn.id_in, cn.node(cn.id_in))
+            head = ['if i%d is _unset: i%d = %s.get_input(%d)'
+                    % (i, i, node, i) for i in range(len(inputs))]
+        try:
+            self.check()
+            lines = list(head)
+            for vid in self.order():
+                lines.extend(self.compile_vertex(vid))
+            reason = None
+        except CompileError, e:
+            # evaluation of the whole composite node
+            self.fallbacks = []
+            call = '_eval(%s, (%s))' % (
+                self.const('node', self.composite),
+                ''.join('(%d, i%d), ' % (i, i) for i in range(len(inputs))))
+            lines = head + ['return %s' % call]
+            reason = str(e)
+        if not lines or not lines[-1].startswith('return'):
+            lines.append('return ()')
+
+        source = 'def %s(%s):\n' % (name, params)
+        source += ''.join('    %s\n' % line for line in lines)
+        return source, reason
+
+    def compile(self):
+        """ Return the CompiledComposite of the composite node """
+        name = 'compiled_' + re.sub(r'\W', '_',
+                                     self.composite.get_caption() or '')
+        source, reason = self.source(name)
+
+        # keep the source for the tracebacks
+        filename = '<compiled %s %d>' % (name, _counter.next())
+        linecache.cache[filename] = (len(source), None,
+                                     source.splitlines(True), filename)
+        exec compile(source, filename, 'exec') in self.namespace
+        func = self.namespace[name]
+        _sources[filename] = weakref.ref(
+            func, lambda ref, filename=filename: _forget_source(filename))
+        return CompiledComposite(func, source,
+                                 self.inputs(),
+                                 self.fallbacks, reason)
+
+
+def compile_composite(composite, strict=False):
+    """ Return a CompiledComposite computing the outputs of composite.
+
+    :param composite: a CompositeNode, whose nodes which are not compiled
+        are evaluated in place, or a CompositeNodeFactory (a new instance
+        is compiled)
+    :param strict: raise CompileError instead of evaluating the whole
+        composite node when it can not be compiled
+    """
+    if isinstance(composite, CompositeNodeFactory):
+        composite = composite.instantiate()
+    compiled = Compiler(composite).compile()
+    if strict and compiled.reason is not None:
+        raise CompileError(compiled.reason)
+    return compiled
@@ -26,18 +26,59 @@ __revision__ = " $Id$ "
 import string
 import pprint
 import copy
+import types
+import cPickle
+import hashlib
+from cStringIO import StringIO
 
 from openalea.core.node import AbstractFactory, AbstractPort, Node
 from openalea.core.node import RecursionError
 from openalea.core.pkgmanager import PackageManager, protected, UnknownPackageError
 from openalea.core.package import UnknownNodeError
+from openalea.core.pkgsearch import package_version
 from openalea.core.dataflow import DataFlow, InvalidEdge, PortError
 from openalea.core.settings import Settings
 from openalea.core.metadatadict import MetaDataDict
+from openalea.core.observer import quiet_notifications
 import logger
 
 quantify = False
 
+# instantiate the composite node factories by cloning a template
+use_templates = False
+
+# values shared by the factory and its instances
+_immutable_types = frozenset([type(None), bool, int, long, float, complex,
+                              str, unicode, type, types.ClassType,
+                              types.FunctionType, types.BuiltinFunctionType])
+
+
+def copy_data(data):
+    """ Return a copy of data (elt_data, elt_ad_hoc, port values...) for
+    a node instance.
+
+    Unlike deepcopy, the immutable values are shared with the factory and
+    only the containers the node may modify are copied.
+    """
+    cls = data.__class__
+    if cls in _immutable_types:
+        return data
+    elif cls is dict:
+        return dict((k, copy_data(v)) for k, v in data.iteritems())
+    elif cls is list:
+        return [copy_data(v) for v in data]
+    elif cls is tuple:
+        return tuple([copy_data(v) for v in data])
+    elif cls is set:
+        return set(data)
+    elif cls is MetaDataDict:
+        res = MetaDataDict()
+        res.update(data)
+        res._metaValues = copy_data(res._metaValues)
+        return res
+    return copy.deepcopy(data)
+
+
 class IncompatibleNodeError(Exception):
     """todo"""
     pass
@@ -83,6 +124,9 @@ class CompositeNodeFactory(AbstractFactory):
         self.elt_ad_hoc = kargs.get("elt_ad_hoc", {})
         from openalea.core.algo.dataflow_evaluation import DefaultEvaluation
         self.eval_algo = kargs.get("eval_algo", DefaultEvaluation.__name__)
+        # time of the last events of a DiscreteTimeEvaluation, None for no
+        # limit
+        self.horizon = kargs.get("horizon", None)
 
         # Documentation
         self.doc = kargs.get('doc', "")
@@ -100,6 +144,15 @@ class CompositeNodeFactory(AbstractFactory):
         self.connections.clear()
         self.elt_data.clear()
         self.elt_value.clear()
+        self.__dict__.pop('_values', None)
+        self.clear_template()
+
+    def __getstate__(self):
+        odict = AbstractFactory.__getstate__(self)
+        # parsed values and template are computed again on demand
+        odict.pop('_values', None)
+        odict.pop('_template', None)
+        return odict
 
     def copy(self, **args):
         """
@@ -145,6 +198,15 @@ class CompositeNodeFactory(AbstractFactory):
         if (self.get_id() in call_stack):
             raise RecursionError()
 
+        template = None
+        if use_templates:
+            # (digest of the contents, template), see contents_digest
+            digest = self.contents_digest()
+            template = self.__dict__.get('_template')
+            if template is not None and template[0] == digest and \
+                    template[1] is not None:
+                return template[1].clone()
+
         call_stack.append(self.get_id())
 
         new_df = CompositeNode(self.inputs, self.outputs)
@@ -152,10 +214,12 @@ class CompositeNodeFactory(AbstractFactory):
         new_df.__doc__ = self.doc
         new_df.set_caption(self.get_id())
         new_df.eval_algo = self.eval_algo
+        new_df.horizon = getattr(self, 'horizon', None)
 
         cont_eval = set() # continuous evaluated nodes
 
-        # Instantiate the node with each factory
+        # Instantiate the node with each factory, reserve their ids at once
+        new_df.reserve_vertices(self.elt_factory)
         for vid in self.elt_factory:
             try:
                 node = self.instantiate_node(vid, call_stack)
@@ -178,11 +242,11 @@ class CompositeNodeFactory(AbstractFactory):
         # Set IO internal data
         try:
             self.load_ad_hoc_data(new_df.node(new_df.id_in),
-                                  copy.deepcopy(self.elt_data["__in__"]),
-                                  copy.deepcopy(self.elt_ad_hoc.get("__in__", None)))
+                                  copy_data(self.elt_data["__in__"]),
+                                  copy_data(self.elt_ad_hoc.get("__in__", None)))
             self.load_ad_hoc_data(new_df.node(new_df.id_out),
-                                  copy.deepcopy(self.elt_data["__out__"]),
-                                  copy.deepcopy(self.elt_ad_hoc.get("__out__", None)))
+                                  copy_data(self.elt_data["__out__"]),
+                                  copy_data(self.elt_ad_hoc.get("__out__", None)))
         except:
             pass
 
@@ -196,7 +260,9 @@ class CompositeNodeFactory(AbstractFactory):
             if(target_vid == '__out__'):
                 target_vid = new_df.id_out
 
-            new_df.connect(source_vid, source_port, target_vid, target_port)
+            # no continuous evaluation listener is set yet
+            new_df._connect(source_vid, source_port, target_vid, target_port,
+                            False)
 
         # Set continuous evaluation
         for vid in cont_eval:
@@ -209,8 +275,60 @@ class CompositeNodeFactory(AbstractFactory):
         new_df.lazy = self.lazy
         new_df.graph_modified = False # Graph is not modifyied
 
+        if use_templates and (template is None or template[0] != digest):
+            self._template = (digest, CompositeNodeTemplate.create(new_df))
+
         return new_df
 
+    def compile(self):
+        """ Return a new instance compiled into a Python function
+        (see openalea.core.compiler) """
+        from openalea.core.compiler import compile_composite
+        return compile_composite(self)
+
+    def clear_template(self):
+        """ Remove the template used to instantiate the factory (see
+        use_templates), e.g. when the packages have been reloaded """
+        self.__dict__.pop('_template', None)
+
+    def contents_digest(self, call_stack=None):
+        """ Return the digest of the contents of the factory and of the
+        composite factories it uses: the template is built again when it
+        changes """
+        if not call_stack:
+            call_stack = []
+        h = hashlib.sha1()
+        for attr in (self.inputs, self.outputs, self.elt_factory,
+                     self.connections, self.elt_data, self.elt_value,
+                     self.elt_ad_hoc, self.eval_algo,
+                     getattr(self, 'horizon', None), self.lazy):
+            if isinstance(attr, dict):
+                attr = sorted(attr.iteritems())
+            h.update(repr(attr))
+
+        if self.get_id() in call_stack:
+            return h.hexdigest()
+        call_stack.append(self.get_id())
+        # a reloaded package replaces the previous one
+        h.update('packages:%s;' % PackageManager().pkgs.version)
+        for vid, (package_id, factory_id) in sorted(
+                self.elt_factory.iteritems()):
+            try:
+                factory = self.get_node_factory(vid)
+            except (UnknownNodeError, UnknownPackageError):
+                h.update('%s:None;' % vid)
+                continue
+            pkg = factory.package
+            if pkg is None:
+                h.update('%s::%s;' % (vid, factory.name))
+            else:
+                h.update('%s:%s:%s:%s;' % (vid, pkg.get_id(), factory.name,
+                                           package_version(pkg)))
+            if isinstance(factory, CompositeNodeFactory):
+                h.update(factory.contents_digest(call_stack))
+        call_stack.pop()
+        return h.hexdigest()
+
     def create_fake_node(self, vid):
         """ Return an empty node with the correct number of inputs
         and output """
@@ -229,29 +347,24 @@ class CompositeNodeFactory(AbstractFactory):
 
         node = Node()
 
-        attributes = copy.deepcopy(self.elt_data[vid])
-        ad_hoc     = copy.deepcopy(self.elt_ad_hoc.get(vid, None))
+        attributes = copy_data(self.elt_data[vid])
+        ad_hoc     = copy_data(self.elt_ad_hoc.get(vid, None))
         self.load_ad_hoc_data(node, attributes, ad_hoc)
 
-        # copy node input data if any
-        values = copy.deepcopy(self.elt_value.get(vid, ()))
-
         for p in range(ins+1):
             port = node.add_input(name="In"+str(p))
 
         for p in range(outs+1):
             port = node.add_output(name="Out"+str(p))
 
-        for vs in values:
+        # copy node input data if any
+        for port, v, extra in self.get_values(vid):
             try:
-                #the two first elements are the historical
-                #values : port Id and port value
-                #beyond that are extensions added by gengraph:
-                #the ad_hoc_dict representation is third.
-                port, v = vs[:2]
-                node.set_input(port, eval(v))
-                if(len(vs)>2):
-                    d = MetaDataDict(vs[2])
+                node.set_input(port, copy_data(v))
+                #beyond port Id and port value are extensions added by
+                #gengraph: the ad_hoc_dict representation is third.
+                if(extra):
+                    d = MetaDataDict(extra[0])
                     node.input_desc[port].get_ad_hoc_dict().update(d)
             except:
                 continue
@@ -342,39 +455,61 @@ class CompositeNodeFactory(AbstractFactory):
 
         :param call_stack: a list of parent id (to avoid infinite recursion)
         """
+        factory = self.get_node_factory(vid)
+        node = factory.instantiate(call_stack)
+
+        attributes = copy_data(self.elt_data[vid])
+        ad_hoc     = copy_data(self.elt_ad_hoc.get(vid, None))
+        self.load_ad_hoc_data(node, attributes, ad_hoc)
+
+        # copy node input data if any
+        for port, v, extra in self.get_values(vid):
+            try:
+                node.set_input(port, copy_data(v))
+                node.input_desc[port].get_ad_hoc_dict().set_metadata("hide",
+                                                                     node.is_port_hidden(port))
+            except:
+                continue
+
+        return node
+
+    def get_node_factory(self, vid):
+        """ Return the factory of the element vid """
         (package_id, factory_id) = self.elt_factory[vid]
         pkgmanager = PackageManager()
         pkg = pkgmanager[package_id]
         try:
-            factory = pkg.get_factory(factory_id)
+            return pkg.get_factory(factory_id)
         except UnknownNodeError, e:
             # Bug when both package_id and protected(package_id) exist
             pkg = pkgmanager[protected(package_id)]
-            factory = pkg.get_factory(factory_id)
-
+            return pkg.get_factory(factory_id)
 
-        node = factory.instantiate(call_stack)
-
-        attributes = copy.deepcopy(self.elt_data[vid])
-        ad_hoc     = copy.deepcopy(self.elt_ad_hoc.get(vid, None))
-        self.load_ad_hoc_data(node, attributes, ad_hoc)
+    def get_values(self, vid):
+        """ Return the list of (port, value, extensions) of the input values
+        stored in elt_value for vid.
 
-        # copy node input data if any
-        values = copy.deepcopy(self.elt_value.get(vid, ()))
+        The values are stored as strings: they are evaluated once and kept
+        until elt_value[vid] is modified. Values which can not be evaluated
+        are ignored.
+        """
+        values = self.elt_value.get(vid, ())
+        cache = self.__dict__.setdefault('_values', {})
+        entry = cache.get(vid)
+        if entry is not None and entry[0] == values:
+            return entry[1]
 
+        parsed = []
         for vs in values:
             try:
                 #the two first elements are the historical
                 #values : port Id and port value
-                #the values beyond are not used.
                 port, v = vs[:2]
-                node.set_input(port, eval(v))
-                node.input_desc[port].get_ad_hoc_dict().set_metadata("hide",
-                                                                     node.is_port_hidden(port))
+                parsed.append((port, eval(v), tuple(vs[2:])))
             except:
                 continue
-
-        return node
+        cache[vid] = (copy.deepcopy(values), parsed)
+        return parsed
 
     #########################################################
     # This shouldn't be here, it is related to visual stuff #
@@ -399,6 +534,52 @@ class CompositeNodeFactory(AbstractFactory):
         return DisplayGraphWidget(node, parent, autonomous)
 
 
+class CompositeNodeTemplate(object):
+    """ Pickled instance of a CompositeNodeFactory, cloned to create new
+    instances without instantiating again all the elements.
+
+    The factories are shared by the template and its clones.
+    """
+
+    def __init__(self, node):
+        self.factories = []
+        f = StringIO()
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = self.persistent_id
+        pickler.dump(node)
+        self.data = f.getvalue()
+
+    @staticmethod
+    def create(node):
+        """ Return the template of node, None if node can not be pickled """
+        try:
+            return CompositeNodeTemplate(node)
+        except Exception, e:
+            logger.debug("No template for %s: %s" % (node.factory.name, e))
+            return None
+
+    def persistent_id(self, obj):
+        if isinstance(obj, AbstractFactory):
+            self.factories.append(obj)
+            return str(len(self.factories) - 1)
+        return None
+
+    def clone(self):
+        """ Return a new instance of the composite node """
+        unpickler = cPickle.Unpickler(StringIO(self.data))
+        unpickler.persistent_load = lambda pid: self.factories[int(pid)]
+        new_df = unpickler.load()
+
+        # weak references to the composite node are pickled as references
+        # and the listeners are not pickled
+        for vid in new_df.vertices():
+            node = new_df.node(vid)
+            node.set_compositenode(new_df)
+            if node.user_application:
+                new_df.set_continuous_eval(vid, True)
+        return new_df
+
+
 class CompositeNode(Node, DataFlow):
     """
     The CompositeNode is a container that interconnect
@@ -420,10 +601,35 @@ class CompositeNode(Node, DataFlow):
         self.graph_modified = False
         self.evaluating = False
         self.eval_algo = None
+        # time of the last events of a DiscreteTimeEvaluation
+        self.horizon = None
+        # (eval_algo, algorithm class) of the last evaluation
+        self._algo = None
 
     def copy_to(self, other):
         raise NotImplementedError
 
+    def __getstate__(self):
+        odict = Node.__getstate__(self)
+        # evaluation algorithm, execution plan and topology snapshot are
+        # recreated on demand
+        odict['_algo'] = None
+        odict.pop('_execution_plan', None)
+        odict.pop('_snapshot', None)
+        return odict
+
+    def __setstate__(self, dict):
+        if '_topology_version' not in dict:
+            dict['_topology_version'] = 0
+        Node.__setstate__(self, dict)
+        # dirty vertices were not stored in older versions
+        if '_dirty' not in dict:
+            self._dirty = set(self.vertices())
+        # nor port indices
+        if '_port_edges' not in dict:
+            self.rebuild_port_index()
+        self.topology_modified()
+
     def close(self):
         for vid in set(self.vertices()):
             node = self.actor(vid)
@@ -499,7 +705,16 @@ class CompositeNode(Node, DataFlow):
         return self.node(self.id_out).set_output(index_key, val)
 
     def get_eval_algo(self):
-        """ Return the evaluation algo instance """
+        """ Return a new evaluation algo instance
+
+        Only the class is kept while eval_algo is not modified: the
+        evaluations share the execution plan of the dataflow, not the
+        state of the algorithm.
+        """
+        cached = getattr(self, '_algo', None)
+        if cached is not None and cached[0] == self.eval_algo:
+            return cached[1](self)
+
         try:
             algo_str = self.eval_algo
 
@@ -511,22 +726,27 @@ class CompositeNode(Node, DataFlow):
             baseimp = "algo.dataflow_evaluation"
             module = __import__(baseimp, globals(), locals(), [algo_str])
             classobj = module.__dict__[algo_str]
-            return classobj(self)
+            algo = classobj(self)
 
         except Exception, e:
             from  openalea.core.algo.dataflow_evaluation import DefaultEvaluation
-            return DefaultEvaluation(self)
+            classobj = DefaultEvaluation
+            algo = DefaultEvaluation(self)
 
-        return self.eval_algo
+        self._algo = (self.eval_algo, classobj)
+        return algo
 
-    def eval_as_expression(self, vtx_id=None, step=False):
+    def eval_as_expression(self, vtx_id=None, step=False, quiet=False):
         """
         Evaluate a vtx_id
 
         if node_id is None, then all the nodes without sons are evaluated
+
+        :param quiet: if True, the nodes send no notification during the
+            evaluation (see observer.quiet_notifications).
         """
         import time
-        t0 = time.time()
+        t0 = time.time() if quantify else 0
         if(self.evaluating):
             return
         if(vtx_id != None):
@@ -535,11 +755,15 @@ class CompositeNode(Node, DataFlow):
 
         try:
             self.evaluating = True
-            algo.eval(vtx_id,step=step)
+            if quiet:
+                with quiet_notifications():
+                    algo.eval(vtx_id, step=step)
+            else:
+                algo.eval(vtx_id,step=step)
         finally:
             self.evaluating = False
-        t1 = time.time()
         if quantify:
+            t1 = time.time()
             logger.info('Evaluation time: %s'%(t1-t0))
             print 'Evaluation time: %s'%(t1-t0)
     # Functions used by the node evaluator
@@ -569,6 +793,60 @@ class CompositeNode(Node, DataFlow):
 
         return ()
 
+    def map(self, inputs, workers=1, ordered=False, shared=False,
+            executor='thread', quiet=False):
+        """
+        Evaluate the graph for each record of inputs
+
+        A record is a dict {input name or index: value} or a sequence of
+        values. Each worker uses its own copy of the graph for all its
+        records. Yield a BatchResult for each record as soon as it is
+        evaluated (in the order of inputs if ordered is True). A failing
+        record is reported in BatchResult.error and does not stop the batch.
+
+        If shared is True, the graph is not copied: the values of each
+        record are stored in a DataflowState (see new_state).
+
+        The workers are threads: because of the GIL, only the nodes which
+        release it run in parallel. Use executor='process' to evaluate the
+        records in worker processes, the graph, the records and the
+        outputs must then be picklable (see batch.map_node).
+
+        If quiet is True, the nodes send no evaluation event (see
+        observer.quiet_notifications).
+        """
+        from openalea.core.batch import map_node
+        return map_node(self, inputs, workers=workers, ordered=ordered,
+                        shared=shared, executor=executor, quiet=quiet)
+
+    def new_state(self, inputs=()):
+        """
+        Return (algo, state) to evaluate the graph without modifying it.
+
+        The values of the ports are stored in the DataflowState, hence
+        several states can be evaluated concurrently with the same graph::
+
+            algo, state = cn.new_state(dict(x=1))
+            algo.eval(None, state)
+            outputs = algo.get_outputs(state)
+        """
+        from openalea.core.dataflow_evaluation import CompositeEvaluation
+        algo = CompositeEvaluation(self)
+        return algo, algo.new_state(inputs)
+
+    def compile(self):
+        """
+        Return a Python function computing the outputs from the inputs
+        (see openalea.core.compiler)::
+
+            func = cn.compile()
+            outputs = func(1, y=2)
+
+        The nodes which can not be compiled are evaluated in place.
+        """
+        from openalea.core.compiler import compile_composite
+        return compile_composite(self)
+
     def to_script (self) :
         """Translate the dataflow into a python script.
         """
@@ -764,6 +1042,7 @@ class CompositeNode(Node, DataFlow):
         # Properties
         sgfactory.lazy = self.lazy
         sgfactory.eval_algo = self.eval_algo
+        sgfactory.horizon = getattr(self, 'horizon', None)
         #print self.eval_algo
         # I / O
         if(auto_io):
@@ -915,7 +1194,7 @@ class CompositeNode(Node, DataFlow):
         self.graph_modified = True
 
     def remove_edge(self, eid):
-        target = self.target(eid)
+        target = self.target_port(eid)
         try:
             port = self.port(target)
         except PortError:
@@ -963,7 +1242,11 @@ class CompositeNode(Node, DataFlow):
         :param dst_id: destination node id
         :param port_dst: destination input port number
         """
+        self._connect(src_id, port_src, dst_id, port_dst, True)
 
+    def _connect(self, src_id, port_src, dst_id, port_dst, update_listeners):
+        """ Connect 2 elements, update the continuous evaluation listeners
+        of src_id only if update_listeners is True """
         try:
             source_pid = self.out_port(src_id, port_src)
             target_pid = self.in_port(dst_id, port_dst)
@@ -976,7 +1259,8 @@ class CompositeNode(Node, DataFlow):
         self.notify_listeners(("connection_modified", ))
         self.graph_modified = True
 
-        self.update_eval_listeners(src_id)
+        if update_listeners:
+            self.update_eval_listeners(src_id)
         nodeSrc = self.node(src_id)
         nodeDst = self.node(dst_id)
         src_port = nodeSrc.output_desc[port_src]
@@ -1167,6 +1451,7 @@ $NAME = CompositeNodeFactory(name=$PNAME,
                              elt_ad_hoc=$ELT_AD_HOC,
                              lazy=$LAZY,
                              eval_algo=$EVALALGO,
+                             horizon=$HORIZON,
                              )
 
 """
@@ -1200,6 +1485,7 @@ $NAME = CompositeNodeFactory(name=$PNAME,
                                       ELT_AD_HOC=self.pprint_repr(f.elt_ad_hoc),
                                       LAZY=self.pprint_repr(f.lazy),
                                       EVALALGO=self.pprint_repr(f.eval_algo),
+                                      HORIZON=self.pprint_repr(getattr(f, 'horizon', None)),
                                       )
         return result
 
@@ -206,7 +206,7 @@ class DataNode(Node):
 
     def changed(self, path):
         """ Call listeners """
-        self.continuous_eval.notify_listeners(("node_modified", ))
+        self.notify_continuous_eval(("node_modified", ))
 
     def to_script(self):
         return "\n"
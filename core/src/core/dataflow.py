@@ -22,7 +22,9 @@ __revision__ = " $Id$ "
 from openalea.core.graph.property_graph import PropertyGraph, InvalidVertex
 from openalea.core.graph.property_graph import InvalidEdge
 from openalea.core.graph.id_generator import IdGenerator
+from openalea.core.graph.frozen_graph import FrozenGraph, csr
 from collections import deque
+from array import array
 
 
 class PortError (Exception):
@@ -35,12 +37,117 @@ class Port (object):
     a port is an entry point to a vertex
     """
 
+    __slots__ = ('_vid', '_local_pid', '_is_out_port')
+
     def __init__(self, vid, local_pid, is_out_port):
         #internal data to access from dataflow
         self._vid = vid
         self._local_pid = local_pid
         self._is_out_port = is_out_port
 
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        # also used by the pickles of the ports with a __dict__
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
+
+class FrozenDataFlow(FrozenGraph):
+    """
+    read only snapshot of the topology of a dataflow,
+    the ports are stored in arrays indexed by pid:
+        - port_vertex: vertex id of each port (-1 if not a port)
+        - port_is_out: 1 for the out ports
+        - port_local: local id of each port (list)
+        - in_port_offsets/in_pids and out_port_offsets/out_pids:
+          sorted port ids of each vertex (see FrozenGraph)
+        - conn_offsets/conn_pids: ports connected to each port,
+          in the order of the edge ids
+        - source_pids/target_pids: ports of each edge id
+    """
+
+    def __init__(self, dataflow):
+        FrozenGraph.__init__(self, dataflow)
+
+        pids = sorted(dataflow._ports)
+        size = pids[-1] + 1 if pids else 0
+        self.port_vertex = array('i', [-1]) * size
+        self.port_is_out = array('b', [0]) * size
+        self.port_local = [None] * size
+        for pid in pids:
+            port = dataflow.port(pid)
+            self.port_vertex[pid] = port._vid
+            self.port_is_out[pid] = port._is_out_port
+            self.port_local[pid] = port._local_pid
+
+        is_out = self.port_is_out
+        ports = [sorted(dataflow.ports(vid)) for vid in self.vids]
+        self.in_port_offsets, self.in_pids = csr(
+            [pid for pid in pids_i if not is_out[pid]] for pids_i in ports)
+        self.out_port_offsets, self.out_pids = csr(
+            [pid for pid in pids_i if is_out[pid]] for pids_i in ports)
+
+        self.source_pids = array('i', [-1]) * len(self.sources)
+        self.target_pids = array('i', self.source_pids)
+        connections = [[] for i in xrange(size)]
+        for eid in self.eids:
+            source = self.source_pids[eid] = dataflow.source_port(eid)
+            target = self.target_pids[eid] = dataflow.target_port(eid)
+            connections[source].append(target)
+            connections[target].append(source)
+        self.conn_offsets, self.conn_pids = csr(connections)
+
+    def _port(self, pid):
+        try:
+            if pid >= 0 and self.port_vertex[pid] >= 0:
+                return pid
+        except (IndexError, TypeError):
+            pass
+        raise PortError("port %s don't exist" % str(pid))
+
+    def source_port(self, eid):
+        self.source(eid)
+        return self.source_pids[eid]
+
+    def target_port(self, eid):
+        self.source(eid)
+        return self.target_pids[eid]
+
+    def in_ports(self, vid):
+        i = self.index(vid)
+        offsets = self.in_port_offsets
+        return self.in_pids[offsets[i]:offsets[i + 1]]
+
+    def out_ports(self, vid):
+        i = self.index(vid)
+        offsets = self.out_port_offsets
+        return self.out_pids[offsets[i]:offsets[i + 1]]
+
+    def ports(self, vid):
+        return self.in_ports(vid) + self.out_ports(vid)
+
+    def is_in_port(self, pid):
+        return not self.port_is_out[self._port(pid)]
+
+    def is_out_port(self, pid):
+        return bool(self.port_is_out[self._port(pid)])
+
+    def vertex(self, pid):
+        return self.port_vertex[self._port(pid)]
+
+    def local_id(self, pid):
+        return self.port_local[self._port(pid)]
+
+    def connected_ports(self, pid):
+        pid = self._port(pid)
+        return self.conn_pids[self.conn_offsets[pid]:self.conn_offsets[pid + 1]]
+
+    def nb_connections(self, pid):
+        pid = self._port(pid)
+        return self.conn_offsets[pid + 1] - self.conn_offsets[pid]
+
 
 class DataFlow(PropertyGraph):
     """
@@ -48,11 +155,18 @@ class DataFlow(PropertyGraph):
     of vertices and out_port of vertices
     ports are typed
     """
+    snapshot_class = FrozenDataFlow
 
     def __init__(self):
         PropertyGraph.__init__(self)
         self._ports = {}
         self._pid_generator = IdGenerator()
+        # pid -> set of connected eids
+        self._port_edges = {}
+        # (vid, local_pid, is_out_port) -> pid
+        self._local_ports = {}
+        # vertices whose outputs are not up to date
+        self._dirty = set()
 
         self.add_edge_property("_source_port")
         self.add_edge_property("_target_port")
@@ -179,15 +293,7 @@ class DataFlow(PropertyGraph):
         to this port
         :rtype: iter of eid
         """
-        vid = self.vertex(pid)
-        if self.is_out_port(pid):
-            for eid in self.out_edges(vid):
-                if self.source_port(eid)==pid:
-                    yield eid
-        else:
-            for eid in self.in_edges(vid):
-                if self.target_port(eid)==pid:
-                    yield eid
+        return iter(self._port_edges[pid])
 
     def nb_connections(self, pid):
         """ Compute number of edges connected to a given port.
@@ -198,7 +304,7 @@ class DataFlow(PropertyGraph):
         return:
             - int
         """
-        return len(tuple(self.connected_edges(pid)))
+        return len(self._port_edges[pid])
 
     ####################################################
     #
@@ -230,20 +336,62 @@ class DataFlow(PropertyGraph):
         global port id of a given port
         :rtype: pid
         """
-        for pid in self.out_ports(vid):
-            if self._ports[pid]._local_pid == local_pid:
-                return pid
-        raise PortError("Local pid '%s' does not exist" % str(local_pid))
+        try:
+            return self._local_ports[(vid, local_pid, True)]
+        except KeyError:
+            raise PortError("Local pid '%s' does not exist" % str(local_pid))
 
     def in_port(self, vid, local_pid):
         """
         global port id of a given port
         :rtype: pid
         """
-        for pid in self.in_ports(vid):
-            if self._ports[pid]._local_pid == local_pid:
-                return pid
-        raise PortError("local pid '%s' does not exist for vertex %d" % (str(local_pid),vid) )
+        try:
+            return self._local_ports[(vid, local_pid, False)]
+        except KeyError:
+            raise PortError("local pid '%s' does not exist for vertex %d" % (str(local_pid),vid) )
+
+    #####################################################
+    #
+    #        dirty vertices
+    #
+    #####################################################
+
+    def mark_dirty(self, vid):
+        """
+        mark vid and all the vertices downstream of it as dirty
+
+        The set of dirty vertices is closed downstream, thus the propagation
+        stops on vertices already dirty.
+        """
+        dirty = self._dirty
+        scan = [vid]
+        while scan:
+            vid = scan.pop()
+            if vid in dirty or vid not in self:
+                continue
+            dirty.add(vid)
+            scan.extend(self.out_neighbors(vid))
+
+    def clean(self, vid):
+        """
+        mark vid as up to date
+        """
+        self._dirty.discard(vid)
+
+    def is_dirty(self, vid):
+        """
+        test whether the outputs of vid are not up to date
+        :rtype: bool
+        """
+        return vid in self._dirty
+
+    def dirty_vertices(self):
+        """
+        set of dirty vertices
+        :rtype: set of vid
+        """
+        return self._dirty
 
     #####################################################
     #
@@ -258,6 +406,7 @@ class DataFlow(PropertyGraph):
         try : actor.set_id(vid)
         except Exception, e: print e
         self.vertex_property("_actor")[vid] = actor
+        self.topology_modified()
 
     def actor(self, vid):
         """
@@ -300,6 +449,9 @@ class DataFlow(PropertyGraph):
         pid = self._pid_generator.get_id(pid)
         self._ports[pid] = Port(vid, local_pid, False)
         self.vertex_property("_ports")[vid].add(pid)
+        self._port_edges[pid] = set()
+        self._local_ports.setdefault((vid, local_pid, False), pid)
+        self.topology_modified()
         return pid
 
     def add_out_port(self, vid, local_pid, pid=None):
@@ -315,6 +467,9 @@ class DataFlow(PropertyGraph):
         pid = self._pid_generator.get_id(pid)
         self._ports[pid] = Port(vid, local_pid, True)
         self.vertex_property("_ports")[vid].add(pid)
+        self._port_edges[pid] = set()
+        self._local_ports.setdefault((vid, local_pid, True), pid)
+        self.topology_modified()
         return pid
 
     def remove_port(self, pid):
@@ -324,9 +479,22 @@ class DataFlow(PropertyGraph):
         """
         for eid in list(self.connected_edges(pid)):
             self.remove_edge(eid)
-        self.vertex_property("_ports")[self.vertex(pid)].remove(pid)
+        vid = self.vertex(pid)
+        self.vertex_property("_ports")[vid].remove(pid)
         self._pid_generator.release_id(pid)
-        del self._ports[pid]
+        port = self._ports.pop(pid)
+        del self._port_edges[pid]
+
+        key = (vid, port._local_pid, port._is_out_port)
+        if self._local_ports.get(key) == pid:
+            del self._local_ports[key]
+            # another port may use the same local id
+            for npid in self.ports(vid):
+                nport = self._ports[npid]
+                if (nport._local_pid, nport._is_out_port) == key[1:]:
+                    self._local_ports[key] = npid
+                    break
+        self.topology_modified()
 
     def connect(self, source_pid, target_pid, eid=None):
         """
@@ -350,13 +518,33 @@ class DataFlow(PropertyGraph):
             self.vertex(target_pid)), eid)
         self.edge_property("_source_port")[eid] = source_pid
         self.edge_property("_target_port")[eid] = target_pid
+        self._port_edges[source_pid].add(eid)
+        self._port_edges[target_pid].add(eid)
+        self.topology_modified()
+        self.mark_dirty(self.vertex(target_pid))
 
         return eid
 
+    def rebuild_port_index(self):
+        """
+        compute the port -> edges and local port id -> port indices
+        from scratch (e.g. for dataflows pickled by older versions)
+        """
+        self._port_edges = dict((pid, set()) for pid in self._ports)
+        self._local_ports = {}
+        for pid, port in self._ports.iteritems():
+            key = (port._vid, port._local_pid, port._is_out_port)
+            self._local_ports.setdefault(key, pid)
+        for eid in self.edges():
+            self._port_edges[self.source_port(eid)].add(eid)
+            self._port_edges[self.target_port(eid)].add(eid)
+
     def add_vertex(self, vid=None):
         """todo"""
         vid = PropertyGraph.add_vertex(self, vid)
         self.vertex_property("_ports")[vid] = set()
+        self._dirty.add(vid)
+        self.topology_modified()
         return vid
 
     add_vertex.__doc__ = PropertyGraph.add_vertex.__doc__
@@ -369,14 +557,40 @@ class DataFlow(PropertyGraph):
             except:
                 pass
         PropertyGraph.remove_vertex(self, vid)
+        self._dirty.discard(vid)
+        self.topology_modified()
 
     remove_vertex.__doc__ = PropertyGraph.remove_vertex.__doc__
 
+    def remove_edge(self, eid):
+        """todo"""
+        vid = self.target(eid)
+        for pid in (self.source_port(eid), self.target_port(eid)):
+            self._port_edges[pid].discard(eid)
+        PropertyGraph.remove_edge(self, eid)
+        self.mark_dirty(vid)
+        self.topology_modified()
+
+    remove_edge.__doc__ = PropertyGraph.remove_edge.__doc__
+
+    def clear_edges(self):
+        """todo"""
+        for eids in self._port_edges.itervalues():
+            eids.clear()
+        PropertyGraph.clear_edges(self)
+        self.topology_modified()
+
+    clear_edges.__doc__ = PropertyGraph.clear_edges.__doc__
+
     def clear(self):
         """todo"""
         self._ports.clear()
         self._pid_generator = IdGenerator()
+        self._port_edges.clear()
+        self._local_ports.clear()
+        self._dirty.clear()
         PropertyGraph.clear(self)
+        self.topology_modified()
 
     clear.__doc__ = PropertyGraph.clear.__doc__
 
@@ -19,6 +19,11 @@
 __license__ = "Cecill-C"
 __revision__ = " $Id$ "
 
+import threading
+
+from openalea.core.dataflow_state import DataflowState
+from openalea.core.profiler import get_profiler
+
 
 # class EvaluationException(Exception):
 #
@@ -117,7 +122,13 @@ class BruteEvaluation(AbstractEvaluation):
         inputs = [state.get_data(pid) for pid in df.in_ports(vid)]
 
         # perform computation
-        vals = df.actor(vid)(inputs)
+        actor = df.actor(vid)
+        profiler = get_profiler()
+        if profiler is None:
+            vals = actor(inputs)
+        else:
+            vals = profiler.run(vid, actor, actor, inputs,
+                                inputs=inputs, outputs=True)
 
         # affect return values to output ports
         pids = tuple(df.out_ports(vid))
@@ -135,16 +146,190 @@ class BruteEvaluation(AbstractEvaluation):
             raise UserWarning("mismatch nb out port vs. function result")
 
 
-# class LazyEvaluation(BruteEvaluation):
-#     """ For each evaluation reevaluate a node of the dataflow
-#     only if its inputs have changed or if it is tagged
-#     as not lazy.
-#     """
-#     def __init__(self, dataflow):
-#         BruteEvaluation.__init__(self, dataflow)
-#
-#         self._modified = {}
-#
-#     def clear(self):
-#         BruteEvaluation.clear(self)
-#         self._modified.clear()
\ No newline at end of file
+class LazyEvaluation(BruteEvaluation):
+    """ For each evaluation reevaluate a node of the dataflow
+    only if its inputs have changed or if it is tagged
+    as not lazy.
+
+    Changes are detected with the stamps of the data stored in the
+    state, hence the same algorithm can be used with several states.
+    """
+    def eval(self, env, state, vid=None):
+        # nodes are visited once per evaluation, the
+        # stamps tell which ones must be recomputed
+        self.clear()
+        BruteEvaluation.eval(self, env, state, vid)
+
+    def is_modified(self, state, vid):
+        """ Test whether a node must be reevaluated with this state
+        """
+        df = self._dataflow
+
+        actor = df.actor(vid)
+        if not getattr(actor, "lazy", True):
+            return True
+
+        last = state.get_last_evaluation(vid)
+        if last is None:
+            return True
+
+        for pid in df.in_ports(vid):
+            stamp = state.get_stamp(pid)
+            if stamp is None or stamp > last:
+                return True
+
+        for pid in df.out_ports(vid):
+            if state.get_stamp(pid) is None:
+                return True
+
+        return False
+
+    def eval_node(self, env, state, vid):
+        if self.is_modified(state, vid):
+            BruteEvaluation.eval_node(self, env, state, vid)
+            state.set_evaluated(vid)
+
+
+class CompositeEvaluation(LazyEvaluation):
+    """ Evaluate a composite node with the data stored in a state.
+
+    The composite node, its topology and its actors are only read: all
+    the values of the ports live in the DataflowState. Hence the same
+    composite node can be evaluated for many states, concurrently from
+    several threads, as long as each state is used by one thread at a
+    time. Actors compute their outputs from the inputs they are called
+    with, values stored on the nodes are only used as default values.
+    Nested composite nodes are evaluated with their own state, kept in
+    the state of the parent.
+    """
+    def __init__(self, dataflow):
+        LazyEvaluation.__init__(self, dataflow)
+
+        self._lock = threading.Lock()
+        self._subalgos = {}  # {vid: (actor, CompositeEvaluation)}
+
+    def new_state(self, inputs=()):
+        """ Create a state ready for evaluation.
+
+        Not connected input ports get the values of the actors inputs.
+
+        args:
+            - inputs (dict|list): values of the composite node inputs
+                                  see set_inputs
+        """
+        df = self._dataflow
+        state = DataflowState(df)
+        for pid in df.in_ports():
+            if df.nb_connections(pid) == 0:
+                actor = df.actor(df.vertex(pid))
+                state.set_data(pid, actor.get_input(df.local_id(pid)))
+
+        actor = df.actor(df.id_in)
+        for pid in df.out_ports(df.id_in):
+            state.set_data(pid, actor.get_input(df.local_id(pid)))
+
+        self.set_inputs(state, inputs)
+        return state
+
+    def set_inputs(self, state, inputs):
+        """ Set the values of the composite node inputs in state.
+
+        args:
+            - state (DataflowState)
+            - inputs (dict|list): {input name or index: value}
+                                  or values of the first inputs
+        """
+        df = self._dataflow
+        actor = df.actor(df.id_in)
+        if hasattr(inputs, 'iteritems'):
+            items = inputs.iteritems()
+        else:
+            items = enumerate(inputs)
+        for key, value in items:
+            index = actor.map_index_out[key]
+            state.set_data(df.out_port(df.id_in, index), value)
+
+    def get_outputs(self, state):
+        """ Return the list of the composite node outputs stored in state
+        """
+        df = self._dataflow
+        nb = df.actor(df.id_out).get_nb_input()
+        return [state.get_data(df.in_port(df.id_out, i)) for i in range(nb)]
+
+    def sorted_vertices(self):
+        """ Return the list of vertices, each one after its parents.
+
+        The list is computed once per topology of the dataflow,
+        vertices in a cycle are evaluated last.
+        """
+        return self._dataflow.snapshot().topological_order()
+
+    def ancestors(self, vid):
+        """ Return the set of vertices upstream of vid, vid included
+        """
+        return self._dataflow.snapshot().ancestors(vid)
+
+    def eval(self, env, state, vid=None):
+        vids = self.sorted_vertices()
+        if vid is not None:
+            upstream = self.ancestors(vid)
+            vids = [nid for nid in vids if nid in upstream]
+
+        for nid in vids:
+            self.eval_node(env, state, nid)
+
+    def subalgo(self, vid):
+        """ Return the algorithm used to evaluate the actor of vid
+        if it is a composite node, None otherwise.
+        """
+        actor = self._dataflow.actor(vid)
+        if not hasattr(actor, 'id_in'):
+            return None
+
+        with self._lock:
+            entry = self._subalgos.get(vid)
+            if entry is None or entry[0] is not actor:
+                entry = self._subalgos[vid] = (actor,
+                                               CompositeEvaluation(actor))
+        return entry[1]
+
+    def eval_actor(self, env, state, vid, actor, inputs):
+        """ Return the outputs of actor evaluated on inputs """
+        algo = self.subalgo(vid)
+        if algo is None:
+            return actor(inputs)
+        substate = state.get_substate(vid, algo.new_state)
+        algo.set_inputs(substate, inputs)
+        algo.eval(env, substate)
+        return algo.get_outputs(substate)
+
+    def eval_node(self, env, state, vid):
+        df = self._dataflow
+        if vid in (df.id_in, df.id_out) or not self.is_modified(state, vid):
+            return
+
+        actor = df.actor(vid)
+        inputs = [state.get_data(pid) for pid in df.in_ports(vid)]
+
+        profiler = get_profiler()
+        if profiler is None:
+            vals = self.eval_actor(env, state, vid, actor, inputs)
+        else:
+            vals = profiler.run(vid, actor, self.eval_actor, env, state, vid,
+                                actor, inputs, inputs=inputs, outputs=True)
+
+        # outputs are copied as Node.eval does
+        nb = actor.get_nb_output()
+        if nb == 1:
+            try:
+                if hasattr(vals, "__getitem__") and len(vals) == 1:
+                    vals = vals[0]
+            except TypeError:
+                pass
+            vals = (vals, )
+        elif not isinstance(vals, (tuple, list)):
+            vals = (vals, )
+
+        for i, val in enumerate(vals[:nb]):
+            state.set_data(df.out_port(vid, i), val)
+        state.set_evaluated(vid)
@@ -15,6 +15,11 @@
 ###############################################################################
 """ This module provide an implementation of a way
 to store data exchanged between nodes of a dataflow.
+
+A state only stores data, the dataflow is not modified: several
+independent states can be used with the same dataflow. Each data is
+stamped when it is set, which allows lazy algorithms to know which
+nodes must be reevaluated.
 """
 
 __license__ = "Cecill-C"
@@ -33,10 +38,23 @@ class DataflowState(object):
         self._dataflow = dataflow
         self._state = {}
 
+        self._stamp = 0  # incremented each time data is set
+        self._stamps = {}  # {pid: stamp of data}
+        self._evaluations = {}  # {vid: stamp of last evaluation}
+
+        # {in pid: (version, sources, positions, sorted out pids)}
+        self._fanin = {}
+
+        # {vid: state of the actor of vid if it is itself a dataflow}
+        self._substates = {}
+
     def clear(self):
         """Clear state
         """
         self._state.clear()
+        self._stamps.clear()
+        self._evaluations.clear()
+        self._substates.clear()
 
     def reinit(self):
         """ Remove all data stored except for the one
@@ -47,12 +65,14 @@ class DataflowState(object):
         # save state
         save = dict((pid, dat) for pid, dat in self._state.items()
                     if df.is_in_port(pid) and df.nb_connections(pid) == 0)
+        stamps = dict((pid, self._stamps[pid]) for pid in save)
 
         # clear
         self.clear()
 
         # resume state
         self._state.update(save)
+        self._stamps.update(stamps)
 
     def is_ready_for_evaluation(self):
         """ Test wether the state contains enough information
@@ -108,6 +128,46 @@ class DataflowState(object):
 
         return cmp(pid1, pid2)
 
+    def _positions(self, sources):
+        """ Return the x positions of the actors of sources """
+        positions = []
+        for ad_hoc in sources:
+            if ad_hoc is None:
+                positions.append(None)
+            else:
+                positions.append(ad_hoc.get_metadata('position')[0])
+        return positions
+
+    def connected_ports(self, pid):
+        """ Return the list of output ports connected to
+        the input port pid sorted by cmp_port_priority.
+
+        The sorted list is kept until the topology of the dataflow
+        is modified or one of the connected actors is moved.
+        """
+        df = self._dataflow
+        version = df.topology_version()
+        entry = self._fanin.get(pid)
+        if entry is not None and entry[0] == version:
+            sources, positions, npids = entry[1:]
+            if len(npids) < 2 or self._positions(sources) == positions:
+                return npids
+
+        npids = list(df.connected_ports(pid))
+        sources = []
+        if len(npids) > 1:
+            npids.sort(self.cmp_port_priority)
+            for npid in npids:
+                try:
+                    actor = df.actor(df.vertex(npid))
+                except KeyError:
+                    actor = None
+                sources.append(None if actor is None
+                               else actor.get_ad_hoc_dict())
+        self._fanin[pid] = (version, sources, self._positions(sources),
+                            npids)
+        return npids
+
     def get_data(self, pid):
         """ Retrieve data associated with a port.
 
@@ -127,13 +187,12 @@ class DataflowState(object):
         elif df.is_out_port(pid):
             raise KeyError("value not set for this port")
         else:
-            npids = list(df.connected_ports(pid))
+            npids = self.connected_ports(pid)
             if len(npids) == 0:
                 raise KeyError("lonely in_port not set")
             elif len(npids) == 1:
                 return self.get_data(npids[0])
             else:
-                npids.sort(self.cmp_port_priority)
                 return [self.get_data(pid) for pid in npids]
 
     def set_data(self, pid, data):
@@ -146,3 +205,53 @@ class DataflowState(object):
             - data (any)
         """
         self._state[pid] = data
+        self._stamp += 1
+        self._stamps[pid] = self._stamp
+
+    def get_stamp(self, pid):
+        """ Return the stamp of the data on a port, None if no data.
+
+        For an input port connected to other ports, return the stamp of
+        the most recent data among them.
+
+        args:
+            - pid (pid): id of port either in or out
+        """
+        if pid in self._stamps:
+            return self._stamps[pid]
+        if self._dataflow.is_out_port(pid):
+            return None
+
+        stamps = [self._stamps.get(npid) for npid in self.connected_ports(pid)]
+        if len(stamps) == 0 or None in stamps:
+            return None
+        return max(stamps)
+
+    def get_substate(self, vid, create):
+        """ Return the state used to evaluate the actor of
+        vid when it is itself a dataflow (e.g. a CompositeNode).
+
+        args:
+            - vid (vid): id of vertex
+            - create (callable): returns a new state if none is
+                                 associated to vid yet
+        """
+        try:
+            return self._substates[vid]
+        except KeyError:
+            substate = self._substates[vid] = create()
+            return substate
+
+    def get_last_evaluation(self, vid):
+        """ Return the stamp of the last evaluation of a node
+        or None if it has not been evaluated with this state.
+        """
+        return self._evaluations.get(vid)
+
+    def set_evaluated(self, vid):
+        """ Record the evaluation of a node.
+
+        Data set after this call have greater stamps.
+        """
+        self._stamp += 1
+        self._evaluations[vid] = self._stamp
@@ -37,6 +37,15 @@ def notify_decorator(f):
     return wrapped
 
 
+class LazyData(object):
+    """ Value of the data pool which is loaded on first access
+    (e.g. stored in a session, see sessionstore) """
+
+    def load(self):
+        """ Return the value """
+        raise NotImplementedError()
+
+
 class DataPool(Observed, dict):
     """ Dictionnary of session data """
 
@@ -51,6 +60,33 @@ class DataPool(Observed, dict):
         DataPool.__delitem__ = notify_decorator(dict.__delitem__)
         DataPool.clear = notify_decorator(dict.clear)
 
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, LazyData):
+            value = value.load()
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def itervalues(self):
+        for key in self:
+            yield self[key]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def iteritems(self):
+        for key in self:
+            yield key, self[key]
+
     def add_data(self, key, instance):
         """ Add an instance referenced by key to the data pool """
 
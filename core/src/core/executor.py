@@ -0,0 +1,152 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module defines the executors used to evaluate nodes concurrently.
+
+A ThreadExecutor runs evaluation tasks in a pool of threads.
+A ProcessExecutor additionally ships the computation of pure nodes
+(i.e. nodes whose factory declares `pure=True`) to a pool of worker
+processes, so that CPU bound nodes can use several cores.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import cPickle
+from cStringIO import StringIO
+from multiprocessing import Pool, cpu_count
+from multiprocessing.pool import ThreadPool
+
+
+def is_pure(node):
+    """ Return True if the node can be evaluated in another process.
+
+    A node is pure if its factory declares it with `pure=True`: its
+    __call__ only depends on its inputs and both the node and its
+    inputs/outputs can be pickled.
+    """
+    factory = getattr(node, 'factory', None)
+    return bool(getattr(factory, 'pure', False))
+
+
+def dumps_call(node, inputs):
+    """ Pickle the node and its inputs to be called in another process.
+
+    The node is pickled with Node.__getstate__. The references to
+    its factory and to its composite node are not sent: they are
+    not needed to call the node and the composite node would drag
+    the whole graph along.
+    """
+    excluded = set(id(obj) for obj in (node.factory, node._composite_node)
+                   if obj is not None)
+
+    def persistent_id(obj):
+        if id(obj) in excluded:
+            return 'excluded'
+        return None
+
+    f = StringIO()
+    pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump((node, inputs))
+    return f.getvalue()
+
+
+def loads_call(data):
+    """ Return the (node, inputs) pickled by dumps_call """
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = lambda pid: None
+    return unpickler.load()
+
+
+def remote_call(data):
+    """ Worker function: call a node pickled by dumps_call """
+    node, inputs = loads_call(data)
+    return node.__call__(inputs)
+
+
+class ThreadExecutor(object):
+    """ Evaluate tasks in a pool of threads """
+
+    def __init__(self, nb_workers=None):
+        """
+        :param nb_workers: number of threads, one per cpu if None
+        """
+        if not nb_workers:
+            try:
+                nb_workers = cpu_count()
+            except NotImplementedError:
+                nb_workers = 1
+        self.nb_workers = nb_workers
+        self._pool = None
+
+    def apply_async(self, func, args=(), callback=None):
+        """ Call func(*args) in a worker thread.
+
+        callback is called with the result.
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self.nb_workers)
+        return self._pool.apply_async(func, args, callback=callback)
+
+    def eval_node(self, node):
+        """ Evaluate the node (i.e. call node.eval) """
+        return node.eval()
+
+    def close(self):
+        """ Wait for the pending tasks and release the workers """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class ProcessExecutor(ThreadExecutor):
+    """ Evaluate pure nodes in a pool of processes.
+
+    Tasks are still dispatched to threads, which wait for the worker
+    processes. Node inputs are set, and outputs and notifications are
+    handled in the calling process, only the call itself is remote.
+    Nodes which are not pure are evaluated in the calling process.
+
+    Each remote call keeps its thread blocked until the worker process
+    returns: at most nb_workers nodes are evaluated at once, by the
+    processes or by the threads for the nodes which are not pure, hence a
+    thread evaluating a slow impure node leaves a worker process idle.
+    """
+
+    def __init__(self, nb_workers=None):
+        ThreadExecutor.__init__(self, nb_workers)
+        self._processes = None
+
+    def call(self, node, inputs):
+        """ Call the node with inputs in a worker process """
+        if self._processes is None:
+            self._processes = Pool(self.nb_workers)
+        data = dumps_call(node, inputs)
+        return self._processes.apply(remote_call, (data, ))
+
+    def eval_node(self, node):
+        if not is_pure(node):
+            return node.eval()
+        return node.eval(call=lambda inputs: self.call(node, inputs))
+
+    def close(self):
+        ThreadExecutor.close(self)
+        if self._processes is not None:
+            self._processes.close()
+            self._processes.join()
+            self._processes = None
+
+
+executors = dict(thread=ThreadExecutor, process=ProcessExecutor)
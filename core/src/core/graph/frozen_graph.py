@@ -0,0 +1,276 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+############################################################################
+"""This module provide a read only snapshot of the topology of a graph,
+stored in compressed sparse row (CSR) arrays.
+
+The edges and neighbors of the vertex of index i are stored in
+values[offsets[i]:offsets[i + 1]], hence the traversals use no dict, set or
+per call allocation::
+
+    snap = graph.snapshot()
+    for i, vid in enumerate(snap.vids):
+        for k in xrange(snap.out_offsets[i], snap.out_offsets[i + 1]):
+            target = snap.out_nbrs[k]
+
+The snapshot is valid while the graph is not modified (see
+Graph.topology_version), Graph.snapshot builds a new one on demand.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from array import array
+
+from interface.graph import InvalidEdge, InvalidVertex
+
+
+def csr(lists):
+    """ Return the (offsets, values) arrays of a list of lists of ints """
+    offsets = [0]
+    values = []
+    nb = 0
+    for values_i in lists:
+        values.extend(values_i)
+        nb += len(values_i)
+        offsets.append(nb)
+    return array('i', offsets), array('i', values)
+
+
+def unique(values):
+    """ Return the sorted list of the distinct values """
+    if len(values) < 2:
+        return values
+    return sorted(set(values))
+
+
+def index_array(ids):
+    """ Return the array of the position of each id in ids, -1 for the
+    missing ids """
+    index = [-1] * (max(ids) + 1 if ids else 0)
+    for i, id in enumerate(ids):
+        index[id] = i
+    return array('i', index)
+
+
+class FrozenGraph(object):
+    """Read only snapshot of a graph:
+        - vids: sorted vertex ids, a vertex is identified by its index
+          in vids
+        - in_eids/out_eids: edge ids, sorted, of each vertex
+        - in_nbrs/out_nbrs: neighbor ids, sorted and unique, of each vertex
+        - sources/targets: vertex ids of each edge id (-1 if not an edge)
+    """
+
+    def __init__(self, graph):
+        """
+        :param graph: the graph (Graph concept) to copy
+        :type graph: Graph
+        """
+        self.graph = graph
+        self.version = graph.topology_version()
+
+        vids = sorted(graph.vertices())
+        self.vids = array('i', vids)
+        self._index = index = index_array(vids)
+
+        # (source, target) of the edges
+        ends = getattr(graph, '_edges', None)
+        if ends is None:
+            ends = dict((eid, (graph.source(eid), graph.target(eid)))
+                        for eid in graph.edges())
+        eids = sorted(ends)
+        self.eids = array('i', eids)
+        size = eids[-1] + 1 if eids else 0
+        sources = [-1] * size
+        targets = [-1] * size
+        ins = [[] for vid in vids]
+        outs = [[] for vid in vids]
+        for eid in eids:
+            source, target = ends[eid]
+            sources[eid] = source
+            targets[eid] = target
+            outs[index[source]].append(eid)
+            ins[index[target]].append(eid)
+        self.sources = array('i', sources)
+        self.targets = array('i', targets)
+
+        self.in_offsets, self.in_eids = csr(ins)
+        self.out_offsets, self.out_eids = csr(outs)
+        self.in_nbr_offsets, self.in_nbrs = csr(
+            unique([sources[eid] for eid in eids_i]) for eids_i in ins)
+        self.out_nbr_offsets, self.out_nbrs = csr(
+            unique([targets[eid] for eid in eids_i]) for eids_i in outs)
+
+        self._order = None
+
+    def is_valid(self):
+        """ Return True if the graph has not been modified since the
+        snapshot """
+        return self.version == self.graph.topology_version()
+
+    def index(self, vid):
+        """ Return the index of vid in vids """
+        try:
+            i = self._index[vid] if vid >= 0 else -1
+        except (IndexError, TypeError):
+            i = -1
+        if i < 0:
+            raise InvalidVertex(vid)
+        return i
+
+    # Graph concept
+    def source(self, eid):
+        try:
+            vid = self.sources[eid] if eid >= 0 else -1
+        except (IndexError, TypeError):
+            vid = -1
+        if vid < 0:
+            raise InvalidEdge(eid)
+        return vid
+
+    def target(self, eid):
+        self.source(eid)
+        return self.targets[eid]
+
+    def __contains__(self, vid):
+        return self.has_vertex(vid)
+
+    def has_vertex(self, vid):
+        try:
+            return vid >= 0 and self._index[vid] >= 0
+        except (IndexError, TypeError):
+            return False
+
+    def has_edge(self, eid):
+        try:
+            return eid >= 0 and self.sources[eid] >= 0
+        except (IndexError, TypeError):
+            return False
+
+    # Vertex list graph concept
+    def vertices(self):
+        return iter(self.vids)
+
+    def __iter__(self):
+        return iter(self.vids)
+
+    def nb_vertices(self):
+        return len(self.vids)
+
+    def __len__(self):
+        return len(self.vids)
+
+    def in_neighbors(self, vid):
+        i = self.index(vid)
+        return self.in_nbrs[self.in_nbr_offsets[i]:self.in_nbr_offsets[i + 1]]
+
+    def out_neighbors(self, vid):
+        i = self.index(vid)
+        offsets = self.out_nbr_offsets
+        return self.out_nbrs[offsets[i]:offsets[i + 1]]
+
+    def nb_in_neighbors(self, vid):
+        i = self.index(vid)
+        return self.in_nbr_offsets[i + 1] - self.in_nbr_offsets[i]
+
+    def nb_out_neighbors(self, vid):
+        i = self.index(vid)
+        return self.out_nbr_offsets[i + 1] - self.out_nbr_offsets[i]
+
+    # Edge list graph concept
+    def edges(self, vid=None):
+        if vid is None:
+            return iter(self.eids)
+        return iter(self.in_edges(vid) + self.out_edges(vid))
+
+    def nb_edges(self, vid=None):
+        if vid is None:
+            return len(self.eids)
+        return self.nb_in_edges(vid) + self.nb_out_edges(vid)
+
+    def in_edges(self, vid):
+        i = self.index(vid)
+        return self.in_eids[self.in_offsets[i]:self.in_offsets[i + 1]]
+
+    def out_edges(self, vid):
+        i = self.index(vid)
+        return self.out_eids[self.out_offsets[i]:self.out_offsets[i + 1]]
+
+    def nb_in_edges(self, vid):
+        i = self.index(vid)
+        return self.in_offsets[i + 1] - self.in_offsets[i]
+
+    def nb_out_edges(self, vid):
+        i = self.index(vid)
+        return self.out_offsets[i + 1] - self.out_offsets[i]
+
+    # Algorithms
+    def leaves(self):
+        """ Return the list of the vertices without out edges """
+        offsets = self.out_offsets
+        return [vid for i, vid in enumerate(self.vids)
+                if offsets[i] == offsets[i + 1]]
+
+    def topological_order(self):
+        """ Return the list of the vertices, each one after its in
+        neighbors. The vertices in a cycle are at the end. """
+        if self._order is not None:
+            return self._order
+
+        index = self._index
+        offsets, nbrs = self.out_nbr_offsets, self.out_nbrs
+        in_offsets = self.in_nbr_offsets
+        nb_parents = array('i', (in_offsets[i + 1] - in_offsets[i]
+                                 for i in xrange(len(self.vids))))
+        ready = [vid for i, vid in enumerate(self.vids)
+                 if not nb_parents[i]]
+        ready.reverse()
+        order = []
+        while ready:
+            vid = ready.pop()
+            order.append(vid)
+            i = index[vid]
+            for k in xrange(offsets[i], offsets[i + 1]):
+                j = index[nbrs[k]]
+                nb_parents[j] -= 1
+                if not nb_parents[j]:
+                    ready.append(nbrs[k])
+
+        if len(order) < len(self.vids):
+            order.extend(vid for i, vid in enumerate(self.vids)
+                         if nb_parents[i] > 0)
+        self._order = order
+        return order
+
+    def _reached(self, vid, offsets, nbrs):
+        index = self._index
+        visited = set([vid])
+        front = [self.index(vid)]
+        while front:
+            i = front.pop()
+            for k in xrange(offsets[i], offsets[i + 1]):
+                nid = nbrs[k]
+                if nid not in visited:
+                    visited.add(nid)
+                    front.append(index[nid])
+        return visited
+
+    def ancestors(self, vid):
+        """ Return the set of the vertices upstream of vid, vid included """
+        return self._reached(vid, self.in_nbr_offsets, self.in_nbrs)
+
+    def descendants(self, vid):
+        """ Return the set of the vertices downstream of vid, vid included
+        """
+        return self._reached(vid, self.out_nbr_offsets, self.out_nbrs)
@@ -26,6 +26,7 @@ from interface.graph import InvalidEdge, InvalidVertex, IGraph, \
                     IMutableVertexGraph, IMutableEdgeGraph, \
                     IExtendGraph
 from id_generator import IdGenerator
+from frozen_graph import FrozenGraph
 
 
 class Graph (IGraph,
@@ -37,6 +38,8 @@ class Graph (IGraph,
         - edges are tuple of source,target
 
     """
+    # class of the snapshots of the topology
+    snapshot_class = FrozenGraph
 
     def __init__(self, graph=None):
         """
@@ -50,6 +53,8 @@ class Graph (IGraph,
         self._edges = {}
         self._vid_generator = IdGenerator()
         self._eid_generator = IdGenerator()
+        # incremented each time the topology is modified
+        self._topology_version = 0
         if graph is not None:
             dummy = self.extend(graph)
 
@@ -89,6 +94,44 @@ class Graph (IGraph,
         return True
     is_valid.__doc__=IGraph.is_valid.__doc__
 
+    def __getstate__(self):
+        odict = self.__dict__.copy()
+        odict.pop('_snapshot', None)
+        return odict
+
+    # ##########################################################
+    #
+    # Topology snapshot
+    #
+    # ##########################################################
+
+    def topology_version(self):
+        """
+        number identifying the current topology of the graph
+
+        It changes each time a vertex or an edge is added or removed
+        (and a port or an actor for a DataFlow).
+        :rtype: int
+        """
+        return self._topology_version
+
+    def topology_modified(self):
+        """
+        signal that the topology of the graph has been modified
+        """
+        self._topology_version += 1
+
+    def snapshot(self):
+        """
+        read only copy of the topology stored in compact arrays,
+        built again on demand once the graph is modified
+        :rtype: FrozenGraph
+        """
+        snap = self.__dict__.get('_snapshot')
+        if snap is None or not snap.is_valid():
+            snap = self._snapshot = self.snapshot_class(self)
+        return snap
+
     # ##########################################################
     #
     # Vertex List Graph Concept
@@ -213,6 +256,7 @@ class Graph (IGraph,
     def add_vertex(self, vid=None):
         vid=self._vid_generator.get_id(vid)
         self._vertices[vid]=(set(), set())
+        self.topology_modified()
         return vid
     add_vertex.__doc__=IMutableVertexGraph.add_vertex.__doc__
 
@@ -226,6 +270,7 @@ class Graph (IGraph,
             self.remove_edge(edge)
         del self._vertices[vid]
         self._vid_generator.release_id(vid)
+        self.topology_modified()
     remove_vertex.__doc__=IMutableVertexGraph.remove_vertex.__doc__
 
     def clear(self):
@@ -233,6 +278,7 @@ class Graph (IGraph,
         self._edges.clear()
         self._vid_generator=IdGenerator()
         self._eid_generator=IdGenerator()
+        self.topology_modified()
     clear.__doc__=IMutableVertexGraph.clear.__doc__
 
     # ##########################################################
@@ -251,6 +297,7 @@ class Graph (IGraph,
         self._edges[eid]=(vs, vt)
         self._vertices[vs][1].add(eid)
         self._vertices[vt][0].add(eid)
+        self.topology_modified()
         return eid
     add_edge.__doc__=IMutableEdgeGraph.add_edge.__doc__
 
@@ -262,11 +309,13 @@ class Graph (IGraph,
         self._vertices[vt][0].remove(eid)
         del self._edges[eid]
         self._eid_generator.release_id(eid)
+        self.topology_modified()
     remove_edge.__doc__=IMutableEdgeGraph.remove_edge.__doc__
 
     def clear_edges(self):
         self._edges.clear()
         self._eid_generator=IdGenerator()
+        self.topology_modified()
     clear_edges.__doc__=IMutableEdgeGraph.clear_edges.__doc__
 
     # ##########################################################
@@ -275,18 +324,25 @@ class Graph (IGraph,
     #
     # ##########################################################
 
+    def reserve_vertices(self, vids):
+        """Reserve the vertex ids vids in a single operation, the vertices
+        are then created by add_vertex(vid)"""
+        self._vid_generator.reserve_ids(vids)
+
     def extend(self, graph):
-        #vertex adding
+        #vertex adding, all the ids are reserved at once
+        vids=self._vid_generator.get_ids(graph.nb_vertices(), reserve=True)
         trans_vid={}
-        for vid in graph.vertices():
-            trans_vid[vid]=self.add_vertex()
+        for vid, new_vid in zip(graph.vertices(), vids):
+            trans_vid[vid]=self.add_vertex(new_vid)
 
         #edge adding
+        eids=self._eid_generator.get_ids(graph.nb_edges(), reserve=True)
         trans_eid={}
-        for eid in graph.edges():
+        for eid, new_eid in zip(graph.edges(), eids):
             sid=trans_vid[graph.source(eid)]
             tid=trans_vid[graph.target(eid)]
-            trans_eid[eid]=self.add_edge(edge=(sid, tid))
+            trans_eid[eid]=self.add_edge((sid, tid), new_eid)
 
         return trans_vid, trans_eid
     extend.__doc__=IExtendGraph.extend.__doc__
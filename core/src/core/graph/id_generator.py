@@ -23,37 +23,125 @@ __license__= "Cecill-C"
 __revision__=" $Id$ "
 
 
+from heapq import heappush, heappop
+
+
 class IdGenerator(object):
+    """Generate unique ids, reusing released ids lowest first.
+
+    Free ids are stored as a heap of half-open intervals [start, end) so that
+    both an explicit high id (which leaves a hole) and a released id cost
+    O(log n), without allocating every id of the hole. Ids explicitly taken
+    inside a free interval are removed lazily when the interval is popped.
+
+    Ids reserved in bulk (see reserve_ids) are used, but each one can still
+    be taken once by get_id(id).
+    """
 
     def __init__(self):
-        self._id_max=0
-        self._id_list=[]
+        self._id_max = 0
+        self._used = set()
+        self._free = []  # heap of (start, end) free intervals
+        self._reserved = set()
+
+    def _pop_free(self):
+        """Return the lowest free id lower than _id_max or None"""
+        free = self._free
+        used = self._used
+        while free:
+            start, end = heappop(free)
+            while start < end and start in used:
+                start += 1
+            if start < end:
+                if start + 1 < end:
+                    heappush(free, (start + 1, end))
+                return start
+        return None
 
     def get_id(self, id=None):
+        used = self._used
         if id is None:
-            if len(self._id_list)==0:
-                ret=self._id_max
-                self._id_max+=1
-                return ret
-            else:
-                return self._id_list.pop()
+            ret = self._pop_free()
+            if ret is None:
+                ret = self._id_max
+                self._id_max += 1
+            used.add(ret)
+            return ret
         else:
-            if id>=self._id_max:
-                self._id_list.extend(range(self._id_max, id))
-                self._id_max=id+1
-                return id
-            else:
-                try:
-                    ind=self._id_list.index(id)
-                    del self._id_list[ind]
+            if id >= self._id_max:
+                if id > self._id_max:
+                    heappush(self._free, (self._id_max, id))
+                self._id_max = id + 1
+            elif id in used:
+                if id in self._reserved:
+                    self._reserved.remove(id)
                     return id
-                except ValueError:
-                    raise IndexError("id %d already used" % id)
+                raise IndexError("id %d already used" % id)
+            used.add(id)
+            return id
+
+    def get_ids(self, nb, reserve=False):
+        """Return a list of nb new ids
+
+        If reserve is True, the ids are also reserved (see reserve_ids).
+        """
+        used = self._used
+        ids = []
+        while len(ids) < nb:
+            id = self._pop_free()
+            if id is None:
+                break
+            used.add(id)
+            ids.append(id)
+        nb -= len(ids)
+        if nb > 0:
+            ids.extend(xrange(self._id_max, self._id_max + nb))
+            used.update(ids[-nb:])
+            self._id_max += nb
+        if reserve:
+            self._reserved.update(ids)
+        return ids
+
+    def reserve_ids(self, ids):
+        """Mark all ids as used in a single operation, each one can then be
+        taken once by get_id(id)
+
+        Raise an IndexError, and reserve nothing, if one of them is already
+        used.
+        """
+        ids = set(ids)
+        if not ids:
+            return
+        used = self._used
+        if not used.isdisjoint(ids):
+            id = min(used & ids)
+            raise IndexError("id %d already used" % id)
+
+        id_max = max(ids)
+        if id_max >= self._id_max:
+            if id_max > self._id_max:
+                heappush(self._free, (self._id_max, id_max))
+            self._id_max = id_max + 1
+        used.update(ids)
+        self._reserved.update(ids)
 
     def release_id(self, id):
-        if id>self._id_max:
+        if id >= self._id_max:
             raise IndexError("id out of range")
-        elif id in self._id_list:
+        elif id not in self._used:
             raise IndexError("id already not used")
         else:
-            self._id_list.append(id)
+            self._used.remove(id)
+            self._reserved.discard(id)
+            heappush(self._free, (id, id + 1))
+
+    def __setstate__(self, state):
+        if '_id_list' in state:
+            # generator pickled by older versions
+            id_max = state['_id_max']
+            free = set(state['_id_list'])
+            state = dict(_id_max=id_max,
+                         _used=set(i for i in xrange(id_max) if i not in free),
+                         _free=[(i, i + 1) for i in sorted(free)])
+        state.setdefault('_reserved', set())
+        self.__dict__.update(state)
@@ -0,0 +1,310 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module defines lazy factories built from a static parse of wralea files.
+
+parse_wralea reads a __wralea__.py file with the ast module, without
+importing it, and returns a module-like object whose factories are
+LazyFactory instances. A LazyFactory only knows the metadata of the factory
+(name, category, description, inputs, outputs...). The wralea module is
+imported the first time the factory is really used (instantiate, get_tip,
+or any attribute which is not part of the metadata): the LazyFactory then
+becomes the factory defined in the module.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import ast
+import sys
+
+from openalea.core.node import AbstractFactory
+from openalea.core.pkgindex import file_key
+from openalea.core import logger
+
+# factory constructors understood by the parser: {name: kind}
+factory_kinds = dict(Factory='node',
+                     NodeFactory='node',
+                     CompositeNodeFactory='composite')
+
+# attributes set by the constructors of the factories {kind: names}
+factory_attributes = dict(
+    node=set(['nodemodule_name', 'nodeclass_name', 'widgetmodule_name',
+              'widgetclass_name', 'toscriptclass_name', 'nodeclass',
+              'src_cache', 'nodemodule_path', 'search_path', 'module_cache',
+              'nodemodule']),
+    composite=set(['elt_factory', 'connections', 'elt_data', 'elt_value',
+                   'elt_ad_hoc', 'eval_algo', 'horizon', 'doc']))
+
+# wralea modules imported by lazy factories {(filename, file key): module}
+_modules = {}
+
+
+class LazyFactory(AbstractFactory):
+    """ Factory which imports its wralea module on first use """
+
+    def __init__(self, kind, wralea, varname, **kargs):
+        """
+        :param kind: 'node' or 'composite'
+        :param wralea: filename of the wralea module defining the factory
+        :param varname: name of the factory in the wralea module
+        :param kargs: metadata passed to the factory constructor
+        """
+        AbstractFactory.__init__(self, **kargs)
+        self.lazy_kind = kind
+        self.lazy_wralea = wralea
+        self.lazy_varname = varname
+        # the module is imported again if the file has been modified
+        self.lazy_key = file_key(wralea)
+
+    def is_node(self):
+        return self.lazy_kind == 'node'
+
+    def is_composite_node(self):
+        return self.lazy_kind == 'composite'
+
+    def is_valid(self):
+        return True
+
+    def lazy_class(self):
+        """ Return the class of the factory once loaded """
+        if self.lazy_kind == 'node':
+            from openalea.core.node import NodeFactory
+            return NodeFactory
+        else:
+            from openalea.core.compositenode import CompositeNodeFactory
+            return CompositeNodeFactory
+
+    def load(self):
+        """ Import the wralea module and become the factory it defines.
+
+        Return self.
+        """
+        from openalea.core.package import PyPackageReaderWralea
+
+        key = (self.lazy_wralea, self.lazy_key)
+        module = _modules.get(key)
+        if module is None:
+            module = PyPackageReaderWralea(self.lazy_wralea).import_module()
+            _modules[key] = module
+        factory = module.__dict__[self.lazy_varname]
+        if isinstance(factory, LazyFactory):
+            raise TypeError("%s is not a factory" % self.lazy_varname)
+
+        logger.debug("Load factory %s from %s" % (self.name, self.lazy_wralea))
+        # keep the listeners and the package of the proxy
+        state = dict(factory.__dict__)
+        for k in self.__dict__:
+            if k in ('listeners', '_listeners') or \
+                    k.startswith('_Observed') or \
+                    k.startswith('__pkg'):
+                state.pop(k, None)
+        for k in ('lazy_kind', 'lazy_wralea', 'lazy_varname', 'lazy_key'):
+            del self.__dict__[k]
+        self.__dict__.update(state)
+        self.__class__ = factory.__class__
+        return self
+
+    def __getattr__(self, name):
+        # only called for missing attributes: load the factory if name is
+        # an attribute of the real factory
+        if name.startswith('__') or name.startswith('lazy_') or \
+                'lazy_kind' not in self.__dict__:
+            raise AttributeError(name)
+        if name not in factory_attributes[self.lazy_kind] and \
+                not hasattr(self.lazy_class(), name):
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def get_tip(self, *args, **kargs):
+        return self.load().get_tip(*args, **kargs)
+
+    def get_documentation(self):
+        return self.load().get_documentation()
+
+    def instantiate(self, *args, **kargs):
+        return self.load().instantiate(*args, **kargs)
+
+    def instantiate_widget(self, *args, **kargs):
+        return self.load().instantiate_widget(*args, **kargs)
+
+    def get_writer(self):
+        return self.load().get_writer()
+
+    def copy(self, **args):
+        return self.load().copy(**args)
+
+    def clean_files(self):
+        return self.load().clean_files()
+
+
+class ParseError(Exception):
+    """ The wralea file can not be statically parsed """
+    pass
+
+
+def _value(node):
+    """ Return the value of an ast node for the factory metadata.
+
+    Literals are evaluated, names and calls (e.g. interfaces) are replaced
+    by their name. Raise ParseError for other expressions.
+    """
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        pass
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return node.func.id
+    if isinstance(node, ast.List):
+        return [_value(elt) for elt in node.elts]
+    if isinstance(node, ast.Tuple):
+        return tuple(_value(elt) for elt in node.elts)
+    if isinstance(node, ast.Dict):
+        return dict((_value(k), _value(v))
+                    for k, v in zip(node.keys, node.values))
+    raise ParseError(ast.dump(node))
+
+
+def _port_desc(node):
+    """ Return a list of port descriptions (dict) from an ast node """
+    if isinstance(node, (ast.List, ast.Tuple)):
+        ports = []
+        for elt in node.elts:
+            if isinstance(elt, ast.Call) and isinstance(elt.func, ast.Name) \
+                    and elt.func.id == 'dict' and not elt.args:
+                port = {}
+                for kw in elt.keywords:
+                    try:
+                        port[kw.arg] = _value(kw.value)
+                    except ParseError:
+                        pass
+                ports.append(port)
+            else:
+                ports.append(_value(elt))
+        return ports
+    return _value(node)
+
+
+def _factory_args(call):
+    """ Return the metadata of a factory from its constructor call """
+    if call.args or call.starargs or call.kwargs:
+        raise ParseError("positional arguments")
+    args = {}
+    for kw in call.keywords:
+        if kw.arg in ('inputs', 'outputs'):
+            args[kw.arg] = _port_desc(kw.value)
+        else:
+            try:
+                args[kw.arg] = _value(kw.value)
+            except ParseError:
+                # only needed by the real factory
+                pass
+    if not isinstance(args.get('name'), basestring):
+        raise ParseError("factory name")
+    return args
+
+
+def _factory_call(node):
+    """ Return the kind of factory created by an ast node or None """
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+        return factory_kinds.get(node.func.id)
+    return None
+
+
+class WraleaInfo(object):
+    """ Module-like object built by parse_wralea """
+
+    def __init__(self, filename, namespace):
+        self.__file__ = filename
+        self.__dict__.update(namespace)
+
+
+def parse_wralea(filename, modulename):
+    """ Statically parse a wralea file.
+
+    Return a module-like object defining the metadata variables of the
+    module (__name__, __version__, __all__...) and a LazyFactory for each
+    factory in __all__. Return None if the file can not be understood
+    without importing it (the factories are computed, they are modified
+    after their creation, there are data factories...).
+
+    :param filename: the wralea file
+    :param modulename: the name used to import the wralea module, default
+        value of __name__
+    """
+    try:
+        f = open(filename)
+        try:
+            source = f.read()
+        finally:
+            f.close()
+        module = ast.parse(source, filename)
+    except (IOError, SyntaxError), e:
+        logger.warning("Cannot parse %s: %s" % (filename, e))
+        return None
+
+    namespace = {'__name__': modulename}
+    factories = {}
+    aliases = []
+    try:
+        for stmt in module.body:
+            if isinstance(stmt, (ast.Import, ast.ImportFrom, ast.FunctionDef,
+                                 ast.ClassDef, ast.Pass)):
+                continue
+            elif isinstance(stmt, ast.Expr):
+                value = stmt.value
+                if isinstance(value, ast.Str):
+                    continue
+                if isinstance(value, ast.Call) and \
+                        isinstance(value.func, ast.Name) and \
+                        value.func.id == 'Alias' and len(value.args) == 2 and \
+                        isinstance(value.args[0], ast.Name) and \
+                        isinstance(value.args[1], ast.Str):
+                    aliases.append((value.args[0].id, value.args[1].s))
+                    continue
+                raise ParseError("expression line %d" % stmt.lineno)
+            elif isinstance(stmt, ast.Assign):
+                if len(stmt.targets) != 1 or \
+                        not isinstance(stmt.targets[0], ast.Name):
+                    raise ParseError("assignment line %d" % stmt.lineno)
+                name = stmt.targets[0].id
+                factories.pop(name, None)
+                kind = _factory_call(stmt.value)
+                if kind is not None:
+                    factories[name] = (kind, _factory_args(stmt.value))
+                elif name.startswith('__') and name.endswith('__'):
+                    namespace[name] = ast.literal_eval(stmt.value)
+            else:
+                raise ParseError("statement line %d" % stmt.lineno)
+
+        all_names = namespace.get('__all__', [])
+        for name in all_names:
+            if name not in factories:
+                raise ParseError("%s is not a factory" % name)
+    except (ParseError, ValueError), e:
+        logger.debug("%s is imported: %s" % (filename, e))
+        return None
+
+    for name, alias in aliases:
+        if name in factories:
+            kind, args = factories[name]
+            args['alias'] = list(args.get('alias') or []) + [alias]
+
+    for name in all_names:
+        kind, args = factories[name]
+        namespace[name] = LazyFactory(kind, filename, name, **args)
+
+    return WraleaInfo(filename, namespace)
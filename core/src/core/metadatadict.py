@@ -21,10 +21,34 @@ __revision__ = " $Id$ "
 from openalea.core import observer
 import types
 
+# types of the slots, shared by the dictionaries created from the same slots
+# {id(slots): (slots, {name: type})}
+_slot_types = {}
+
+
+def shared_slot_types(slots):
+    """ Return the {name: type} dict of slots, shared by all its users """
+    entry = _slot_types.get(id(slots))
+    if entry is None or entry[0] is not slots:
+        entry = (slots, dict((name, typ) for name, (typ, val)
+                             in slots.iteritems()))
+        _slot_types[id(slots)] = entry
+    return entry[1]
+
+
 class MetaDataDict(observer.Observed):
     """Attach meta data of a graphical representation
     of a graph component. This metadata can be
     used to customize the appearance of the node."""
+
+    __doTypeChecking = False
+    # _metaTypes is shared with other dicts, see _own_types
+    __sharedTypes = False
+    # incremented each time the position of this dict is set: the evaluation
+    # algorithms sort the parents of an input port by position (see
+    # ExecutionPlan)
+    position_version = 0
+
     def __init__(self, **kwargs):
         """Use kwargs to construct the dictionnary.
         Supported keywords are :
@@ -37,7 +61,6 @@ class MetaDataDict(observer.Observed):
         observer.Observed.__init__(self)
         self._metaValues = {}
         self._metaTypes = {}
-        self.__doTypeChecking = False
 
         if kwargs.get("dict", False):
             values = kwargs.get("dict")
@@ -64,13 +87,24 @@ class MetaDataDict(observer.Observed):
         # self._metaValues = other._metaValues.copy()
         # self._metaTypes = other._metaTypes.copy()
         self._metaValues.update(other._metaValues.copy())
-        self._metaTypes.update(other._metaTypes.copy())
+        self._own_types().update(other._metaTypes)
+
+    def _own_types(self):
+        """ Return _metaTypes, copied first if it is shared """
+        if self.__sharedTypes:
+            self._metaTypes = self._metaTypes.copy()
+            self.__sharedTypes = False
+        return self._metaTypes
 
     def set_slots(self, slots, useSlotDefaults=True):
-        for name, value in slots.iteritems():
-            typ, val = value
-            self._metaTypes[name] = typ
-            if useSlotDefaults :
+        if not self._metaTypes:
+            # the types are only copied when they are modified
+            self._metaTypes = shared_slot_types(slots)
+            self.__sharedTypes = True
+        else:
+            self._own_types().update(shared_slot_types(slots))
+        if useSlotDefaults :
+            for name, (typ, val) in slots.iteritems():
                 self._metaValues[name] = val
 
     def __repr__(self):
@@ -91,7 +125,7 @@ class MetaDataDict(observer.Observed):
         if key in self._metaTypes :
             raise Exception("This key already exists : " + key)
 
-        self._metaTypes[key] = valType
+        self._own_types()[key] = valType
         if(notify):
             self.notify_listeners(("metadata_added", key, valType))
         return
@@ -104,7 +138,7 @@ class MetaDataDict(observer.Observed):
 
         if valType and (self._metaTypes[key] != valType): raise Exception("Type mismatch.")
 
-        del self._metaTypes[key]
+        del self._own_types()[key]
         del self._metaValues[key]
         if(notify):
             self.notify_listeners(("metadata_removed", key, valType))
@@ -123,6 +157,8 @@ class MetaDataDict(observer.Observed):
                   " assuming duck-typing"
 
         self._metaValues[key] = value
+        if key == "position":
+            self.position_version += 1
         if(notify):
             self.notify_listeners(("metadata_changed", key, value, valType))
         return
@@ -182,8 +218,14 @@ class HasAdHoc(object):
             cls.__ad_hoc_from_old_map__[name] = args
 
     def __init__(self):
-        self.__ad_hoc_dict = MetaDataDict(slots= {} if not hasattr(self,'__ad_hoc_slots__') else self.__ad_hoc_slots__)
+        # the ad hoc dict is created on first use
+        pass
 
     def get_ad_hoc_dict(self):
-        return self.__ad_hoc_dict
+        try:
+            return self.__ad_hoc_dict
+        except AttributeError:
+            slots = getattr(self, '__ad_hoc_slots__', None) or {}
+            self.__ad_hoc_dict = MetaDataDict(slots=slots)
+            return self.__ad_hoc_dict
 
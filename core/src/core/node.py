@@ -35,10 +35,11 @@ from weakref import ref, proxy
 
 # from signature import get_parameters
 import signature as sgn
-from observer import Observed, AbstractListener
+from observer import Observed, AbstractListener, notifications_enabled
 from actor import IActor
 from metadatadict import MetaDataDict, HasAdHoc
 from interface import TypeNameInterfaceMap
+from cache import get_output_cache
 # Exceptions
 class RecursionError (Exception):
     """todo"""
@@ -107,6 +108,16 @@ class AbstractNode(Observed, HasAdHoc):
     def set_compositenode(self, upper):
         self._composite_node = proxy(upper)
 
+    def propagate_dirty(self):
+        """ Mark the node, and the nodes downstream of it, as dirty
+        in the composite node (if any) """
+        upper = self._composite_node
+        if upper is not None:
+            try:
+                upper.mark_dirty(self.get_id())
+            except (ReferenceError, AttributeError):
+                pass
+
     def set_data(self, key, value, notify=True):
         """ Set internal node data """
         self.internal_data[key] = value
@@ -255,6 +266,10 @@ class Node(AbstractNode):
     Inputs and Outpus are indexed by their position or by a name (str)
     """
 
+    # kinds of the events translated by is_deprecated_event
+    deprecated_events = frozenset(["caption_modified", "data_modified",
+                                   "internal_data_changed"])
+
     @staticmethod
     def is_deprecated_event(event):
         evLen = len(event)
@@ -302,10 +317,32 @@ class Node(AbstractNode):
         # Add delay
         self.internal_data["delay"] = 0
 
-        # Observed object to notify final nodes wich are continuously evaluated
-        self.continuous_eval = Observed()
+    def _get_continuous_eval(self):
+        try:
+            return self.__dict__['_continuous_eval']
+        except KeyError:
+            observed = self.__dict__['_continuous_eval'] = Observed()
+            return observed
+
+    def _set_continuous_eval(self, observed):
+        self.__dict__['_continuous_eval'] = observed
+
+    # Observed object to notify final nodes wich are continuously evaluated,
+    # created on first use
+    continuous_eval = property(_get_continuous_eval, _set_continuous_eval)
+
+    def notify_continuous_eval(self, event):
+        """ Notify the nodes which are continuously evaluated, if any """
+        observed = self.__dict__.get('_continuous_eval')
+        if observed is not None:
+            observed.notify_listeners(event)
 
     def notify_listeners(self, event):
+        if (not event or event[0] not in Node.deprecated_events or
+                not notifications_enabled()):
+            # no deprecated event translation in quiet mode
+            Observed.notify_listeners(self, event)
+            return
         txt, trevent = Node.is_deprecated_event(event)
         if txt:
             Observed.notify_listeners(self, trevent)
@@ -458,10 +495,11 @@ class Node(AbstractNode):
         This method is called when the input value has changed.
         """
         self.modified = True
+        self.propagate_dirty()
         index = self.map_index_in[index_key]
         if(notify):
             self.notify_listeners(("input_modified", index))
-            self.continuous_eval.notify_listeners(("node_modified",))
+            self.notify_continuous_eval(("node_modified",))
 
     # Declarations
     def set_io(self, inputs, outputs):
@@ -629,11 +667,14 @@ class Node(AbstractNode):
 
     # Functions used by the node evaluator
 
-    def eval(self):
+    def eval(self, call=None):
         """
         Evaluate the node by calling __call__
         Return True if the node needs a reevaluation
         and a timed delay if the node needs a reevaluation at a later time.
+
+        :param call: callable used instead of __call__ to compute the
+            outputs from the inputs (e.g. to run it in another process).
         """
         # lazy evaluation
         if self.block and self.get_nb_output() != 0 and self.output(0) is not None:
@@ -641,10 +682,19 @@ class Node(AbstractNode):
         if (self.delay == 0 and self.lazy) and not self.modified:
             return False
 
-        self.notify_listeners(("start_eval",))
+        # no events are built in a quiet_notifications block
+        notify = notifications_enabled()
+        if notify:
+            self.notify_listeners(("start_eval",))
 
         # Run the node
-        outlist = self.__call__(self.inputs)
+        if call is None:
+            call = self.__call__
+        cache = get_output_cache()
+        if cache is not None and cache.accept(self):
+            outlist = cache.call(self, call)
+        else:
+            outlist = call(self.inputs)
 
         # Copy outputs
         # only one output
@@ -657,7 +707,8 @@ class Node(AbstractNode):
             except TypeError:
                 self.outputs[0] = outlist
 
-            self.output_desc[0].notify_listeners(("tooltip_modified",))
+            if notify:
+                self.output_desc[0].notify_listeners(("tooltip_modified",))
 
         else: # multi output
             if(not isinstance(outlist, tuple) and
@@ -665,12 +716,14 @@ class Node(AbstractNode):
                 outlist = (outlist,)
 
             for i in range(min(len(outlist), len(self.outputs))):
-                self.output_desc[i].notify_listeners(("tooltip_modified",))
+                if notify:
+                    self.output_desc[i].notify_listeners(("tooltip_modified",))
                 self.outputs[i] = outlist[i]
 
         # Set State
         self.modified = False
-        self.notify_listeners(("stop_eval",))
+        if notify:
+            self.notify_listeners(("stop_eval",))
 
         if self.delay == 0:
             return False
@@ -683,7 +736,7 @@ class Node(AbstractNode):
         odict.update(AbstractNode.__getstate__(self))
 
         odict['modified'] = True
-
+        odict.pop('_continuous_eval', None)
 
         outputs = range(len(self.outputs))
         for i in range(self.get_nb_output()):
@@ -721,6 +774,8 @@ class Node(AbstractNode):
 
     def __setstate__(self, dict):
         self.__dict__.update(dict)
+        # continuous_eval was an attribute
+        self.__dict__.pop('continuous_eval', None)
 
         for port in self.input_desc:
             port.vertex = ref(self)
@@ -754,9 +809,10 @@ class Node(AbstractNode):
         """ Invalidate node """
 
         self.modified = True
+        self.propagate_dirty()
         self.notify_listeners(("input_modified", -1))
 
-        self.continuous_eval.notify_listeners(("node_modified", self))
+        self.notify_continuous_eval(("node_modified", self))
 
 # X     @property
 # X     def outputs(self):
@@ -816,6 +872,7 @@ class AbstractFactory(Observed):
                  view=None,
                  alias=None,
                  authors=None,
+                 pure=False,
                  **kargs):
         """
         Create a factory.
@@ -829,6 +886,8 @@ class AbstractFactory(Observed):
         :param view: custom view (default = None)
         :param alias: list of alias name
         :param authors: authors of the node. If Node, it should be replaced by the package authors.
+        :param pure: the node only depends on its inputs and can be pickled,
+            thus evaluated in another process (default = False)
 
         .. note:: inputs and outputs parameters are list of dictionnary such
 
@@ -853,6 +912,7 @@ class AbstractFactory(Observed):
         self.delay = delay
         self.alias = alias
         self.authors = authors
+        self.pure = pure
     # Package property
 
     def set_pkg(self, port):
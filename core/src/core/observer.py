@@ -32,19 +32,192 @@ if graphobserver:
     from openalea.grapheditor.observer import *
 else:
    import weakref
-   from collections import deque
+   import threading
+   from time import time
+   from collections import deque, OrderedDict
+   from contextlib import contextmanager
+
+
+   # event kinds of which only the last one is delivered by an observed_batch
+   coalesced_events = set([None, 'update', 'start_eval', 'stop_eval',
+                           'tooltip_modified', 'caption_modified',
+                           'status_modified', 'exception_state_changed',
+                           'graph_modified', 'connection_modified',
+                           'hiddenPortChange', 'node_modified', 'pool_modified',
+                           'value_changed'])
+
+   # event kinds coalesced according to their second element (port, key...)
+   keyed_events = set(['data_modified', 'input_modified', 'output_modified',
+                       'internal_data_changed', 'internal_state_changed',
+                       'metadata_changed'])
+
+
+   def event_key(sender, event):
+       """ Return the key used to coalesce an event sent by sender, None if
+       the event must be delivered anyway (vertex_added, edge_removed...) """
+       keyed = isinstance(event, tuple) and len(event) > 1
+       if isinstance(event, tuple):
+           if not event:
+               return None
+           kind = event[0]
+       else:
+           kind = event
+       try:
+           if kind in coalesced_events:
+               return (id(sender), kind)
+           if kind in keyed_events and keyed:
+               key = (id(sender), kind, event[1])
+               hash(key)
+               return key
+       except TypeError:
+           pass
+       return None
+
+
+   class EventBatch(object):
+       """ Events queued while an observed_batch is active """
+
+       def __init__(self):
+           self.lock = threading.RLock()
+           self.active = False  # a batch is running
+           self.depth = 0
+           self.throttle = None
+           self.last_flush = 0.
+           self.events = OrderedDict()  # {key: (sender, event)}
+           self.nb_uncoalesced = 0
+
+       def enter(self, throttle=None):
+           with self.lock:
+               if self.depth == 0:
+                   self.throttle = throttle
+                   self.last_flush = time()
+               self.depth += 1
+               self.active = True
+
+       def exit(self):
+           with self.lock:
+               self.depth -= 1
+               self.active = bool(self.depth)
+               if self.depth > 0:
+                   return
+           self.flush()
+
+       def add(self, sender, event):
+           """ Queue event, return False if no batch is active """
+           key = event_key(sender, event)
+           with self.lock:
+               if self.depth == 0:
+                   return False
+               if key is None:
+                   self.nb_uncoalesced += 1
+                   key = self.nb_uncoalesced
+               # a coalesced event moves to the position of the last one
+               self.events.pop(key, None)
+               self.events[key] = (sender, event)
+               throttle = self.throttle
+           if throttle is not None and time() - self.last_flush >= throttle:
+               self.flush()
+           return True
+
+       def flush(self):
+           """ Deliver the queued events """
+           with self.lock:
+               events = self.events.values()
+               self.events.clear()
+               self.last_flush = time()
+           for sender, event in events:
+               sender._notify_listeners(event)
+
+   # state of each thread: depth of its quiet_notifications blocks and
+   # EventBatch of its observed_batch blocks
+   _local = threading.local()
+
+
+   def _get_batch():
+       """ Return the EventBatch of the current thread """
+       try:
+           return _local.batch
+       except AttributeError:
+           batch = _local.batch = EventBatch()
+           return batch
+
+
+   @contextmanager
+   def observed_batch(throttle=None):
+       """ Queue the notifications sent by the current thread in the block
+       and deliver them at the end of the block.
+
+       Successive events of the same kind sent by the same object are
+       coalesced: only the last one is delivered (see coalesced_events and
+       keyed_events). Other events are delivered in order. Batches can be
+       nested, events are delivered at the end of the outermost one.
+
+       :param throttle: if not None, queued events are also delivered when
+           throttle seconds have elapsed since the last delivery.
+       """
+       batch = _get_batch()
+       batch.enter(throttle)
+       try:
+           yield
+       finally:
+           batch.exit()
+
+
+   @contextmanager
+   def quiet_notifications():
+       """ Evaluate without the evaluation events in the block.
+
+       Used to evaluate dataflows without a GUI: in the current thread, the
+       nodes and the evaluation algorithms do not send their evaluation
+       events (start_eval, stop_eval, tooltip_modified...), see
+       notifications_enabled. The other notifications are still sent.
+       """
+       _local.depth = getattr(_local, 'depth', 0) + 1
+       try:
+           yield
+       finally:
+           _local.depth -= 1
+
+
+   def notifications_enabled():
+       """ Return False in a quiet_notifications block of the current
+       thread """
+       return not getattr(_local, 'depth', 0)
 
 
    class Observed(object):
-       """ Observed Object """
+       """ Observed Object
+
+       The set of listeners and the notification state are created on
+       demand: most of the nodes and ports are never observed.
+       """
+
+       # notification state
+       __isNotifying = False
+       __postNotifs = () #calls to execute after a notication is done
+       __exclusive = None
+       __blockNotifs = False
 
        def __init__(self):
+           pass
 
-           self.listeners = set()
-           self.__isNotifying = False
-           self.__postNotifs = [] #calls to execute after a notication is done
-           self.__exclusive = None
-           self.__blockNotifs = False
+       def _get_listeners(self):
+           try:
+               return self.__dict__['_listeners']
+           except KeyError:
+               listeners = self.__dict__['_listeners'] = set()
+               return listeners
+
+       def _set_listeners(self, listeners):
+           self.__dict__['_listeners'] = listeners
+
+       listeners = property(_get_listeners, _set_listeners)
+
+       def _post(self, action):
+           """ Call action once the current notification is done """
+           if not self.__postNotifs:
+               self.__postNotifs = []
+           self.__postNotifs.append(action)
 
        def register_listener(self, listener):
            """ Add listener to list of listeners.
@@ -56,7 +229,7 @@ else:
            else:
                def push_listener_after():
                    self.register_listener(listener)
-               self.__postNotifs.append(push_listener_after)
+               self._post(push_listener_after)
 
        def unregister_listener(self, listener):
            """ Remove listener from the list of listeners """
@@ -73,7 +246,7 @@ else:
            else:
                def discard_listener_after():
                    self.unregister_listener(listener)
-               self.__postNotifs.append(discard_listener_after)
+               self._post(discard_listener_after)
 
        def transfer_listeners(self, newObs):
            """Takes all this observed's listeners, unregisters them
@@ -84,7 +257,7 @@ else:
                self.unregister_listener(lis)
                newObs.register_listener(lis())
                lis().change_observed(self, newObs)
-           self.__isNotifying = False
+           self.__dict__.pop('_Observed__isNotifying', None)
 
        def exclusive_command(self, who, command, *args, **kargs):
            """Executes a call "command" and if it triggers any
@@ -104,7 +277,17 @@ else:
 
            :param event: an object to pass to the notify function
            """
-
+           batch = getattr(_local, 'batch', None)
+           if batch is not None and batch.active and \
+                   not self.__exclusive and batch.add(self, event):
+               return
+           self._notify_listeners(event)
+
+       def _notify_listeners(self, event=None):
+           """ Deliver event to the listeners """
+           if not self.__dict__.get('_listeners') and not self.__exclusive:
+               self.post_notification()
+               return
            self.__isNotifying = True
 
            #If an exclusive handler is set let's only
@@ -127,18 +310,20 @@ else:
                for dead in toDelete:
                    self.listeners.discard(dead)
 
-           self.__isNotifying = False
+           self.__dict__.pop('_Observed__isNotifying', None)
            self.post_notification()
 
        def post_notification(self):
-           for action in self.__postNotifs:
-               action()
-           self.__postNotifs = []
+           actions = self.__postNotifs
+           if actions:
+               self.__postNotifs = ()
+               for action in actions:
+                   action()
 
        def __getstate__(self):
            """ Pickle function """
            odict = self.__dict__.copy()
-           odict['listeners'] = set()
+           odict.pop('_listeners', None)
            return odict
 
    class AbstractListener(object):
@@ -557,10 +557,8 @@ class PyPackageReader(AbstractPackageReader):
         m = m.replace(".", "_")
         return m
 
-    def register_packages(self, pkgmanager):
-        """ Execute Wralea.py """
-
-        pkg = None
+    def import_module(self):
+        """ Import the wralea file and return the module """
 
         basename = os.path.basename(self.filename)
         basedir = os.path.abspath(os.path.dirname(self.filename))
@@ -571,12 +569,28 @@ class PyPackageReader(AbstractPackageReader):
         # Adapt sys.path
         sys.path.append(basedir)
 
-        if (modulename in sys.modules):
-            del sys.modules[modulename]
+        try:
+            if (modulename in sys.modules):
+                del sys.modules[modulename]
+
+            (file, pathname, desc) = imp.find_module(base_modulename, [basedir])
+            try:
+                return imp.load_module(modulename, file, pathname, desc)
+            finally:
+                if (file):
+                    file.close()
+
+        finally:
+            # Recover sys.path
+            sys.path.pop()
+
+    def register_packages(self, pkgmanager):
+        """ Execute Wralea.py """
+
+        pkg = None
 
-        (file, pathname, desc) = imp.find_module(base_modulename, [basedir])
         try:
-            wraleamodule = imp.load_module(modulename, file, pathname, desc)
+            wraleamodule = self.import_module()
             pkg = self.build_package(wraleamodule, pkgmanager)
 
         except Exception, e:
@@ -589,12 +603,6 @@ class PyPackageReader(AbstractPackageReader):
         except:  # Treat all exception
             pkgmanager.add('%s is invalid :' % (self.filename, ))
 
-        if (file):
-            file.close()
-
-        # Recover sys.path
-        sys.path.pop()
-
         return pkg
 
     def build_package(self, wraleamodule, pkgmanager):
@@ -676,6 +684,29 @@ class PyPackageReaderWralea(PyPackageReader):
                 pkgmanager[protected(name)] = p
 
 
+class LazyPyPackageReaderWralea(PyPackageReaderWralea):
+    """
+    Build a package from a __wralea__.py without importing it.
+
+    The factories are LazyFactory instances built from a static parse of the
+    file, the module is imported when one of them is used. Files which can
+    not be statically parsed are imported.
+    """
+
+    def register_packages(self, pkgmanager):
+        """ Create and add the package in the package manager. """
+        from openalea.core.lazyfactory import parse_wralea
+
+        wraleainfo = parse_wralea(self.filename, self.get_pkg_name())
+        if wraleainfo is None:
+            return PyPackageReaderWralea.register_packages(self, pkgmanager)
+
+        try:
+            return self.build_package(wraleainfo, pkgmanager)
+        except Exception, e:
+            pkgmanager.log.add('%s is invalid : %s' % (self.filename, e))
+
+
 ######################
 # Vlab package reader
 ######################
@@ -46,6 +46,12 @@ class PackageDict(dict):
     This object is able to handle protected entry begining with an '#'
     """
 
+    # incremented each time an item is set or removed (see pkgsearch)
+    version = 0
+    # list of the keys set, None when they are not recorded (see
+    # PackageManager.register_reader)
+    set_keys = None
+
     def __init__(self, *args):
         self.nb_public = None
         dict.__init__(self, *args)
@@ -62,11 +68,15 @@ class PackageDict(dict):
     def __setitem__(self, item, y):
 
         # Update nb public key
-        if (self.nb_public and
+        # (attributes are not set yet when items are unpickled)
+        if (getattr(self, 'nb_public', None) and
            not self.has_key(item) and
            not is_protected(item)):
             self.nb_public += 1
 
+        self.version += 1
+        if self.set_keys is not None:
+            self.set_keys.append(lower(item))
         return dict.__setitem__(self, lower(item), y)
 
     def __contains__(self, key):
@@ -86,8 +96,13 @@ class PackageDict(dict):
         if (self.nb_public and not is_protected(key)):
             self.nb_public -= 1
 
+        self.version += 1
         return dict.__delitem__(self, lower(key))
 
+    def clear(self):
+        self.version += 1
+        dict.clear(self)
+
     def get(self, key, default=None):
         return dict.get(self, lower(key), default)
 
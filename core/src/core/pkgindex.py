@@ -0,0 +1,231 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module defines the on-disk index used by the package manager.
+
+The index stores, for each wralea file, the packages (and their factories)
+it registers, keyed by the path of the file and the modification time and
+size of the python files of its directory (the wralea file, __init__.py and
+the modules it may import, see wralea_key). When none of them has been
+modified since the file has been indexed, its packages are loaded from the
+index and the wralea module is not imported: node modules are only imported
+when a factory is instantiated.
+
+Hence the modifications of the modules of other directories imported by a
+wralea file, or the side effects of its import (e.g. a package depending on
+the environment), are not seen until one of these files is modified: use
+PackageManager.find_and_register_packages(no_cache=True) to rebuild the
+index.
+
+The index also remembers the wralea files found under each search path
+with the modification time of the walked directories, so that the search
+paths are only walked again when one of their directories has changed.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import cPickle
+from fnmatch import fnmatch
+
+from openalea.core import settings
+from openalea.core import logger
+
+# increment when the format of the index or of the pickled factories changes
+INDEX_VERSION = 2
+
+
+def get_index_filename(name='pkg_index.pic'):
+    """ Return the default filename of the package index """
+    return os.path.join(settings.get_openalea_home_dir(), name)
+
+
+def file_key(filename):
+    """ Return the (mtime, size) of filename, None if it does not exist """
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def wralea_key(filename):
+    """ Return the list of (name, (mtime, size)) of the python files in the
+    directory of the wralea filename, None if filename does not exist """
+    if file_key(filename) is None:
+        return None
+    dirname = os.path.dirname(filename)
+    try:
+        names = sorted(os.listdir(dirname))
+    except OSError:
+        return None
+    return [(name, file_key(os.path.join(dirname, name)))
+            for name in names if name.endswith('.py')]
+
+
+def dumps_packages(packages):
+    """ Pickle a list of (key, package) registered by a wralea file.
+
+    Factories keep the id of their package to find it again in the package
+    manager, which is not possible while the index is being loaded: the
+    ids are pickled apart and restored by loads_packages.
+    """
+    factories = set()
+    for key, pkg in packages:
+        factories.update(pkg.itervalues())
+    pkg_ids = [(factory, factory.__dict__.get('__pkg_id__'))
+               for factory in factories]
+    for factory, pkg_id in pkg_ids:
+        factory.__pkg_id__ = None
+    try:
+        return cPickle.dumps((packages, pkg_ids), cPickle.HIGHEST_PROTOCOL)
+    finally:
+        for factory, pkg_id in pkg_ids:
+            factory.__pkg_id__ = pkg_id
+
+
+def loads_packages(data):
+    """ Return the list of (key, package) pickled by dumps_packages """
+    packages, pkg_ids = cPickle.loads(data)
+    pkgs = dict((pkg.get_id(), pkg) for key, pkg in packages)
+    for factory, pkg_id in pkg_ids:
+        if pkg_id in pkgs:
+            factory.package = pkgs[pkg_id]
+        else:
+            # package registered by another file, found on demand
+            factory.__pkg_id__ = pkg_id
+    return packages
+
+
+class PackageIndex(object):
+    """ Persistent index of the packages registered by each wralea file """
+
+    def __init__(self, filename=None):
+        """
+        :param filename: file of the index, default is get_index_filename()
+        """
+        if filename is None:
+            filename = get_index_filename()
+        self.filename = filename
+        self.files = {}  # {wralea filename: (wralea_key, pickled pkgs)}
+        self.walks = {}  # {(root, pattern): ({dirname: mtime}, filenames)}
+        self.modified = False
+        self.load()
+
+    def load(self):
+        """ Read the index from disk, start from an empty one on failure """
+        self.files, self.walks = {}, {}
+        self.modified = False
+        if not os.path.exists(self.filename):
+            return
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                version, files, walks = cPickle.load(f)
+            finally:
+                f.close()
+        except Exception, e:
+            logger.warning("Invalid package index %s: %s" % (self.filename, e))
+            return
+        if version == INDEX_VERSION:
+            self.files, self.walks = files, walks
+
+    def save(self):
+        """ Write the index on disk if it has been modified """
+        if not self.modified:
+            return
+        data = (INDEX_VERSION, self.files, self.walks)
+        tmp = self.filename + '.tmp'
+        try:
+            f = open(tmp, 'wb')
+            try:
+                cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+            finally:
+                f.close()
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+            os.rename(tmp, self.filename)
+        except (IOError, OSError), e:
+            logger.warning("Cannot write package index %s: %s" %
+                           (self.filename, e))
+            return
+        self.modified = False
+
+    def clear(self):
+        """ Remove all the entries """
+        self.files.clear()
+        self.walks.clear()
+        self.modified = True
+
+    # wralea files
+    def get_packages(self, filename):
+        """ Return the list of (key, package) registered by filename or None
+        if filename has been modified since it has been indexed. """
+        entry = self.files.get(filename)
+        if entry is None or entry[0] != wralea_key(filename):
+            return None
+        try:
+            return loads_packages(entry[1])
+        except Exception, e:
+            logger.warning("Invalid index entry for %s: %s" % (filename, e))
+            self.discard(filename)
+            return None
+
+    def set_packages(self, filename, packages):
+        """ Store the list of (key, package) registered by filename.
+        Return False if the packages can not be pickled. """
+        key = wralea_key(filename)
+        try:
+            data = dumps_packages(packages)
+        except Exception, e:
+            logger.info("%s can not be indexed: %s" % (filename, e))
+            self.discard(filename)
+            return False
+        self.files[filename] = (key, data)
+        self.modified = True
+        return True
+
+    def discard(self, filename):
+        """ Remove the entry of filename """
+        if self.files.pop(filename, None) is not None:
+            self.modified = True
+
+    # search paths
+    def walkfiles(self, root, pattern):
+        """ Return the files matching pattern under the root directory.
+
+        The cached result is used if none of the directories under root
+        has been modified.
+        """
+        entry = self.walks.get((root, pattern))
+        if entry is not None:
+            dirs, files = entry
+            for dirname, mtime in dirs.iteritems():
+                key = file_key(dirname)
+                if key is None or key[0] != mtime:
+                    break
+            else:
+                return list(files)
+
+        dirs, files = {}, []
+        for dirname, subdirs, filenames in os.walk(root, followlinks=True):
+            key = file_key(dirname)
+            if key is None:
+                continue
+            dirs[dirname] = key[0]
+            files.extend(os.path.join(dirname, f) for f in filenames
+                         if fnmatch(f, pattern))
+        self.walks[(root, pattern)] = (dirs, files)
+        self.modified = True
+        return list(files)
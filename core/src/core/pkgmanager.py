@@ -38,9 +38,12 @@ from pkg_resources import iter_entry_points
 from openalea.core.singleton import Singleton
 from openalea.core.observer import Observed
 from openalea.core.package import (Package, UserPackage, PyPackageReader,
-                                   PyPackageReaderWralea, PyPackageReaderVlab)
+                                   PyPackageReaderWralea, PyPackageReaderVlab,
+                                   LazyPyPackageReaderWralea)
 from openalea.core.settings import get_userpkg_dir, Settings
 from openalea.core.pkgdict import PackageDict, is_protected, protected
+from openalea.core.pkgindex import PackageIndex
+from openalea.core.pkgsearch import FactoryIndex
 from openalea.core.category import PackageManagerCategory
 from openalea.core import logger
 
@@ -53,6 +56,10 @@ from ConfigParser import NoSectionError, NoOptionError
 import time
 DEBUG = False
 SEARCH_OUTSIDE_ENTRY_POINTS = True
+# load unmodified wralea files from the on-disk package index
+USE_PACKAGE_INDEX = True
+# parse __wralea__ files and import them only when a factory is used
+LAZY_FACTORIES = True
 
 
 class UnknowFileType(Exception):
@@ -152,6 +159,12 @@ class PackageManager(Observed):
         # for packages that we don't want to save in the config file
         self.temporary_wralea_paths = set()
 
+        # on-disk index of the registered packages (see get_index)
+        self.index = None
+
+        # index of the factories built by the first search_node
+        self.search_index = None
+
         # Compute system and user PATH to look for packages
         self.set_user_wralea_path()
         self.set_sys_wralea_path()
@@ -323,6 +336,8 @@ class PackageManager(Observed):
         else:
             pkg.reload()
             self.load_directory(pkg.path)
+        if self.search_index is not None:
+            self.search_index.update(self.pkgs)
         self.notify_listeners("update")
 
     def clear(self):
@@ -332,6 +347,8 @@ class PackageManager(Observed):
         self.sys_wralea_path = set()
 
         self.pkgs = PackageDict()
+        if self.search_index is not None:
+            self.search_index.clear()
         self.recover_syspath()
         self.category = PseudoGroup('Root')
 
@@ -378,6 +395,8 @@ class PackageManager(Observed):
 
         self[package.get_id()] = package
         self.update_category(package)
+        if self.search_index is not None:
+            self.search_index.add_package(package.get_id().lower(), package)
 
     def get_pseudo_pkg(self):
         """ Return a pseudopackage structure """
@@ -607,7 +626,11 @@ class PackageManager(Observed):
         recursive = True
         if not SEARCH_OUTSIDE_ENTRY_POINTS:
             recursive = False
-        if recursive:
+        index = self.get_index()
+        if recursive and index is not None:
+            files = set(path(f).abspath() for p in directories
+                        for f in index.walkfiles(p, '*wralea*.py'))
+        elif recursive:
             files = set(f.abspath() for p in directories for f in path(p).walkfiles('*wralea*.py'))
         else:
             files = set(f.abspath() for p in directories for f in path(p).glob('*wralea*.py'))
@@ -620,7 +643,9 @@ class PackageManager(Observed):
         """ Return the pkg reader corresponding to the filename """
 
         reader = None
-        if filename.endswith("__wralea__.py"):
+        if filename.endswith("__wralea__.py") and LAZY_FACTORIES:
+            reader = LazyPyPackageReaderWralea(filename)
+        elif filename.endswith("__wralea__.py"):
             reader = PyPackageReaderWralea(filename)
         elif(filename.endswith('wralea.py')):
             reader = PyPackageReader(filename)
@@ -632,14 +657,58 @@ class PackageManager(Observed):
 
         return reader
 
+    def get_index(self):
+        """ Return the package index, None if it is disabled """
+        if not USE_PACKAGE_INDEX:
+            return None
+        if self.index is None:
+            self.index = PackageIndex()
+        return self.index
+
+    def register_reader(self, reader, index=None):
+        """ Register the packages of reader.
+
+        The packages of a wralea file which has not been modified since it
+        has been indexed are loaded from the index, without importing it.
+        """
+        if index is None or not isinstance(reader, PyPackageReader):
+            return reader.register_packages(self)
+
+        packages = index.get_packages(reader.filename)
+        if packages is not None:
+            for key, pkg in packages:
+                if key == pkg.get_id():
+                    self.add_package(pkg)
+                else:
+                    # alias of the package (see __alias__)
+                    self[key] = pkg
+            return
+
+        # record the keys registered by the reader
+        pkgs = self.pkgs
+        pkgs.set_keys = keys = []
+        try:
+            ret = reader.register_packages(self)
+        finally:
+            pkgs.set_keys = None
+        packages = []
+        for key in sorted(set(keys)):
+            pkg = dict.get(pkgs, key)
+            if pkg is not None:
+                packages.append((key, pkg))
+        if packages:
+            index.set_packages(reader.filename, packages)
+        return ret
+
     def find_and_register_packages(self, no_cache=False):
         """
         Find all wralea on the system and register them
         If no_cache is True, ignore cache file
         """
 
-#        if(no_cache):
-#            self.delete_cache()
+        index = self.get_index()
+        if(no_cache and index is not None):
+            index.clear()
         self.set_sys_wralea_path()
         self.set_user_wralea_path()
         if DEBUG:
@@ -660,7 +729,7 @@ class PackageManager(Observed):
         for x in readerlist:
             if DEBUG:
                 tn = time.clock()
-            x.register_packages(self)
+            self.register_reader(x, index)
             if DEBUG:
                 tt = time.clock() - tn
                 print 'register package ', x.get_pkg_name(), 'in ', time.clock() - tn
@@ -669,43 +738,15 @@ class PackageManager(Observed):
             t3 = time.clock()
             print '-------------------'
             print 'register_packages takes %f seconds' % (t3 - t2)
-#        self.save_cache()
+
+        if index is not None:
+            index.save()
 
         self.rebuild_category()
 
         if DEBUG:
             return res
 
-    # Cache functions
-    # def get_cache_filename(self):
-    #     """ Return the cache filename """
-
-    #     return os.path.join(tempfile.gettempdir(), ".alea_pkg_cache")
-
-    # def save_cache(self):
-    #     """ Save in cache current package manager state """
-
-    #     f = open(self.get_cache_filename(),'w')
-    #     s = set([pkg.path + "\n" for pkg in self.pkgs.itervalues()])
-    #     f.writelines(list(s))
-    #     f.close()
-
-    # def delete_cache(self):
-    #     """ Remove cache """
-
-    #     n = self.get_cache_filename()
-
-    #     if(os.path.exists(n)):
-    #         os.remove(n)
-
-    # def get_cache(self):
-    #     """ Return cache contents """
-    #     f = open(self.get_cache_filename(), "r")
-    #     for d in f:
-    #         d = d.strip()
-    #         yield d
-    #     f.close()
-
     ###############################################################################
     # Package creation
     ###############################################################################
@@ -776,6 +817,8 @@ class PackageManager(Observed):
 
     def __delitem__(self, item):
         r = self.pkgs.__delitem__(item)
+        if self.search_index is not None:
+            self.search_index.remove_package(item.lower())
         self.rebuild_category()
         self.notify_listeners("update")
         return r
@@ -846,6 +889,15 @@ class PackageManager(Observed):
         factory = pkg[factory_id]
         return factory.instantiate()
 
+    def get_search_index(self):
+        """ Return the FactoryIndex used by search_node, up to date with
+        the registered packages. """
+        if self.search_index is None:
+            self.search_index = FactoryIndex()
+        # packages registered without add_package
+        self.search_index.update(self.pkgs)
+        return self.search_index
+
     def search_node(self, search_str, nb_inputs=-1, nb_outputs=-1):
         """
         Return a list of Factory corresponding to search_str
@@ -859,62 +911,12 @@ class PackageManager(Observed):
           2 - Then : Number of occurences of search_str in the factory
               description.
           3 - Then : Number of occurences of search_str in the category name
-          4 - Finally : presence of search_str in package name and position
+          4 - Then : presence of search_str in package name and position
               in the name (close to the begining = higher score)
+          5 - Finally : Number of port names containing search_str
         """
-
-        search_str = search_str.upper()
-
-        match = []
-
-        # Search for each package and for each factory
-        for name, pkg in self.iteritems():
-            if is_protected(name):
-                continue  # alias
-
-            for fname, factory in pkg.iteritems():
-                if is_protected(fname): 
-                    continue  # alias
-
-                # -- The scores for each string that is explored.
-                # They are long ints because we make a 96 bits bitshift
-                # to compute the final score --
-                facNameScore = 0L
-                facDescScore = 0L
-                facCateScore = 0L
-                pkgNameScore = 0L
-
-                fname = factory.name.upper()
-                if search_str in fname:
-                    l = float(len(fname))
-                    facNameScore = long(100 * (1 - fname.index(search_str) / l))
-
-                facDescScore = long(factory.description.upper().count(search_str))
-                facCateScore = long(factory.category.upper().count(search_str))
-
-                pname = pkg.name.upper()
-                if search_str in pname:
-                    l = float(len(pname))
-                    pkgNameScore = long(100 * (1 - pname.index(search_str) / l))
-
-                score = (facNameScore << (32 * 3) | facDescScore << (32 * 2) | 
-                         facCateScore << (32 * 1) | pkgNameScore << (32))
-                if score > 0:
-                    match.append((score, factory))
-
-        # Filter ports
-        if(nb_inputs >= 0):
-            match = filter(lambda (sc, x): x and x.inputs and len(x.inputs) == nb_inputs, match)
-        if(nb_outputs >= 0):
-            match = filter(lambda (sc, x): x and x.outputs and len(x.outputs) == nb_outputs, match)
-
-        if not len(match):
-            return match
-
-        match.sort(reverse=True)
-        match = zip(*match)[1]
-
-        return match
+        index = self.get_search_index()
+        return index.search(search_str, nb_inputs, nb_outputs)
 
     ####################################################################################
     # Methods to introspect globally the PkgManager
@@ -0,0 +1,224 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module defines the index used by PackageManager.search_node.
+
+Each factory is indexed by the substrings (up to GRAM_SIZE characters) of
+its name, description, category, package name and port names. A search
+only scores the factories containing all the substrings of the searched
+string instead of scanning all the factories.
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from openalea.core.pkgdict import is_protected
+
+# length of the longest indexed substrings
+GRAM_SIZE = 3
+
+# number of searches whose results are kept
+MAX_RESULTS = 100
+
+
+def grams(text):
+    """ Return the set of substrings of text of length 1 to GRAM_SIZE """
+    res = set(text)
+    for size in range(2, GRAM_SIZE + 1):
+        res.update(text[i:i + size] for i in range(len(text) - size + 1))
+    return res
+
+
+def port_names(ports):
+    """ Return the list of the names of a port description list """
+    names = []
+    for port in ports or ():
+        try:
+            name = port.get('name')
+        except AttributeError:
+            name = port
+        if name is not None:
+            names.append(str(name))
+    return names
+
+
+def position_score(search_str, text):
+    """ Score of search_str in text: the closer to the begining, the higher
+    """
+    pos = text.find(search_str)
+    if pos < 0:
+        return 0
+    return int(100 * (1 - pos / float(len(text))))
+
+
+def package_version(package):
+    """ Return a value which changes each time a factory of package is
+    added, replaced or removed """
+    return len(package), getattr(package, 'version', None)
+
+
+class FactoryEntry(object):
+    """ Searched fields of a factory, in upper case """
+
+    def __init__(self, factory, package):
+        self.factory = factory
+        self.name = (factory.name or '').upper()
+        self.description = (factory.description or '').upper()
+        self.category = (factory.category or '').upper()
+        self.package_name = (package.name or '').upper()
+        self.ports = [p.upper() for p in port_names(factory.inputs) +
+                      port_names(factory.outputs)]
+        # None if there is no port: never selected by a number of ports
+        self.nb_inputs = len(factory.inputs) if factory.inputs else None
+        self.nb_outputs = len(factory.outputs) if factory.outputs else None
+
+    def grams(self):
+        res = set()
+        for text in [self.name, self.description, self.category,
+                     self.package_name] + self.ports:
+            res |= grams(text)
+        return res
+
+    def score(self, search_str):
+        """ Return the score of the factory for search_str (upper case)
+
+        The score orders the factories by, in decreasing priority:
+          1 - position of search_str in the factory name
+          2 - number of occurences in the description
+          3 - number of occurences in the category
+          4 - position in the package name
+          5 - number of port names containing search_str
+        """
+        return (position_score(search_str, self.name),
+                self.description.count(search_str),
+                self.category.count(search_str),
+                position_score(search_str, self.package_name),
+                sum(1 for p in self.ports if search_str in p))
+
+
+class FactoryIndex(object):
+    """ Inverted index of the factories of the packages """
+
+    def __init__(self):
+        self.entries = {}  # {entry id: FactoryEntry}
+        self.postings = {}  # {substring: set of entry ids}
+        self.packages = {}  # {package key: (package, version, entry ids)}
+        self.next_id = 0
+        self.results = {}  # {search arguments: factories} of last searches
+
+    def clear(self):
+        self.entries.clear()
+        self.postings.clear()
+        self.packages.clear()
+        self.results.clear()
+
+    def add_package(self, key, package):
+        """ Index (again) the factories of package registered as key """
+        self.remove_package(key)
+        if is_protected(key):
+            return
+
+        self.results.clear()
+        ids = []
+        for fname, factory in package.iteritems():
+            if is_protected(fname):
+                continue  # alias
+            entry = FactoryEntry(factory, package)
+            eid = self.next_id
+            self.next_id += 1
+            self.entries[eid] = entry
+            for gram in entry.grams():
+                self.postings.setdefault(gram, set()).add(eid)
+            ids.append(eid)
+        self.packages[key] = (package, package_version(package), ids)
+
+    def remove_package(self, key):
+        """ Remove the factories of the package registered as key """
+        entry = self.packages.pop(key, None)
+        if entry is None:
+            return
+        self.results.clear()
+        for eid in entry[2]:
+            for gram in self.entries.pop(eid).grams():
+                posting = self.postings[gram]
+                posting.discard(eid)
+                if not posting:
+                    del self.postings[gram]
+
+    def update(self, packages):
+        """ Synchronize the index with packages, a dict {key: package}.
+
+        Only packages which have been added, removed, replaced or
+        modified (see package_version) are indexed again.
+        """
+        for key, package in packages.iteritems():
+            if is_protected(key):
+                continue
+            entry = self.packages.get(key)
+            if entry is None or entry[0] is not package or \
+                    entry[1] != package_version(package):
+                self.add_package(key, package)
+
+        if len(self.packages) != len(packages):
+            for key in self.packages.keys():
+                if key not in packages or is_protected(key):
+                    self.remove_package(key)
+
+    def candidates(self, search_str):
+        """ Return the ids of the entries which may contain search_str """
+        if not search_str:
+            return self.entries.keys()
+        if len(search_str) <= GRAM_SIZE:
+            return self.postings.get(search_str, ())
+
+        postings = []
+        for i in range(len(search_str) - GRAM_SIZE + 1):
+            posting = self.postings.get(search_str[i:i + GRAM_SIZE])
+            if not posting:
+                return ()
+            postings.append(posting)
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+    def search(self, search_str, nb_inputs=-1, nb_outputs=-1):
+        """ Return the list of factories matching search_str sorted by
+        decreasing score (see FactoryEntry.score).
+
+        If nb_inputs or nb_outputs is positive, return only the factories
+        with this number of inputs or outputs (the factories without ports
+        are never returned then).
+        """
+        search_str = search_str.upper()
+        key = (search_str, nb_inputs, nb_outputs)
+        if key in self.results:
+            return list(self.results[key])
+
+        match = []
+        for eid in self.candidates(search_str):
+            entry = self.entries[eid]
+            if nb_inputs >= 0 and entry.nb_inputs != nb_inputs:
+                continue
+            if nb_outputs >= 0 and entry.nb_outputs != nb_outputs:
+                continue
+            score = entry.score(search_str)
+            if any(score):
+                match.append((score, entry.name, eid))
+
+        match.sort(key=lambda m: m[1])
+        match.sort(key=lambda m: m[0], reverse=True)
+        res = [self.entries[eid].factory for score, name, eid in match]
+
+        if len(self.results) >= MAX_RESULTS:
+            self.results.clear()
+        self.results[key] = res
+        return list(res)
@@ -11,9 +11,9 @@ def get_pm():
 def is_data(factory):
     return isinstance(factory, DataFactory)
 def is_cn(factory):
-    return isinstance(factory, CompositeNodeFactory)
+    return factory.is_composite_node()
 def is_node(factory):
-    return isinstance(factory, NodeFactory)
+    return factory.is_node()
 
 def get_packages(pm, pkg_name=None):
     if pkg_name and pkg_name in pm:
@@ -0,0 +1,349 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module profiles the evaluation of dataflows node by node.
+
+While a Profiler is enabled, the evaluation algorithms record for each
+evaluated vertex its wall and CPU time, the number of evaluations, the
+size of its inputs and outputs and the time spent in the node __call__
+(the remaining time of Node.eval is spent in notifications). Nested
+composite nodes are profiled as children of their vertex::
+
+    with Profiler() as prof:
+        cn.eval()
+    prof.print_stats()
+    prof.dump_stats('eval.prof')          # pstats
+    prof.dump_callgrind('eval.kgrind')    # kcachegrind
+    prof.dump_flamegraph('eval.json')     # d3-flame-graph
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import sys
+import json
+import marshal
+import threading
+from time import time, clock
+
+_profiler = None
+
+
+def get_profiler():
+    """ Return the enabled Profiler or None """
+    return _profiler
+
+
+def enable_profiler(profiler=None):
+    """ Enable profiler (a new Profiler by default) and return it """
+    global _profiler
+    if profiler is None:
+        profiler = Profiler()
+    _profiler = profiler
+    return profiler
+
+
+def disable_profiler():
+    """ Stop profiling, return the Profiler which was enabled """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def size_of(values):
+    """ Return the sum of the sizes in bytes of values (not recursive) """
+    size = 0
+    for value in values:
+        try:
+            size += sys.getsizeof(value)
+        except TypeError:
+            pass
+    return size
+
+
+def node_label(node):
+    """ Return (package name, node name) of node """
+    factory = getattr(node, 'factory', None)
+    if factory is None:
+        return '', node.__class__.__name__
+    package = getattr(factory, 'package', None)
+    return getattr(package, 'name', '') or '', factory.name
+
+
+class VertexStats(object):
+    """ Profile of a vertex """
+
+    def __init__(self, path, package, name):
+        """
+        :param path: tuple of the vertex ids from the evaluated dataflow
+            to the vertex, through the composite nodes.
+        """
+        self.path = path
+        self.package = package
+        self.name = name
+        self.count = 0
+        self.wall = 0.  # total wall time of the evaluations
+        self.cpu = 0.
+        self.call = 0.  # wall time spent in __call__
+        self.children = 0.  # wall time spent in nested vertices
+        self.input_size = 0
+        self.output_size = 0
+
+    def notify(self):
+        """ Wall time of the evaluations outside __call__ """
+        return max(0., self.wall - self.call)
+
+    def own(self):
+        """ Wall time of the evaluations outside nested vertices """
+        return max(0., self.wall - self.children)
+
+    def location(self):
+        """ Return the path of the dataflow of the vertex """
+        return '/'.join(['root'] + [str(vid) for vid in self.path[:-1]])
+
+    def label(self):
+        if self.package:
+            return "%s.%s" % (self.package, self.name)
+        return self.name
+
+    def to_dict(self):
+        return dict(path=list(self.path), package=self.package,
+                    name=self.name, count=self.count, wall=self.wall,
+                    cpu=self.cpu, call=self.call, notify=self.notify(),
+                    input_size=self.input_size,
+                    output_size=self.output_size)
+
+
+class _Code(object):
+    """ code-like object of a vertex for lsprofcalltree """
+
+    def __init__(self, stats):
+        self.co_name = stats.label()
+        self.co_filename = stats.location()
+        self.co_firstlineno = stats.path[-1]
+
+
+class _Entry(object):
+    """ profiler_entry-like object for lsprofcalltree """
+
+    def __init__(self, code, callcount, totaltime, inlinetime=0., calls=()):
+        self.code = code
+        self.callcount = callcount
+        self.totaltime = totaltime
+        self.inlinetime = inlinetime
+        self.calls = list(calls)
+
+
+class Profiler(object):
+    """ Record the evaluation of the vertices while it is enabled """
+
+    def __init__(self):
+        self.vertices = {}  # {path: VertexStats}
+        self.stats = {}  # pstats statistics, see create_stats
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __enter__(self):
+        return enable_profiler(self)
+
+    def __exit__(self, *args):
+        disable_profiler()
+
+    def clear(self):
+        with self._lock:
+            self.vertices.clear()
+            self.stats = {}
+
+    def eval_actor(self, algo, vid, actor):
+        """ Evaluate actor with algo.eval_actor and record it as vid """
+        from openalea.core.node import Node
+        from openalea.core.algo.dataflow_evaluation import AbstractEvaluation
+
+        node_eval = getattr(type(actor), 'eval', None)
+        if getattr(node_eval, 'im_func', None) is not Node.eval.im_func or \
+                type(algo).eval_actor.im_func is not \
+                AbstractEvaluation.eval_actor.im_func:
+            # __call__ can not be timed apart
+            return self.run(vid, actor, algo.eval_actor, actor)
+
+        call_time = [0.]
+
+        def call(inputs):
+            t0 = time()
+            try:
+                return actor(inputs)
+            finally:
+                call_time[0] += time() - t0
+        return self.run(vid, actor, actor.eval, call=call,
+                        call_time=call_time)
+
+    def run(self, vid, actor, func, *args, **kwds):
+        """ Return func(*args, **kwds), recorded as the evaluation of actor
+        in the vertex vid.
+
+        :param call_time: list whose first element is set by func to the
+            time spent in __call__ (all the evaluation by default)
+        :param inputs: input values (actor.inputs by default)
+        :param outputs: if True, the result of func is the output values
+            (actor.outputs by default)
+        """
+        call_time = kwds.pop('call_time', None)
+        inputs = kwds.pop('inputs', None)
+        outputs = kwds.pop('outputs', False)
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        path = (stack[-1] if stack else ()) + (vid, )
+
+        stack.append(path)
+        t0, c0 = time(), clock()
+        ret = None
+        try:
+            ret = func(*args, **kwds)
+            return ret
+        finally:
+            wall, cpu = time() - t0, clock() - c0
+            stack.pop()
+            if inputs is None:
+                inputs = getattr(actor, 'inputs', ())
+            if outputs:
+                outputs = ret if isinstance(ret, (tuple, list)) else (ret, )
+            else:
+                outputs = getattr(actor, 'outputs', ())
+            self._record(path, actor, wall, cpu,
+                         wall if call_time is None else call_time[0],
+                         inputs, outputs, stack[-1] if stack else None)
+
+    def _record(self, path, actor, wall, cpu, call, inputs, outputs,
+                parent):
+        with self._lock:
+            stats = self.vertices.get(path)
+            if stats is None:
+                stats = self.vertices[path] = VertexStats(path, '', '')
+            if not stats.count:
+                stats.package, stats.name = node_label(actor)
+            stats.count += 1
+            stats.wall += wall
+            stats.cpu += cpu
+            stats.call += call
+            stats.input_size += size_of(inputs)
+            stats.output_size += size_of(outputs)
+            if parent is not None:
+                # the parent is fully recorded when its evaluation ends
+                if parent not in self.vertices:
+                    self.vertices[parent] = VertexStats(parent, '', '')
+                self.vertices[parent].children += wall
+
+    def sorted_stats(self, key='wall'):
+        """ Return the list of VertexStats sorted by decreasing key
+        ('wall', 'cpu', 'call', 'count'...) """
+        return sorted(self.vertices.itervalues(),
+                      key=lambda s: getattr(s, key) if key != 'notify'
+                      else s.notify(), reverse=True)
+
+    def print_stats(self, key='wall', limit=20, out=None):
+        """ Print the limit vertices with the highest key """
+        out = out if out is not None else sys.stdout
+        fmt = "%8s %10s %10s %10s %10s %12s %12s  %s\n"
+        out.write(fmt % ('count', 'wall', 'cpu', 'call', 'notify',
+                         'input size', 'output size', 'vertex'))
+        for s in self.sorted_stats(key)[:limit]:
+            out.write(fmt % (s.count, "%.4f" % s.wall, "%.4f" % s.cpu,
+                             "%.4f" % s.call, "%.4f" % s.notify(),
+                             s.input_size, s.output_size,
+                             "%s %s" % ('/'.join(map(str, s.path)),
+                                        s.label())))
+
+    # pstats
+    def create_stats(self):
+        """ Build the pstats statistics: pstats.Stats(profiler) """
+        def func(stats):
+            return (stats.location(), stats.path[-1], stats.label())
+
+        pstats = {}
+        for path, stats in self.vertices.iteritems():
+            callers = {}
+            parent = self.vertices.get(path[:-1])
+            if parent is not None:
+                callers[func(parent)] = (stats.count, stats.count,
+                                         stats.own(), stats.wall)
+            pstats[func(stats)] = (stats.count, stats.count, stats.own(),
+                                   stats.wall, callers)
+        # read by pstats.Stats
+        self.stats = pstats
+        return pstats
+
+    def dump_stats(self, filename):
+        """ Write the statistics in the format of the pstats module """
+        f = open(filename, 'wb')
+        try:
+            marshal.dump(self.create_stats(), f)
+        finally:
+            f.close()
+
+    # callgrind
+    def getstats(self):
+        """ Return the statistics as cProfile.Profile.getstats does """
+        entries = []
+        codes = dict((path, _Code(stats))
+                     for path, stats in self.vertices.iteritems())
+        for path, stats in self.vertices.iteritems():
+            calls = [_Entry(codes[p], s.count, s.wall)
+                     for p, s in self.vertices.iteritems()
+                     if p[:-1] == path]
+            entries.append(_Entry(codes[path], stats.count, stats.wall,
+                                  stats.own(), calls))
+        return entries
+
+    def dump_callgrind(self, filename):
+        """ Write the statistics for kcachegrind (needs openalea.misc) """
+        from openalea.misc.lsprofcalltree import KCacheGrind
+
+        f = open(filename, 'w')
+        try:
+            KCacheGrind(self).output(f)
+        finally:
+            f.close()
+
+    # flame graph
+    def flamegraph(self):
+        """ Return the tree {name, value, children} of the wall times in
+        microseconds, as used by d3-flame-graph. """
+        nodes = {}
+
+        def node(path):
+            if path not in nodes:
+                stats = self.vertices.get(path)
+                nodes[path] = dict(
+                    name=stats.label() if stats is not None else 'root',
+                    value=int(1e6 * stats.wall) if stats is not None else 0,
+                    children=[])
+                if path:
+                    node(path[:-1])['children'].append(nodes[path])
+            return nodes[path]
+
+        root = node(())
+        for path in sorted(self.vertices):
+            node(path)
+        root['value'] = sum(child['value'] for child in root['children'])
+        return root
+
+    def dump_flamegraph(self, filename):
+        """ Write the flame graph in json """
+        f = open(filename, 'w')
+        try:
+            json.dump(self.flamegraph(), f)
+        finally:
+            f.close()
+
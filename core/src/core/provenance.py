@@ -0,0 +1,502 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module records the provenance of dataflow evaluations in SQLite.
+
+The evaluation algorithms call the node_exec hook of their Provenance
+object after each node evaluation. DBProvenance only puts an event in the
+queue of a ProvenanceRecorder. A background thread writes the queued
+events in the provenance database by batches, in one transaction per
+batch. The database is in WAL mode, so it can be queried while the
+recorder writes. A batch which can not be written is logged and dropped,
+if the database can not be used at all the recorder stops and the
+recording is disabled::
+
+    from openalea.core.provenance import enable_provenance
+    recorder = enable_provenance()
+    ...
+    recorder.flush()
+    print recorder.node_executions()
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import atexit
+import itertools
+import sqlite3
+import threading
+import Queue
+from time import time
+
+from openalea.core.path import path
+from openalea.core import logger
+from openalea.core import settings
+
+db_conn = None
+
+
+def db_create(cursor):
+    cur = cursor
+    #-prospective provenance-#
+    #User table creation
+    cur.execute("CREATE TABLE IF NOT EXISTS User (userid INTEGER,createtime DATETIME,name varchar (25), firstname varchar (25), email varchar (25), password varchar (25),PRIMARY KEY(userid))")
+
+    # CompositeNode table creation
+    cur.execute("CREATE TABLE IF NOT EXISTS CompositeNode (CompositeNodeid INTEGER, creatime DATETIME, name varchar (25), description varchar (25),userid INTEGER,PRIMARY KEY(CompositeNodeid),FOREIGN KEY(userid) references User)")
+    #Cr?ation de la table Node
+    cur.execute("CREATE TABLE IF NOT EXISTS Node (Nodeid INTEGER, createtime DATETIME, name varchar (25), NodeFactory varchar (25),CompositeNodeid INTEGER,PRIMARY KEY(Nodeid),FOREIGN KEY(CompositeNodeid) references CompsiteNode)")
+    #Cr?ation de la table Input
+    cur.execute("CREATE TABLE IF NOT EXISTS Input (Inputid INTEGER, createtime DATETIME, name varchar (25), typedata varchar (25), InputPort INTEGER,PRIMARY KEY (Inputid))")
+    #Cr?ation de la table Output
+    cur.execute("CREATE TABLE IF NOT EXISTS Output (Outputid INTEGER, createtime DATETIME, name varchar (25), typedata varchar (25), OutputPort INTEGER,PRIMARY KEY (Outputid))")
+    #Cr?ation de la table elt_connection
+    cur.execute("CREATE TABLE IF NOT EXISTS elt_connection (elt_connectionid INTEGER, createtime DATETIME,srcNodeid INTEGER, srcNodeOutputPortid INTEGER, targetNodeid INTEGER, targetNodeInputPortid INTEGER ,PRIMARY KEY (elt_connectionid))")
+
+    #- retrospective provenance -#
+    #- CompositeNodeExec table creation
+    cur.execute("CREATE TABLE IF NOT EXISTS CompositeNodeExec (CompositeNodeExecid INTEGER, createtime DATETIME, endtime DATETIME,userid INTEGER,CompositeNodeid INTEGER,PRIMARY KEY(CompositeNodeExecid),FOREIGN KEY(CompositeNodeid) references CompositeNode,FOREIGN KEY(userid) references User)")
+    #- NodeExec 
+    cur.execute("CREATE TABLE IF NOT EXISTS NodeExec (NodeExecid INTEGER, createtime DATETIME, endtime DATETIME,Nodeid INTEGER,CompositeNodeExecid INTEGER,dataid INTEGER,PRIMARY KEY(NodeExecid),FOREIGN KEY(Nodeid) references Node, FOREIGN KEY (CompositeNodeExecid) references CompositeNodeExec, FOREIGN KEY (dataid) references Data)")
+    #- History
+    cur.execute("CREATE TABLE IF NOT EXISTS Histoire (Histoireid INTEGER, createtime DATETIME, name varchar (25), description varchar (25),userid INTEGER,CompositeNodeExecid INTEGER,PRIMARY KEY (Histoireid), FOREIGN KEY(Userid) references User, FOREIGN KEY(CompositeNodeExecid) references CompositeNodeExec)")
+    #- Data
+    cur.execute("CREATE TABLE IF NOT EXISTS Data (dataid INTEGER, createtime DATETIME,NodeExecid INTEGER, PRIMARY KEY(dataid),FOREIGN KEY(NodeExecid) references NodeExec)")
+    #- Tag
+    cur.execute("CREATE TABLE IF NOT EXISTS Tag (CompositeNodeExecid INTEGER, createtime DATETIME, name varchar(25),userid INTEGER,PRIMARY KEY(CompositeNodeExecid),FOREIGN KEY(userid) references User)")
+    return cur
+
+
+def get_database_name():
+    db_fn = path(settings.get_openalea_home_dir())/'provenance.sq3'
+    return db_fn
+
+
+def db_connexion():
+    """ Return a cursor on the database.
+
+    If the database does not exists, create it.
+    """
+    global db_conn
+    if db_conn is None:
+        db_conn = sqlite3.connect(get_database_name())
+        db_create(db_conn.cursor())
+        db_conn.commit()
+    return db_conn.cursor()
+
+
+class Provenance(object):
+    def __init__(self, workflow):
+        self.clear()
+        self.workflow = workflow
+
+    def edges(self):
+        cn = self.workflow
+        edges= list(cn.edges())
+        sources=map(cn.source,edges)
+        targets = map(cn.target,edges)
+        source_ports=[cn.local_id(cn.source_port(eid)) for eid in edges]
+        target_ports=[cn.local_id(cn.target_port(eid)) for eid in edges]
+        _edges = dict(zip(edges,zip(sources,source_ports,targets, target_ports)))
+        return _edges
+
+    def clear(self):
+        self.nodes = []
+
+    def start_time(self):
+        pass
+    def end_time(self):
+        pass
+    def workflow_exec(self, *args):
+        pass
+    def node_exec(self, vid, node, start_time, end_time, *args):
+        pass
+    def write(self):
+        """ Write the provenance in db """
+
+
+def factory_name(obj):
+    """ Return 'package:factory' for a node or a dataflow, None if it has
+    no factory """
+    factory = getattr(obj, 'factory', None)
+    if factory is None:
+        return None
+    pkg = factory.package
+    if pkg is None:
+        return factory.name
+    return '%s:%s' % (pkg.name, factory.name)
+
+
+class ProvenanceRecorder(object):
+    """ Write provenance events in a SQLite database from a background thread
+    """
+
+    def __init__(self, filename=None, batch_size=500, flush_interval=0.5,
+                 max_pending=100000):
+        """
+        :param filename: the database, default is get_database_name()
+        :param batch_size: max number of events written in one transaction
+        :param flush_interval: max delay in seconds before queued events
+            are written
+        :param max_pending: max number of queued events, evaluation waits
+            for the writer beyond this number
+        """
+        if filename is None:
+            filename = get_database_name()
+        self.filename = str(filename)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = Queue.Queue(max_pending)
+        self._exec_ids = itertools.count(1)
+        self._thread = None
+        self._lock = threading.Lock()
+        # True once the writer thread has stopped on an error
+        self.dead = False
+
+        # overhead of the recording in the evaluation thread
+        self.nb_events = 0
+        self.record_time = 0.
+
+    def start(self):
+        """ Start the writer thread (called by the first record) """
+        with self._lock:
+            if self._thread is None:
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run,
+                                                args=(ready,))
+                self._thread.daemon = True
+                self._thread.start()
+                ready.wait()
+
+    def record(self, event):
+        """ Put an event in the queue of the writer, the event is dropped
+        if the writer has stopped on an error """
+        t0 = time()
+        if self.dead:
+            return
+        if self._thread is None:
+            self.start()
+        self._put(event)
+        self.nb_events += 1
+        self.record_time += time() - t0
+
+    def _put(self, event):
+        """ Put event in the queue, wait while it is full unless the writer
+        thread stops meanwhile """
+        try:
+            self._queue.put_nowait(event)
+        except Queue.Full:
+            thread = self._thread
+            while thread is not None and thread.is_alive():
+                try:
+                    self._queue.put(event, timeout=self.flush_interval)
+                    break
+                except Queue.Full:
+                    pass
+
+    def overhead(self):
+        """ Return the mean time in seconds spent in the evaluation thread
+        to record an event """
+        if not self.nb_events:
+            return 0.
+        return self.record_time / self.nb_events
+
+    # events
+    def workflow_start(self, workflow, start_time=None):
+        """ Record the start of the evaluation of a dataflow.
+
+        Return a key identifying this evaluation.
+        """
+        key = self._exec_ids.next()
+        self.record(('workflow_start', key, factory_name(workflow),
+                     start_time or time()))
+        return key
+
+    def workflow_end(self, key, end_time=None):
+        """ Record the end of the evaluation identified by key """
+        self.record(('workflow_end', key, end_time or time()))
+
+    def node_exec(self, key, workflow, vid, node, start_time, end_time):
+        """ Record the evaluation of node vid of workflow during the
+        dataflow evaluation identified by key (may be None) """
+        self.record(('node_exec', key, factory_name(workflow), vid,
+                     node.get_caption(), factory_name(node),
+                     start_time, end_time))
+
+    # writer
+    def _run(self, ready):
+        try:
+            conn = sqlite3.connect(self.filename)
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                db_create(conn.cursor())
+                conn.commit()
+                writer = _BatchWriter(conn)
+                ready.set()
+                self._write_events(writer)
+            finally:
+                conn.close()
+        except Exception, e:
+            ready.set()
+            logger.error("Provenance recording stopped, cannot write in "
+                         "%s: %s" % (self.filename, e))
+            self._fail()
+        finally:
+            ready.set()
+
+    def _write_events(self, writer):
+        """ Write the queued events by batches until None is queued """
+        stop = False
+        while not stop:
+            try:
+                events = [self._queue.get(timeout=self.flush_interval)]
+            except Queue.Empty:
+                continue
+            while len(events) < self.batch_size:
+                try:
+                    events.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            stop = None in events
+            try:
+                writer.write([e for e in events if e is not None])
+            except Exception, e:
+                logger.error("%d provenance events are lost: %s" %
+                             (len(events), e))
+                writer.rollback()
+            finally:
+                for e in events:
+                    self._queue.task_done()
+
+    def _fail(self):
+        """ Mark the recorder as dead, drop the queued events and disable
+        the recording if it is the current recorder """
+        self.dead = True
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Queue.Empty:
+                break
+            self._queue.task_done()
+        _stop_recording(self)
+
+    def flush(self):
+        """ Wait until all the queued events are written, or the writer
+        thread has stopped """
+        thread = self._thread
+        if thread is None:
+            return
+        queue = self._queue
+        with queue.all_tasks_done:
+            while queue.unfinished_tasks and thread.is_alive():
+                queue.all_tasks_done.wait(self.flush_interval)
+
+    def close(self):
+        """ Write the queued events and stop the writer thread """
+        with self._lock:
+            if self._thread is not None:
+                self._put(None)
+                self._thread.join()
+                self._thread = None
+
+    # queries
+    def query(self, sql, params=()):
+        """ Flush the queued events and return the rows selected by sql """
+        self.flush()
+        conn = sqlite3.connect(self.filename)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def workflow_executions(self, workflow=None):
+        """ Return the list of (exec id, workflow, start, end) of the
+        recorded dataflow evaluations, for a given workflow if not None """
+        sql = """SELECT e.CompositeNodeExecid, c.name, e.createtime, e.endtime
+                 FROM CompositeNodeExec e
+                 LEFT JOIN CompositeNode c
+                 ON e.CompositeNodeid = c.CompositeNodeid"""
+        params = ()
+        if workflow is not None:
+            sql += " WHERE c.name = ?"
+            params = (workflow, )
+        return self.query(sql + " ORDER BY e.CompositeNodeExecid", params)
+
+    def node_executions(self, exec_id=None):
+        """ Return the list of (workflow, node caption, node factory, start,
+        end, exec id) of the recorded node evaluations, for a given
+        dataflow evaluation if exec_id is not None """
+        sql = """SELECT c.name, n.name, n.NodeFactory, e.createtime,
+                        e.endtime, e.CompositeNodeExecid
+                 FROM NodeExec e
+                 JOIN Node n ON e.Nodeid = n.Nodeid
+                 LEFT JOIN CompositeNode c
+                 ON n.CompositeNodeid = c.CompositeNodeid"""
+        params = ()
+        if exec_id is not None:
+            sql += " WHERE e.CompositeNodeExecid = ?"
+            params = (exec_id, )
+        return self.query(sql + " ORDER BY e.NodeExecid", params)
+
+
+class _BatchWriter(object):
+    """ Write events in the database, used by the writer thread """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.workflows = {}  # {workflow name: CompositeNodeid}
+        self.nodes = {}  # {(workflow, vid, caption, factory): Nodeid}
+        self.execs = {}  # {recorder key: CompositeNodeExecid}
+
+    def workflow_id(self, cur, name, t):
+        wid = self.workflows.get(name)
+        if wid is None:
+            cur.execute("INSERT INTO CompositeNode (creatime, name) "
+                        "VALUES (?, ?)", (t, name))
+            wid = self.workflows[name] = cur.lastrowid
+        return wid
+
+    def node_id(self, cur, workflow, vid, caption, factory, t):
+        key = (workflow, vid, caption, factory)
+        nid = self.nodes.get(key)
+        if nid is None:
+            wid = self.workflow_id(cur, workflow, t)
+            cur.execute("INSERT INTO Node (createtime, name, NodeFactory, "
+                        "CompositeNodeid) VALUES (?, ?, ?, ?)",
+                        (t, caption, factory, wid))
+            nid = self.nodes[key] = cur.lastrowid
+        return nid
+
+    def write(self, events):
+        """ Write events in a single transaction """
+        cur = self.conn.cursor()
+        node_execs = []
+        for event in events:
+            kind = event[0]
+            if kind == 'node_exec':
+                key, workflow, vid, caption, factory, t0, t1 = event[1:]
+                nid = self.node_id(cur, workflow, vid, caption, factory, t0)
+                node_execs.append((t0, t1, nid, self.execs.get(key)))
+            elif kind == 'workflow_start':
+                key, workflow, t = event[1:]
+                wid = self.workflow_id(cur, workflow, t)
+                cur.execute("INSERT INTO CompositeNodeExec (createtime, "
+                            "CompositeNodeid) VALUES (?, ?)", (t, wid))
+                self.execs[key] = cur.lastrowid
+            elif kind == 'workflow_end':
+                key, t = event[1:]
+                self.flush_nodes(cur, node_execs)
+                cur.execute("UPDATE CompositeNodeExec SET endtime = ? "
+                            "WHERE CompositeNodeExecid = ?",
+                            (t, self.execs.pop(key, None)))
+        self.flush_nodes(cur, node_execs)
+        self.conn.commit()
+
+    def rollback(self):
+        """ Cancel the transaction of a batch which can not be written """
+        try:
+            self.conn.rollback()
+        except Exception:
+            pass
+        # the ids of the cancelled transaction are not valid anymore
+        self.workflows.clear()
+        self.nodes.clear()
+        self.execs.clear()
+
+    def flush_nodes(self, cur, node_execs):
+        if node_execs:
+            cur.executemany("INSERT INTO NodeExec (createtime, endtime, "
+                            "Nodeid, CompositeNodeExecid) VALUES (?, ?, ?, ?)",
+                            node_execs)
+            del node_execs[:]
+
+
+class DBProvenance(Provenance):
+    """ Provenance of the evaluations of a dataflow recorded in a database
+    by the current recorder (see enable_provenance) """
+
+    def clear(self):
+        Provenance.clear(self)
+        self._exec = None
+
+    def workflow_exec(self, *args):
+        recorder = get_recorder()
+        if recorder is not None:
+            self._exec = recorder.workflow_start(self.workflow)
+
+    def end_time(self):
+        recorder = get_recorder()
+        if recorder is not None and self._exec is not None:
+            recorder.workflow_end(self._exec)
+        self._exec = None
+
+    def node_exec(self, vid, node, start_time, end_time, *args):
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.node_exec(self._exec, self.workflow, vid, node,
+                               start_time, end_time)
+
+
+_recorder = None
+
+
+def get_recorder():
+    """ Return the current provenance recorder, None if disabled """
+    return _recorder
+
+
+def enable_provenance(recorder=None):
+    """ Record the provenance of the evaluations.
+
+    :param recorder: a ProvenanceRecorder, default one is created if None
+    """
+    global _recorder
+    from openalea.core.algo import dataflow_evaluation
+
+    if recorder is None:
+        recorder = ProvenanceRecorder()
+    if _recorder is not None and _recorder is not recorder:
+        _recorder.close()
+    _recorder = recorder
+    dataflow_evaluation.provenance_class = DBProvenance
+    dataflow_evaluation.PROVENANCE = True
+    return recorder
+
+
+def _stop_recording(recorder=None):
+    """ Disable the recording, if the current recorder is recorder (when
+    not None). Return the recorder which was used. """
+    global _recorder
+    from openalea.core.algo import dataflow_evaluation
+
+    current = _recorder
+    if recorder is None or current is recorder:
+        dataflow_evaluation.PROVENANCE = False
+        _recorder = None
+    return current
+
+
+def disable_provenance():
+    """ Stop recording the provenance, the queued events are written """
+    recorder = _stop_recording()
+    if recorder is not None:
+        recorder.close()
+
+
+@atexit.register
+def _close_recorder():
+    if _recorder is not None:
+        _recorder.close()
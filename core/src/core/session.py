@@ -29,6 +29,7 @@ from openalea.core.compositenode import CompositeNodeFactory
 from openalea.core.pkgmanager import PackageManager
 from openalea.core.observer import Observed
 from openalea.core.datapool import DataPool
+from openalea.core.sessionstore import SessionStore
 
 from openalea.core.service.interface import load_interfaces
 
@@ -66,6 +67,9 @@ class Session(Observed):
         self.empty_cnode_factory = CompositeNodeFactory("Workspace")
         self.clipboard = CompositeNodeFactory("Clipboard")
 
+        # store of the last saved or loaded session
+        self._store = None
+
         self.init()
 
     # gengraph
@@ -143,11 +147,21 @@ class Session(Observed):
         self.pkgmanager.clear()
         self.init(create_workspace)
 
+    def get_store(self):
+        """ Return the store of session_filename """
+        store = self._store
+        if store is None or store.dirname != self.session_filename:
+            store = self._store = SessionStore(self.session_filename)
+        return store
+
     def save(self, filename=None):
         """
         Save session in filename
         user_pkg and workspaces data are saved
 
+        Only the workspaces and the data which have changed since the last
+        save are written (see SessionStore).
+
         Be careful, this method do not work very well if data are not
         persistent.
         """
@@ -155,8 +169,6 @@ class Session(Observed):
         if (filename):
             self.session_filename = filename
 
-        d = shelve.open(self.session_filename, writeback=True)
-
         # modules
         modules_path = []
         for k in sys.modules.keys():
@@ -164,34 +176,28 @@ class Session(Observed):
             if hasattr(m, '__file__'):
                 modules_path.append((m.__name__, os.path.abspath(m.__file__)))
 
-        d['__modules__'] = modules_path
-        d.sync()
+        store = self.get_store()
+        store.start(modules_path)
 
         # datapool
-        d['datapool'] = {}
         for key in self.datapool:
-
             try:
-                d['datapool'][key] = self.datapool[key]
-                d.sync()
+                # the entries which have not been loaded are not unpickled
+                store.add_data(key, dict.__getitem__(self.datapool, key))
             except Exception, e:
                 print e
                 print "Unable to save %s in the datapool..." % str(key)
-                del d['datapool'][key]
 
         # workspaces
-        d['workspaces'] = []
         for cpt, ws in enumerate(self.workspaces):
             try:
-                d['workspaces'].append(ws)
-                d.sync()
+                store.add_workspace(ws)
             except Exception, e:
                 print e
                 print "Unable to save workspace %i. Skip this." % (cpt, )
                 print " WARNING: Your session is not saved. Please save your dataflow as a composite node !!!!!"
-                d['workspaces'].pop()
 
-        d.close()
+        store.commit()
 
     def load(self, filename):
         """ Load session data from filename """
@@ -200,6 +206,20 @@ class Session(Observed):
 
         self.session_filename = filename
 
+        if SessionStore.is_store(filename):
+            store = self.get_store()
+
+            for name, path in store.modules():
+                self.load_module(name, path)
+
+            # the data are loaded on first access
+            self.datapool.update(store.datapool())
+            self.workspaces.extend(store.workspaces())
+
+            self.notify_listeners()
+            return
+
+        # session saved with shelve
         d = shelve.open(self.session_filename)
 
         # modules
@@ -0,0 +1,295 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""This module provides the on-disk store of a session.
+
+A store is a directory::
+
+    index.pkl           modules, data pool keys and workspaces
+    objects/<sha1>.pkl  one pickle per data pool entry and per workspace
+    arrays/<sha1>.npy   large numpy arrays found in these objects
+
+The files are named after the digest of their content, hence saving a
+session again only writes the entries which have changed, and the files
+which are not referenced anymore are removed once the new index is written.
+
+The arrays are memory mapped (read only) when they are loaded, and the
+data pool entries are only unpickled on first access (see LazyData)::
+
+    store = SessionStore(dirname)
+    store.start(modules)
+    store.add_data('x', value)
+    store.add_workspace(composite_node)
+    store.commit()
+
+    store = SessionStore(dirname)
+    data = store.datapool()
+    workspaces = store.workspaces()
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import sys
+import cPickle
+import hashlib
+import weakref
+from cStringIO import StringIO
+
+from openalea.core.datapool import LazyData
+
+# increment when the format of the store changes
+STORE_VERSION = 1
+
+INDEX = 'index.pkl'
+
+
+def get_numpy():
+    """ Return the numpy module if it has been imported, else None (no
+    array can exist) """
+    return sys.modules.get('numpy')
+
+
+def array_digest(array):
+    """ Return the sha1 digest of the content of a numpy array """
+    numpy = get_numpy()
+    h = hashlib.sha1('%s:%s:' % (array.dtype.str, array.shape))
+    h.update(numpy.ascontiguousarray(array).data)
+    return h.hexdigest()
+
+
+def write_file(filename, data):
+    """ Write data in filename through a temporary file """
+    tmp = filename + '.tmp'
+    f = open(tmp, 'wb')
+    try:
+        f.write(data)
+    finally:
+        f.close()
+    os.rename(tmp, filename)
+
+
+class StoredData(LazyData):
+    """ Data pool entry of a store, unpickled on first access """
+
+    def __init__(self, store, entry):
+        self.store = store
+        self.entry = entry
+
+    def load(self):
+        return self.store.load_entry(self.entry)
+
+
+class SessionStore(object):
+    """ Incremental on-disk store of a session """
+
+    # arrays smaller than this size (in bytes) are kept in the pickles
+    min_array_size = 2 ** 16
+    # mode used to map the arrays (see numpy.load)
+    mmap_mode = 'r'
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        # {id(array): (weakref, digest)} of the arrays read only mapped from
+        # the store, which do not need to be hashed again
+        self._arrays = {}
+        self._index = None
+        self._pending = None
+        # previous session saved with shelve, replaced by the new store
+        # (written in dirname.new) when it is committed
+        self._replace = None
+        # number of files written by the last save
+        self.written = 0
+
+    @staticmethod
+    def is_store(filename):
+        """ Return True if filename is a session store """
+        return os.path.isfile(os.path.join(filename, INDEX))
+
+    def _filename(self, kind, digest):
+        ext = '.npy' if kind == 'arrays' else '.pkl'
+        return os.path.join(self.dirname, kind, digest + ext)
+
+    ################################################
+    # index
+
+    def read_index(self):
+        """ Return the index of the store, None if there is none """
+        if self._index is None and self.is_store(self.dirname):
+            f = open(os.path.join(self.dirname, INDEX), 'rb')
+            try:
+                index = cPickle.load(f)
+            finally:
+                f.close()
+            if index.get('version') != STORE_VERSION:
+                raise IOError("Unknown session store version %r in %s" %
+                              (index.get('version'), self.dirname))
+            self._index = index
+        return self._index
+
+    def start(self, modules=()):
+        """ Start a new version of the session
+
+        :param modules: list of (module name, path) to import before
+            loading the objects
+        """
+        if self._replace is not None:
+            # the previous version has not been committed
+            self.dirname, self._replace = self._replace, None
+        if os.path.isfile(self.dirname):
+            # previous session saved with shelve, kept until the commit
+            self._replace = self.dirname
+            self.dirname += '.new'
+        for kind in ('objects', 'arrays'):
+            dirname = os.path.join(self.dirname, kind)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+        self._pending = dict(version=STORE_VERSION, modules=list(modules),
+                             datapool={}, workspaces=[])
+        self.written = 0
+
+    def add_data(self, key, value):
+        """ Store a data pool entry """
+        if isinstance(value, StoredData) and value.store is self:
+            # not loaded since the last save, hence not modified
+            entry = value.entry
+        else:
+            if isinstance(value, LazyData):
+                value = value.load()
+            entry = self.dump(value)
+        self._pending['datapool'][key] = entry
+
+    def add_workspace(self, workspace):
+        """ Store a workspace """
+        self._pending['workspaces'].append(self.dump(workspace))
+
+    def commit(self):
+        """ Write the index of the new version and remove the files which
+        are not used anymore """
+        index, self._pending = self._pending, None
+        write_file(os.path.join(self.dirname, INDEX),
+                   cPickle.dumps(index, cPickle.HIGHEST_PROTOCOL))
+        self._index = index
+        if self._replace is not None:
+            os.remove(self._replace)
+            os.rename(self.dirname, self._replace)
+            self.dirname, self._replace = self._replace, None
+
+        entries = index['workspaces'] + index['datapool'].values()
+        used = dict(objects=set(digest for digest, arrays in entries),
+                    arrays=set(a for digest, arrays in entries
+                               for a in arrays))
+        for kind, digests in used.iteritems():
+            dirname = os.path.join(self.dirname, kind)
+            for name in os.listdir(dirname):
+                if os.path.splitext(name)[0] not in digests:
+                    try:
+                        os.remove(os.path.join(dirname, name))
+                    except OSError:
+                        pass
+
+    ################################################
+    # objects
+
+    def dump(self, obj):
+        """ Write the pickle of obj (and its arrays) if it is not already
+        stored, return its entry (digest, array digests) """
+        arrays = {}
+
+        def persistent_id(o):
+            digest = self.array_id(o)
+            if digest is not None:
+                arrays[digest] = o
+            return digest
+
+        f = StringIO()
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(obj)
+        data = f.getvalue()
+        digest = hashlib.sha1(data).hexdigest()
+
+        numpy = get_numpy()
+        for name, array in arrays.iteritems():
+            filename = self._filename('arrays', name)
+            if not os.path.exists(filename):
+                tmp = filename + '.tmp'
+                f = open(tmp, 'wb')
+                try:
+                    numpy.save(f, array)
+                finally:
+                    f.close()
+                os.rename(tmp, filename)
+                self.written += 1
+
+        filename = self._filename('objects', digest)
+        if not os.path.exists(filename):
+            write_file(filename, data)
+            self.written += 1
+        return digest, tuple(sorted(arrays))
+
+    def array_id(self, obj):
+        """ Return the digest of obj if it is an array stored in its own
+        file, else None """
+        numpy = get_numpy()
+        if (numpy is None or not isinstance(obj, numpy.ndarray) or
+                obj.dtype.hasobject or obj.nbytes < self.min_array_size):
+            return None
+        known = self._arrays.get(id(obj))
+        if known is not None and known[0]() is obj and \
+                not obj.flags.writeable:
+            return known[1]
+        return array_digest(obj)
+
+    def load_array(self, digest):
+        """ Return the array digest, mapped in memory """
+        numpy = get_numpy()
+        if numpy is None:
+            import numpy
+        array = numpy.load(self._filename('arrays', digest),
+                           mmap_mode=self.mmap_mode)
+        self._arrays[id(array)] = (weakref.ref(array), digest)
+        return array
+
+    def load_entry(self, entry):
+        """ Return the object of an entry """
+        digest, arrays = entry
+        f = open(self._filename('objects', digest), 'rb')
+        try:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = self.load_array
+            return unpickler.load()
+        finally:
+            f.close()
+
+    def _get_index(self):
+        index = self.read_index()
+        if index is None:
+            raise IOError("No session store in %s" % self.dirname)
+        return index
+
+    def modules(self):
+        """ Return the list of (module name, path) of the session """
+        return self._get_index()['modules']
+
+    def datapool(self):
+        """ Return the data pool entries {key: StoredData} """
+        entries = self._get_index()['datapool']
+        return dict((key, StoredData(self, entry))
+                    for key, entry in entries.iteritems())
+
+    def workspaces(self):
+        """ Return the list of the workspaces (load the modules first) """
+        return [self.load_entry(entry)
+                for entry in self._get_index()['workspaces']]
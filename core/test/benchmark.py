@@ -0,0 +1,489 @@
+# -*- python -*-
+#
+#       OpenAlea.Core
+#
+#       Copyright 2006-2009 INRIA - CIRAD - INRA
+#
+#       Distributed under the Cecill-C License.
+#       See accompanying file LICENSE.txt or copy at
+#           http://www.cecill.info/licences/Licence_CeCILL-C_V1-en.html
+#
+#       OpenAlea WebSite : http://openalea.gforge.inria.fr
+#
+###############################################################################
+"""Benchmarks of the graph, dataflow and evaluation hot paths.
+
+Synthetic workflows (chains, fan-outs, diamonds, nested composite nodes and
+lambda loops) are built at several sizes, and the best time of a few runs
+is measured for:
+
+  - Graph.add_vertex, add_edge and remove_vertex
+  - the traversal of a Graph and of its snapshot
+  - CompositeNodeFactory.instantiate and CompositeNode.to_factory
+  - the evaluation with each evaluation algorithm
+  - CompositeNode.compile and the call of the compiled function
+  - pickling through Session.save
+  - the memory used by each node and port (bytes, not seconds)
+  - a stream of items pushed through the end of a chain
+
+The results are stored in json, keyed by "workflow/size/operation", to
+compare two runs::
+
+    python benchmark.py -o before.json
+    python benchmark.py -o after.json -c before.json
+"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import sys
+import json
+import math
+import types
+import shutil
+import weakref
+import platform
+import tempfile
+from time import time, strftime
+from optparse import OptionParser
+
+from openalea.core.graph.graph import Graph
+from openalea.core.package import Package
+from openalea.core.pkgmanager import PackageManager
+from openalea.core.node import NodeFactory, AbstractPort
+from openalea.core.compositenode import CompositeNodeFactory, CompositeNode
+from openalea.core.interface import IFunction
+from openalea.core.algo import dataflow_evaluation
+
+SIZES = (10, 100, 1000)
+REPEAT = 3
+
+WORKFLOWS = ('chain', 'fanout', 'diamond', 'nested', 'lambda')
+
+# evaluation algorithms (CompositeEvaluation is the new engine)
+EVALUATORS = ('BrutEvaluation', 'PriorityEvaluation', 'GeneratorEvaluation',
+              'StreamEvaluation', 'LambdaEvaluation', 'ParallelEvaluation',
+              'IncrementalEvaluation', 'DiscreteTimeEvaluation',
+              'CompositeEvaluation')
+
+# number of items of the stream workflow
+ITEMS = 100
+
+PKG_NAME = 'openalea.benchmark'
+
+
+def best_time(func, repeat=REPEAT, setup=None):
+    """ Return the best time of repeat calls of func(setup()) """
+    best = None
+    for i in range(repeat):
+        arg = setup() if setup is not None else None
+        t0 = time()
+        func(arg)
+        t = time() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+
+# Workflows
+def get_package():
+    """ Return the package of the benchmark nodes, registered in the
+    package manager. """
+    pm = PackageManager()
+    if pm.has_key(PKG_NAME):
+        return pm[PKG_NAME]
+
+    pkg = Package(PKG_NAME, {})
+    pkg.add_factory(NodeFactory(
+        'inc', nodemodule='operator', nodeclass='add',
+        inputs=(dict(name='a', value=0), dict(name='b', value=1)),
+        outputs=(dict(name='out'), )))
+    pkg.add_factory(NodeFactory(
+        'X', nodemodule='openalea.core.system.systemnodes',
+        nodeclass='LambdaVar', inputs=(dict(name='name', value='x'), ),
+        outputs=(dict(name='lambda'), )))
+    pkg.add_factory(NodeFactory(
+        'map', nodemodule='', nodeclass='map',
+        inputs=(dict(name='function', interface=IFunction),
+                dict(name='seq', value=[])),
+        outputs=(dict(name='out'), )))
+    pkg.add_factory(NodeFactory(
+        'range', nodemodule='', nodeclass='range',
+        inputs=(dict(name='n', value=0), ), outputs=(dict(name='out'), )))
+    pm.add_package(pkg)
+    return pkg
+
+
+def add(cn, name, *sources):
+    """ Add a node of the benchmark package connected to the sources
+    (vid or (vid, port)), return its vid. """
+    vid = cn.add_node(get_package()[name].instantiate())
+    for port, src in enumerate(sources):
+        if not isinstance(src, tuple):
+            src = (src, 0)
+        cn.connect(src[0], src[1], vid, port)
+    return vid
+
+
+def composite():
+    """ Return an empty composite node with an input x and an output y """
+    cn = CompositeNode(inputs=[dict(name='x', value=0)],
+                       outputs=[dict(name='y')])
+    cn.eval_algo = 'LambdaEvaluation'
+    return cn
+
+
+def chain(size):
+    """ x -> inc -> inc ... -> y """
+    cn = composite()
+    vid = (cn.id_in, 0)
+    for i in range(size):
+        vid = add(cn, 'inc', vid)
+    cn.connect(vid, 0, cn.id_out, 0)
+    return cn
+
+
+def fanout(size):
+    """ x -> inc -> size inc """
+    cn = composite()
+    root = add(cn, 'inc', (cn.id_in, 0))
+    for i in range(size - 1):
+        vid = add(cn, 'inc', root)
+    cn.connect(vid, 0, cn.id_out, 0)
+    return cn
+
+
+def diamond(size):
+    """ series of diamonds a -> (b, c) -> a' (3 nodes per diamond) """
+    cn = composite()
+    vid = add(cn, 'inc', (cn.id_in, 0))
+    for i in range(max(1, (size - 1) / 3)):
+        left = add(cn, 'inc', vid)
+        right = add(cn, 'inc', vid)
+        vid = add(cn, 'inc', left, right)
+    cn.connect(vid, 0, cn.id_out, 0)
+    return cn
+
+
+def nested(size):
+    """ sqrt(size) nested composite nodes made of a chain of sqrt(size)
+    nodes followed by the nested composite node """
+    pkg = get_package()
+    nb = max(1, int(math.sqrt(size)))
+    name = None
+    for level in range(nb):
+        cn = composite()
+        vid = (cn.id_in, 0)
+        for i in range(nb - 1):
+            vid = add(cn, 'inc', vid)
+        if name is not None:
+            vid = add(cn, name, vid)
+        cn.connect(vid, 0, cn.id_out, 0)
+        name = 'nested_%d_%d' % (size, level)
+        factory = CompositeNodeFactory(name)
+        cn.to_factory(factory)
+        pkg.add_factory(factory)
+    return cn
+
+
+def lambda_loop(size):
+    """ map(X + 1, range(size)) """
+    cn = composite()
+    func = add(cn, 'inc', add(cn, 'X'))
+    vid = add(cn, 'map', func, add(cn, 'range', (cn.id_in, 0)))
+    cn.connect(vid, 0, cn.id_out, 0)
+    cn.set_input(0, size)
+    return cn
+
+
+def stream(size, items=ITEMS):
+    """ x -> inc ... -> inc -> inc -> y
+                  iter(range(items)) -^ """
+    from openalea.core.system.systemnodes import IterNode
+    cn = chain(size)
+    last = list(cn.in_neighbors(cn.id_out))[0]
+    cn.disconnect(last, 0, cn.id_out, 0)
+    vrange = add(cn, 'range')
+    cn.node(vrange).set_input(0, items)
+    vit = cn.add_node(IterNode([dict(name='generator')],
+                               [dict(name='value')]))
+    cn.connect(vrange, 0, vit, 0)
+    cn.connect(add(cn, 'inc', last, vit), 0, cn.id_out, 0)
+    return cn
+
+
+def workflow(name, size):
+    """ Return the composite node of the workflow name """
+    builder = dict(chain=chain, fanout=fanout, diamond=diamond,
+                   nested=nested)
+    return builder.get(name, lambda_loop)(size)
+
+
+def invalidate(cn):
+    """ Force the evaluation of all the nodes of cn and its subnodes """
+    for vid in cn.vertices():
+        node = cn.node(vid)
+        node.modified = True
+        if isinstance(node, CompositeNode):
+            invalidate(node)
+    return cn
+
+
+# Benchmarks
+def bench_graph(size, repeat=REPEAT):
+    """ Return the times of the Graph methods for size vertices """
+    res = {}
+
+    def add_vertices(g):
+        for i in xrange(size):
+            g.add_vertex()
+    res['add_vertex'] = best_time(add_vertices, repeat, Graph)
+
+    def vertices():
+        g = Graph()
+        add_vertices(g)
+        return g
+
+    def add_edges(g):
+        for i in xrange(size - 1):
+            g.add_edge((i, i + 1))
+    res['add_edge'] = best_time(add_edges, repeat, vertices)
+
+    def edges():
+        g = vertices()
+        add_edges(g)
+        return g
+
+    def out_neighbors(g):
+        for vid in g.vertices():
+            for nid in g.out_neighbors(vid):
+                pass
+    res['out_neighbors'] = best_time(out_neighbors, repeat, edges)
+    res['snapshot'] = best_time(lambda g: g.snapshot(), repeat, edges)
+    res['snapshot_out_neighbors'] = best_time(
+        out_neighbors, repeat, lambda: edges().snapshot())
+
+    def remove_vertices(g):
+        for vid in range(size):
+            g.remove_vertex(vid)
+    res['remove_vertex'] = best_time(remove_vertices, repeat, edges)
+    return res
+
+
+# objects shared by the instances or not owned by the reached objects
+_opaque_types = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                 types.BuiltinFunctionType, types.MethodType,
+                 weakref.ReferenceType, weakref.ProxyType,
+                 weakref.CallableProxyType)
+
+
+def reachable(obj, stop=()):
+    """ Return {id: object} of the objects reachable from obj, through
+    containers and attributes, without crossing the instances of stop """
+    seen = {}
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen[id(o)] = o
+        if isinstance(o, _opaque_types) or (o is not obj and
+                                            isinstance(o, stop)):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.iterkeys())
+            stack.extend(o.itervalues())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        d = getattr(o, '__dict__', None)
+        if isinstance(d, dict):
+            stack.append(d)
+        for cls in type(o).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if hasattr(o, name) and name not in ('__dict__',
+                                                     '__weakref__'):
+                    stack.append(getattr(o, name))
+    return seen
+
+
+def own_size(obj, other, stop=()):
+    """ Return the size in bytes of the objects reachable from obj but not
+    from other, an object of the same kind (thus the shared data, class
+    attributes, interned strings... are not counted) """
+    ref = reachable(other, stop)
+    return sum(sys.getsizeof(o) for i, o in reachable(obj, stop).iteritems()
+               if i not in ref and not (o is not obj and isinstance(o, stop)))
+
+
+def bench_memory(size):
+    """ Return the mean size in bytes of the nodes (without their ports),
+    of their ports and of the ports of the dataflow in a chain of size
+    nodes. """
+    cn = chain(size)
+    nodes = [cn.node(vid) for vid in cn.vertices()
+             if vid not in (cn.id_in, cn.id_out)]
+    ports = [port for node in nodes for port in node.input_desc]
+    pids = [cn.port(pid) for pid in cn._ports]
+
+    def mean(objs, stop=()):
+        return sum(own_size(obj, objs[0], stop)
+                   for obj in objs[1:]) / float(len(objs) - 1)
+
+    return dict(node=mean(nodes, (AbstractPort, CompositeNode)),
+                port=mean(ports), dataflow_port=mean(pids))
+
+
+def bench_stream(size, repeat=REPEAT):
+    """ Return the times of the evaluation of ITEMS items pushed through
+    a node fed by a chain of size nodes """
+    cn = stream(size)
+    return dict(('eval/' + algo, bench_evaluation(cn, algo, repeat))
+                for algo in ('GeneratorEvaluation', 'StreamEvaluation'))
+
+
+def bench_evaluation(cn, algo, repeat=REPEAT):
+    """ Return the time of algo.eval() on cn, None if it fails """
+    if algo == 'CompositeEvaluation':
+        evaluation = cn.new_state()[0]
+        setup = evaluation.new_state
+        evaluate = lambda state: evaluation.eval(None, state)
+    else:
+        evaluation = getattr(dataflow_evaluation, algo)(cn)
+        setup = lambda: invalidate(cn)
+        evaluate = lambda cn: evaluation.eval()
+    try:
+        evaluate(setup())
+        return best_time(evaluate, repeat, setup)
+    except Exception:
+        return None
+
+
+class SessionSaver(object):
+    """ Save a workspace with Session.save """
+
+    def __init__(self):
+        from openalea.core.session import Session
+        self.session = Session()
+        get_package()  # packages may have been cleared
+        self.tmpdir = tempfile.mkdtemp()
+
+    def __call__(self, cn):
+        self.session.workspaces = [cn]
+        self.session.save(os.path.join(self.tmpdir, 'session'))
+
+    def close(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def bench_workflow(name, size, repeat=REPEAT, evaluators=EVALUATORS,
+                   saver=None):
+    """ Return the times of the operations on the workflow name """
+    cn = workflow(name, size)
+    res = {}
+    factory = CompositeNodeFactory(name)
+    res['to_factory'] = best_time(lambda x: cn.to_factory(factory), repeat)
+    res['instantiate'] = best_time(lambda x: factory.instantiate(), repeat)
+    for algo in evaluators:
+        res['eval/' + algo] = bench_evaluation(cn, algo, repeat)
+    try:
+        compiled = cn.compile()
+        res['compile'] = best_time(lambda x: cn.compile(), repeat)
+        res['eval/compiled'] = best_time(lambda x: compiled(), repeat)
+    except Exception:
+        res['compile'] = res['eval/compiled'] = None
+    if saver is not None:
+        try:
+            res['session_save'] = best_time(lambda x: saver(cn), repeat)
+        except Exception:
+            res['session_save'] = None
+    return res
+
+
+def run(sizes=SIZES, workflows=WORKFLOWS, repeat=REPEAT,
+        evaluators=EVALUATORS, session=True, verbose=False):
+    """ Run the benchmarks and return a dict {'meta', 'results'} where
+    results is a dict {"workflow/size/operation": best time in seconds}
+    (None if the operation fails). """
+    results = {}
+
+    def store(prefix, times):
+        for op, t in sorted(times.iteritems()):
+            key = '%s/%s' % (prefix, op)
+            results[key] = t
+            if verbose:
+                print "%-50s %s" % (key, "%.6f" % t if t is not None
+                                    else 'failed')
+
+    saver = SessionSaver() if session else None
+    try:
+        for size in sizes:
+            store('graph/%d' % size, bench_graph(size, repeat))
+            store('memory/%d' % size, bench_memory(size))
+            store('stream/%d' % size, bench_stream(size, repeat))
+            for name in workflows:
+                store('%s/%d' % (name, size),
+                      bench_workflow(name, size, repeat, evaluators, saver))
+    finally:
+        if saver is not None:
+            saver.close()
+
+    meta = dict(date=strftime('%Y-%m-%d %H:%M:%S'),
+                python=sys.version.split()[0],
+                platform=platform.platform(),
+                repeat=repeat, sizes=list(sizes))
+    return dict(meta=meta, results=results)
+
+
+def save(data, filename):
+    f = open(filename, 'w')
+    try:
+        json.dump(data, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+
+def load(filename):
+    f = open(filename)
+    try:
+        return json.load(f)
+    finally:
+        f.close()
+
+
+def compare(reference, data):
+    """ Return the list of (key, reference time, time, ratio) of the
+    operations measured in both runs. """
+    ref, res = reference['results'], data['results']
+    cmp = []
+    for key in sorted(set(ref) & set(res)):
+        if ref[key] and res[key]:
+            cmp.append((key, ref[key], res[key], res[key] / ref[key]))
+    return cmp
+
+
+def main(args=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('-o', '--output', help="json file of the results")
+    parser.add_option('-c', '--compare', help="json file of a previous run")
+    parser.add_option('-s', '--sizes', default=','.join(map(str, SIZES)),
+                      help="comma separated sizes of the workflows")
+    parser.add_option('-w', '--workflows', default=','.join(WORKFLOWS))
+    parser.add_option('-r', '--repeat', type='int', default=REPEAT)
+    parser.add_option('--no-session', action='store_true',
+                      help="do not measure Session.save")
+    opts, args = parser.parse_args(args)
+
+    data = run([int(s) for s in opts.sizes.split(',')],
+               opts.workflows.split(','), opts.repeat,
+               session=not opts.no_session, verbose=True)
+    if opts.output:
+        save(data, opts.output)
+    if opts.compare:
+        print
+        print "%-50s %10s %10s %7s" % ('', 'reference', 'time', 'ratio')
+        for key, ref, t, ratio in compare(load(opts.compare), data):
+            print "%-50s %10.6f %10.6f %7.2f" % (key, ref, t, ratio)
+
+
+if __name__ == '__main__':
+    main()
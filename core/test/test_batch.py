@@ -0,0 +1,153 @@
+"""Test the batch evaluation of a composite node"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.tools import assert_raises
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+from openalea.core.batch import write_results, read_csv
+
+_pid = os.getpid()
+
+
+def divide(a, b):
+    return a / b
+
+
+class LocalNode(FuncNode):
+    """ Node which can not be loaded in another process """
+
+    def __setstate__(self, state):
+        if os.getpid() != _pid:
+            raise RuntimeError("loaded in another process")
+        FuncNode.__setstate__(self, state)
+
+
+class BrokenNode(FuncNode):
+    """ Node which can not be loaded """
+
+    def __setstate__(self, state):
+        raise RuntimeError("can not be loaded")
+
+
+def build(cls=FuncNode):
+    """ x, y -> divide -> z """
+    cn = CompositeNode([dict(name='x', value=1), dict(name='y', value=1)],
+                       [dict(name='z')])
+    n = cn.add_node(cls([dict(name='a'), dict(name='b')],
+                        [dict(name='out')], divide))
+    cn.connect(cn.id_in, 0, n, 0)
+    cn.connect(cn.id_in, 1, n, 1)
+    cn.connect(n, 0, cn.id_out, 0)
+    return cn
+
+
+def test_map_sequential():
+    cn = build()
+    records = [dict(x=6, y=2), (8, 4), dict(x=5)]
+    res = list(cn.map(records))
+    assert [r.index for r in res] == [0, 1, 2]
+    assert [r.outputs for r in res] == [[3], [2], [5]]
+
+
+def test_map_failure():
+    cn = build()
+    records = [dict(x=1, y=0), dict(x=4, y=2)]
+    res = list(cn.map(records))
+    assert isinstance(res[0].error.exception, ZeroDivisionError)
+    assert res[0].outputs is None
+    assert res[1].error is None and res[1].outputs == [2]
+
+
+def test_map_workers():
+    cn = build()
+    records = [dict(x=i, y=1) for i in range(50)] + [dict(y=0)]
+    res = list(cn.map(iter(records), workers=4))
+    assert len(res) == 51
+    assert sorted(r.index for r in res) == range(51)
+    for r in res:
+        if r.index == 50:
+            assert r.error is not None
+        else:
+            assert r.outputs == [r.index]
+
+
+def test_map_ordered():
+    cn = build()
+    records = [dict(x=i) for i in range(30)]
+    res = list(cn.map(records, workers=3, ordered=True))
+    assert [r.index for r in res] == range(30)
+    assert [r.outputs[0] for r in res] == range(30)
+
+
+def test_write_results():
+    cn = build()
+    out, err = StringIO(), StringIO()
+    nb = write_results(cn.map([dict(x=4, y=2), dict(y=0)]), out, err)
+    assert nb == 1
+    assert out.getvalue().strip() == "0,2"
+    assert "Record 1 failed" in err.getvalue()
+
+
+def test_map_shared():
+    cn = build()
+    records = [dict(x=i, y=1) for i in range(20)] + [dict(y=0)]
+    res = list(cn.map(records, workers=4, ordered=True, shared=True))
+    assert [r.outputs for r in res[:20]] == [[i] for i in range(20)]
+    assert isinstance(res[20].error, ZeroDivisionError)
+    # the graph is not modified
+    assert cn.get_input(0) == 1 and cn.node(cn.id_out).get_input(0) is None
+
+
+def test_map_processes():
+    cn = build()
+    records = [dict(x=i, y=1) for i in range(20)] + [dict(y=0)]
+    res = list(cn.map(records, workers=3, ordered=True, executor='process'))
+    assert [r.outputs for r in res[:20]] == [[i] for i in range(20)]
+    assert isinstance(res[20].error, ZeroDivisionError)
+    assert res[20].traceback
+    # the graph is evaluated in the worker processes
+    assert cn.get_input(0) == 1 and cn.node(cn.id_out).get_input(0) is None
+
+
+def test_read_csv():
+    dirname = tempfile.mkdtemp()
+    try:
+        marker = os.path.join(dirname, 'executed')
+        filename = os.path.join(dirname, 'data.csv')
+        f = open(filename, 'wb')
+        f.write('x,y,z\n')
+        f.write('1,"[1, 2]",len\n')
+        f.write('2.5,"open(%r, \'w\')",text\n' % marker)
+        f.close()
+
+        rows = list(read_csv(filename))
+        assert rows[0] == dict(x=1, y=[1, 2], z='len')
+        # the expressions are kept as strings, not evaluated
+        assert rows[1] == dict(x=2.5, y="open(%r, 'w')" % marker, z='text')
+        assert not os.path.exists(marker)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_map_processes_load_error():
+    # the node can not be loaded in the workers: each record fails
+    cn = build(LocalNode)
+    records = [dict(x=i, y=1) for i in range(5)]
+    res = list(cn.map(records, workers=2, ordered=True, executor='process'))
+    assert [r.index for r in res] == range(5)
+    for r in res:
+        assert r.outputs is None
+        assert 'another process' in str(r.error)
+
+    # the node can not be loaded at all: the error is raised at once
+    cn = build(BrokenNode)
+    assert_raises(RuntimeError, list,
+                  cn.map(records, workers=2, executor='process'))
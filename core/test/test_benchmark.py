@@ -0,0 +1,50 @@
+"""Test the benchmark suite on small workflows"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import tempfile
+
+import benchmark
+
+
+def test_workflows():
+    for name in benchmark.WORKFLOWS:
+        cn = benchmark.workflow(name, 10)
+        cn.eval_as_expression()
+        assert cn.node(cn.id_out).get_input(0) is not None, name
+
+    cn = benchmark.workflow('chain', 10)
+    cn.eval_as_expression()
+    assert cn.node(cn.id_out).get_input(0) == 10
+    cn = benchmark.workflow('lambda', 5)
+    cn.eval_as_expression()
+    assert cn.node(cn.id_out).get_input(0) == [1, 2, 3, 4, 5]
+
+
+def test_run():
+    data = benchmark.run(sizes=(5, ), repeat=1, session=False)
+    results = data['results']
+    assert data['meta']['sizes'] == [5]
+    assert results['graph/5/add_edge'] >= 0
+    assert results['memory/5/node'] > results['memory/5/port'] > 0
+    assert results['stream/5/eval/StreamEvaluation'] >= 0
+    for name in benchmark.WORKFLOWS:
+        assert results['%s/5/instantiate' % name] >= 0
+        assert results['%s/5/to_factory' % name] >= 0
+        assert results['%s/5/eval/LambdaEvaluation' % name] >= 0
+        assert results['%s/5/eval/compiled' % name] >= 0
+    assert results['chain/5/eval/CompositeEvaluation'] >= 0
+
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        benchmark.save(data, filename)
+        assert benchmark.load(filename) == data
+    finally:
+        os.remove(filename)
+
+    cmp = benchmark.compare(data, data)
+    assert cmp
+    assert all(ratio == 1 for key, ref, t, ratio in cmp)
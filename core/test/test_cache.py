@@ -0,0 +1,127 @@
+"""Test the node output cache"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import shutil
+import tempfile
+
+from openalea.core.node import FuncNode, NodeFactory
+from openalea.core.cache import (stable_hash, OutputCache, UncachableError,
+                                 enable_output_cache, disable_output_cache,
+                                 get_output_cache)
+
+calls = []
+
+
+def square(x):
+    calls.append(x)
+    return x * x
+
+
+def pure_node(pure=True):
+    node = FuncNode([dict(name='x', value=0)], [dict(name='out')], square)
+    node.factory = NodeFactory('square', pure=pure)
+    return node
+
+
+class TestCache:
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        del calls[:]
+
+    def tearDown(self):
+        disable_output_cache()
+        shutil.rmtree(self.dirname)
+
+    def test_stable_hash(self):
+        assert stable_hash([1, 'a', None]) == stable_hash([1, 'a', None])
+        assert stable_hash([1]) != stable_hash((1, ))
+        assert stable_hash(1) != stable_hash(1.)
+        assert stable_hash(dict(a=1, b=2)) == stable_hash(dict(b=2, a=1))
+        assert stable_hash(set([1, 2])) == stable_hash(set([2, 1]))
+
+        try:
+            stable_hash(lambda x: x)
+            assert False
+        except UncachableError:
+            pass
+
+    def test_memory_cache(self):
+        cache = enable_output_cache(OutputCache(False))
+        assert get_output_cache() is cache
+
+        node = pure_node()
+        node.set_input(0, 3)
+        node.eval()
+        assert node.get_output(0) == 9
+
+        # a fresh node with the same inputs reuse the result
+        node = pure_node()
+        node.set_input(0, 3)
+        node.eval()
+        assert node.get_output(0) == 9
+        assert calls == [3]
+
+        node.set_input(0, 4)
+        node.eval()
+        assert node.get_output(0) == 16
+        assert calls == [3, 4]
+
+    def test_not_pure(self):
+        enable_output_cache(OutputCache(False))
+        for i in range(2):
+            node = pure_node(pure=False)
+            node.set_input(0, 3)
+            node.eval()
+        assert calls == [3, 3]
+
+    def test_lru(self):
+        cache = OutputCache(False, max_items=2)
+        for i in range(3):
+            cache.set(str(i), i)
+        assert '0' not in cache
+        assert cache.get('2') == 2
+
+    def test_disk_cache(self):
+        enable_output_cache(OutputCache(self.dirname))
+        node = pure_node()
+        node.set_input(0, 5)
+        node.eval()
+
+        # another cache (e.g. a new process) on the same directory
+        enable_output_cache(OutputCache(self.dirname))
+        node = pure_node()
+        node.set_input(0, 5)
+        node.eval()
+        assert node.get_output(0) == 25
+        assert calls == [5]
+
+    def test_disk_eviction(self):
+        cache = OutputCache(self.dirname, max_items=1, max_disk_size=1000)
+        for i in range(10):
+            cache.set(str(i), 'x' * 300)
+        assert cache.disk_size() <= 1000
+        assert '9' in cache
+        assert '0' not in cache
+
+        cache.clear()
+        assert cache.disk_size() == 0
+        assert '9' not in cache
+
+    def test_copies(self):
+        for dirname in (False, self.dirname):
+            cache = OutputCache(dirname)
+            value = [1, [2]]
+            cache.set('k', value)
+            # the stored value is not modified with the output
+            value[1].append(3)
+            hit = cache.get('k')
+            assert hit == [1, [2]]
+            # nor by the node which receives it
+            hit[1].append(4)
+            assert cache.get('k') == [1, [2]]
+
+            # the values which can not be pickled are not cached
+            cache.set('f', lambda x: x)
+            assert 'f' not in cache
@@ -0,0 +1,121 @@
+"""Test the compilation of composite nodes into Python functions"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import gc
+import linecache
+
+from nose.tools import assert_raises
+
+from openalea.core.node import Node, FuncNode
+from openalea.core.compositenode import CompositeNode, CompositeNodeFactory
+from openalea.core.compiler import (compile_composite, CompileError,
+                                    single_output, multiple_outputs)
+
+import benchmark
+
+
+def outputs(cn):
+    cn.eval_as_expression(cn.id_out)
+    return tuple(cn.get_output(i) for i in range(cn.get_nb_output()))
+
+
+def test_workflows():
+    for name in ('chain', 'fanout', 'diamond', 'nested'):
+        cn = benchmark.workflow(name, 20)
+        func = cn.compile()
+        assert func.is_compiled(), name
+        assert not func.fallbacks, name
+        cn.set_input(0, 3)
+        assert func(3) == outputs(cn), name
+        assert func(x=3) == func(3)
+
+    factory = CompositeNodeFactory('chain')
+    benchmark.chain(10).to_factory(factory)
+    func = factory.compile()
+    assert func() == (10, )
+    assert func(5) == (15, )
+    assert_raises(TypeError, func, z=1)
+
+
+def test_fallback():
+    # lambda variables: the composite node is evaluated as a whole
+    cn = benchmark.workflow('lambda', 5)
+    func = cn.compile()
+    assert not func.is_compiled()
+    assert func() == ([1, 2, 3, 4, 5], )
+    assert func(2) == ([1, 2], )
+    assert_raises(CompileError, compile_composite, cn, True)
+
+    # nodes which are not FuncNode are evaluated in place
+    class Double(Node):
+        def __call__(self, inputs):
+            return self.get_input(0) * 2
+
+    cn = benchmark.chain(2)
+    vid = cn.add_node(Double([dict(name='a')], [dict(name='b')]))
+    cn.connect(cn.id_in, 0, vid, 0)
+    vsum = cn.add_node(FuncNode([dict(name='a'), dict(name='b')],
+                                [dict(name='c'), dict(name='d')],
+                                lambda a, b: (a + sum(b), a)))
+    cn.connect(vid, 0, vsum, 0)
+    for v in cn.in_neighbors(cn.id_out):
+        cn.connect(v, 0, vsum, 1)
+    cn.connect(vid, 0, vsum, 1)
+    cn.disconnect(list(cn.in_neighbors(cn.id_out))[0], 0, cn.id_out, 0)
+    cn.connect(vsum, 0, cn.id_out, 0)
+
+    func = cn.compile()
+    assert func.is_compiled()
+    assert func.fallbacks == [vid]
+    cn.set_input(0, 1)
+    assert func(1) == outputs(cn) == (2 + 3 + 2, )
+    assert 'v%d_0, v%d_1 = _multi(' % (vsum, vsum) in func.source
+
+
+def test_outputs():
+    assert single_output([1]) == 1
+    assert single_output((1, 2)) == (1, 2)
+    assert single_output(1) == 1
+    assert multiple_outputs(1, 2) == (1, None)
+    assert multiple_outputs([1, 2, 3], 2) == (1, 2)
+
+    cn = CompositeNode(inputs=[dict(name='x', value=[4])],
+                       outputs=[dict(name='y'), dict(name='z')])
+    vid = cn.add_node(FuncNode([dict(name='a')], [dict(name='b')],
+                               lambda a: a))
+    cn.connect(cn.id_in, 0, vid, 0)
+    cn.connect(vid, 0, cn.id_out, 0)
+    cn.connect(cn.id_in, 0, cn.id_out, 1)
+    func = cn.compile()
+    assert func() == outputs(cn) == (4, [4])
+
+
+def test_linecache():
+    func = benchmark.workflow('chain', 5).compile()
+    filename = func.func.func_code.co_filename
+    assert linecache.getline(filename, 1).startswith('def compiled_')
+
+    # the source is removed with the function
+    del func
+    gc.collect()
+    assert filename not in linecache.cache
+
+
+def test_current_inputs():
+    cn = CompositeNode(inputs=[dict(name='x', value=1)],
+                       outputs=[dict(name='y')])
+    vid = cn.add_node(FuncNode([dict(name='a'), dict(name='b', value=10)],
+                               [dict(name='c')], lambda a, b: a + b))
+    cn.connect(cn.id_in, 0, vid, 0)
+    cn.connect(vid, 0, cn.id_out, 0)
+    func = cn.compile()
+    assert func() == (11, )
+
+    # the inputs modified after the compilation are used
+    cn.node(vid).set_input(1, 20)
+    assert func() == (21, )
+    cn.set_input(0, 2)
+    assert func() == (22, )
+    assert func(3) == func(x=3) == (23, )
@@ -19,7 +19,10 @@ __license__ = "Cecill-C"
 __revision__ = " $Id$ "
 
 from openalea.core.pkgmanager import PackageManager
+from openalea.core import compositenode
 from openalea.core.compositenode import CompositeNodeFactory, CompositeNode
+from openalea.core.compositenode import copy_data
+from openalea.core.metadatadict import MetaDataDict
 from openalea.core.node import gen_port_list, RecursionError
 from openalea.core import Package
 from openalea.core.path import path
@@ -353,4 +356,111 @@ class TestClass:
         res = sg.get_output(0)
         assert ''.join(eval(res)) == "toto"
 
+    def test_instantiate_values(self):
+        """ Test the input values parsed once by the factory """
+        sg = CompositeNode()
+        addid = sg.add_node(self.plus_node)
+        val1id = sg.add_node(self.float_node)
+        sg.connect(val1id, 0, addid, 0)
+        sg.node(addid).set_input(1, [1., 2.])
+
+        sgfactory = CompositeNodeFactory("values")
+        sg.to_factory(sgfactory)
 
+        sg1 = sgfactory.instantiate()
+        sg2 = sgfactory.instantiate()
+        assert sg1.node(addid).get_input(1) == [1., 2.]
+        # mutable values are not shared
+        sg1.node(addid).get_input(1).append(3.)
+        assert sg2.node(addid).get_input(1) == [1., 2.]
+        assert sgfactory.instantiate().node(addid).get_input(1) == [1., 2.]
+        data = sg1.node(addid).internal_data
+        assert data['port_hide_changed'] is not \
+            sg2.node(addid).internal_data['port_hide_changed']
+
+        # the values are parsed again when they are modified
+        sgfactory.elt_value[addid] = [(1, '4.')]
+        assert sgfactory.instantiate().node(addid).get_input(1) == 4.
+
+    def test_instantiate_template(self):
+        """ Test the instantiation from a template """
+        sg = CompositeNode()
+        addid = sg.add_node(self.plus_node)
+        val1id = sg.add_node(self.float_node)
+        val2id = sg.add_node(self.float_node)
+        sg.connect(val1id, 0, addid, 0)
+        sg.connect(val2id, 0, addid, 1)
+        sgfactory = CompositeNodeFactory("template")
+        sg.to_factory(sgfactory)
+
+        compositenode.use_templates = True
+        try:
+            sg1 = sgfactory.instantiate()
+            sg2 = sgfactory.instantiate()
+            sg3 = sgfactory.instantiate()
+        finally:
+            compositenode.use_templates = False
+        assert sgfactory._template is not None
+
+        assert sg2 is not sg3 and sg2.node(addid) is not sg3.node(addid)
+        assert sg2.factory is sgfactory
+        assert sg2.node(addid).factory is sg1.node(addid).factory
+        assert sg2.node(addid).get_ad_hoc_dict() is not \
+            sg3.node(addid).get_ad_hoc_dict()
+        assert len(sg2) == len(sg1)
+        assert sorted(sg2.edges()) == sorted(sg1.edges())
+
+        for sg, val in ((sg2, 2.), (sg3, 5.)):
+            sg.node(val1id).set_input(0, val)
+            sg.node(val2id).set_input(0, 1.)
+        sg2()
+        sg3()
+        assert sg2.node(addid).get_output(0) == 3.
+        assert sg3.node(addid).get_output(0) == 6.
+
+        # the template is built again when the factory contents change
+        compositenode.use_templates = True
+        try:
+            sgfactory.elt_value[val1id] = [(0, '7.')]
+            assert sgfactory.instantiate().node(val1id).get_input(0) == 7.
+            del sgfactory.connections[sorted(sgfactory.connections)[0]]
+            assert len(list(sgfactory.instantiate().edges())) == 1
+
+            # and when a nested composite factory changes
+            pkg = Package("TemplatePkg", {})
+            pkg.add_factory(sgfactory)
+            self.pm.add_package(pkg)
+            outer = CompositeNodeFactory("outer", elt_factory={
+                2: ("TemplatePkg", "template")}, elt_data={2: {}})
+            outer.instantiate()
+            sgfactory.elt_value[val1id] = [(0, '8.')]
+            sub = outer.instantiate().node(2)
+            assert sub.node(val1id).get_input(0) == 8.
+
+            # and when a package is reloaded
+            d = {}
+            execfile('catalog.py', globals(), d)
+            self.pm.add_package(d['pkg'])
+            node = sgfactory.instantiate().node(addid)
+            assert node.factory is d['pkg']['plus']
+        finally:
+            compositenode.use_templates = False
+
+        sg.to_factory(sgfactory)
+        assert '_template' not in sgfactory.__dict__
+
+
+def test_copy_data():
+    data = dict(a=1, b='b', c=[1, (2, [3])], d=set([1]), e=(1, 2))
+    res = copy_data(data)
+    assert res == data
+    assert res is not data
+    assert res['c'] is not data['c'] and res['c'][1][1] is not data['c'][1][1]
+    assert res['d'] is not data['d']
+    assert res['b'] is data['b']
+
+    meta = MetaDataDict(dict=dict(position=[1, 2], color=None))
+    res = copy_data(meta)
+    assert isinstance(res, MetaDataDict)
+    assert res.get_metadata('position') == [1, 2]
+    assert res.get_metadata('position') is not meta.get_metadata('position')
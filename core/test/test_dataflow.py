@@ -56,3 +56,61 @@ def test_dataflow():
     except PortError:
         test=True
     assert test
+
+
+def test_dataflow_port_index():
+    """ test port to edges and local port indices """
+    df = DataFlow()
+    vid1 = df.add_vertex()
+    pid11 = df.add_out_port(vid1, 0)
+    vid2 = df.add_vertex()
+    pid21 = df.add_in_port(vid2, 0)
+    pid22 = df.add_in_port(vid2, 1)
+
+    eid1 = df.connect(pid11, pid21)
+    eid2 = df.connect(pid11, pid22)
+    eid3 = df.connect(pid11, pid22)
+
+    assert df.nb_connections(pid11) == 3
+    assert set(df.connected_edges(pid22)) == set((eid2, eid3))
+    assert set(df.connected_ports(pid11)) == set((pid21, pid22))
+    assert df.out_port(vid1, 0) == pid11
+    assert df.in_port(vid2, 1) == pid22
+
+    df.remove_edge(eid2)
+    assert df.nb_connections(pid11) == 2
+    assert set(df.connected_edges(pid22)) == set((eid3, ))
+
+    df.remove_port(pid21)
+    assert df.nb_connections(pid11) == 1
+    try:
+        df.in_port(vid2, 0)
+        assert False
+    except PortError:
+        pass
+
+    df.remove_vertex(vid2)
+    assert df.nb_connections(pid11) == 0
+
+    # indices rebuilt from scratch are the same
+    vid3 = df.add_vertex()
+    pid31 = df.add_in_port(vid3, 0)
+    df.connect(pid11, pid31)
+    edges = dict(df._port_edges)
+    local_ports = dict(df._local_ports)
+    df.rebuild_port_index()
+    assert df._port_edges == edges
+    assert df._local_ports == local_ports
+
+
+def test_port_pickle():
+    import pickle
+    df = DataFlow()
+    vid = df.add_vertex()
+    pid = df.add_out_port(vid, "out")
+    assert not hasattr(df.port(pid), '__dict__')
+    for protocol in (0, 2):
+        df2 = pickle.loads(pickle.dumps(df, protocol))
+        assert df2.vertex(pid) == vid
+        assert df2.local_id(pid) == "out"
+        assert df2.is_out_port(pid)
@@ -4,7 +4,8 @@ import operator
 from openalea.core.dataflow import DataFlow
 from openalea.core.dataflow_state import DataflowState
 from openalea.core.dataflow_evaluation import (AbstractEvaluation,
-                                               BruteEvaluation)
+                                               BruteEvaluation,
+                                               LazyEvaluation)
 from openalea.core.node import Node, FuncNode
 
 
@@ -190,3 +191,151 @@ def test_dataflow_evaluation_no_input_two_outputs():
     dfs.reinit()
     pid2 = df.add_out_port(vid, "out3")
     assert_raises(UserWarning, lambda: algo.eval(env, dfs, vid))
+
+
+def test_dataflow_evaluation_lazy():
+    calls = []
+
+    def counting_add(a, b):
+        calls.append('add')
+        return a + b
+
+    df, (pid_in, pid_out) = get_dataflow()
+    vid_add = [vid for vid in df.vertices() if df.nb_in_edges(vid) == 2][0]
+    df.set_actor(vid_add, FuncNode({}, {}, counting_add))
+    algo = LazyEvaluation(df)
+
+    env = 0
+    dfs = DataflowState(df)
+    dfs.set_data(pid_in, 1)
+    algo.eval(env, dfs)
+    assert dfs.is_valid()
+    assert calls == ['add']
+    assert dfs.get_data(pid_out) is None
+
+    # nothing has changed
+    algo.eval(env, dfs)
+    assert calls == ['add']
+
+    dfs.set_data(pid_in, 2)
+    algo.eval(env, dfs)
+    assert calls == ['add', 'add']
+
+    # not lazy
+    df.actor(vid_add).lazy = False
+    algo.eval(env, dfs)
+    assert calls == ['add', 'add', 'add']
+
+
+def test_dataflow_evaluation_lazy_states():
+    df, (pid_in, pid_out) = get_dataflow()
+    vid_add = [vid for vid in df.vertices() if df.nb_in_edges(vid) == 2][0]
+    pid_res, = df.out_ports(vid_add)
+    algo = LazyEvaluation(df)
+
+    env = 0
+    states = [DataflowState(df) for i in range(3)]
+    for i, dfs in enumerate(states):
+        dfs.set_data(pid_in, i)
+        algo.eval(env, dfs)
+
+    for i, dfs in enumerate(states):
+        assert dfs.get_data(pid_res) == i + 5
+
+    states[1].set_data(pid_in, 10)
+    algo.eval(env, states[1])
+    assert [dfs.get_data(pid_res) for dfs in states] == [5, 15, 7]
+
+
+def composite(calls):
+    """ x, y -> add -> double -> z
+        x ------------^
+    """
+    from openalea.core.compositenode import CompositeNode
+
+    def add(a, b):
+        calls.append('add')
+        return a + b
+
+    cn = CompositeNode([dict(name='x', value=1), dict(name='y', value=2)],
+                       [dict(name='z')])
+    n1 = cn.add_node(FuncNode([dict(name='a'), dict(name='b')],
+                              [dict(name='out')], add))
+    n2 = cn.add_node(FuncNode([dict(name='a'), dict(name='b', value=0)],
+                              [dict(name='out')], operator.add))
+    cn.connect(cn.id_in, 0, n1, 0)
+    cn.connect(cn.id_in, 1, n1, 1)
+    cn.connect(n1, 0, n2, 0)
+    cn.connect(cn.id_in, 0, n2, 1)
+    cn.connect(n2, 0, cn.id_out, 0)
+    return cn
+
+
+def test_composite_evaluation():
+    calls = []
+    cn = composite(calls)
+    algo, state = cn.new_state()
+    algo.eval(None, state)
+    assert algo.get_outputs(state) == [4]
+
+    # lazy
+    algo.eval(None, state)
+    assert calls == ['add']
+    algo.set_inputs(state, dict(y=5))
+    algo.eval(None, state)
+    assert algo.get_outputs(state) == [7]
+    assert calls == ['add', 'add']
+
+    # several states, the composite node is not modified
+    states = [algo.new_state((i, i)) for i in range(3)]
+    for s in states:
+        algo.eval(None, s)
+    assert [algo.get_outputs(s) for s in states] == [[0], [3], [6]]
+    assert cn.node(cn.id_out).get_input(0) is None
+    for vid in cn.vertices():
+        if vid not in (cn.id_in, cn.id_out):
+            assert cn.node(vid).get_output(0) is None
+
+
+def test_composite_evaluation_nested():
+    from openalea.core.compositenode import CompositeNode
+
+    calls = []
+    inner = composite(calls)
+    cn = CompositeNode([dict(name='x')], [dict(name='z')])
+    vid = cn.add_node(inner)
+    cn.connect(cn.id_in, 0, vid, 0)
+    cn.connect(vid, 0, cn.id_out, 0)
+
+    algo, s1 = cn.new_state([3])
+    s2 = algo.new_state([4])
+    algo.eval(None, s1)
+    algo.eval(None, s2)
+    # y keeps the value of the inner node input
+    assert algo.get_outputs(s1) == [8]
+    assert algo.get_outputs(s2) == [10]
+
+
+def test_composite_evaluation_threads():
+    import threading
+
+    calls = []
+    cn = composite(calls)
+    algo, state = cn.new_state()
+    results = {}
+
+    def run(i):
+        for j in range(20):
+            s = algo.new_state((i, j))
+            algo.eval(None, s)
+            results[(i, j)] = algo.get_outputs(s)[0]
+
+    threads = [threading.Thread(target=run, args=(i, )) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 80
+    for (i, j), z in results.iteritems():
+        assert z == 2 * i + j
@@ -190,3 +190,63 @@ def test_dataflow_state_get_data():
     n2.get_ad_hoc_dict().set_metadata('position', [10, 0])
     n5.get_ad_hoc_dict().set_metadata('position', [0, 0])
     assert tuple(dfs.get_data(pid32)) == (3, 1)
+
+
+def test_dataflow_state_connected_ports():
+    df = DataFlow()
+    vid1 = df.add_vertex()
+    pid11 = df.add_out_port(vid1, "out")
+    vid2 = df.add_vertex()
+    pid21 = df.add_out_port(vid2, "out")
+    vid3 = df.add_vertex()
+    pid31 = df.add_in_port(vid3, "in")
+
+    df.connect(pid21, pid31)
+    eid = df.connect(pid11, pid31)
+    n1 = Node()
+    n2 = Node()
+    df.set_actor(vid1, n1)
+    df.set_actor(vid2, n2)
+
+    dfs = DataflowState(df)
+    assert dfs.connected_ports(pid31) == [pid11, pid21]
+    assert dfs.connected_ports(pid31) is dfs.connected_ports(pid31)
+
+    n1.get_ad_hoc_dict().set_metadata('position', [10, 0])
+    assert dfs.connected_ports(pid31) == [pid21, pid11]
+
+    df.remove_edge(eid)
+    assert dfs.connected_ports(pid31) == [pid21]
+
+
+def test_dataflow_state_stamps():
+    df = DataFlow()
+    vid1 = df.add_vertex()
+    pid10 = df.add_in_port(vid1, "in")
+    pid11 = df.add_out_port(vid1, "out")
+    vid2 = df.add_vertex()
+    pid21 = df.add_out_port(vid2, "out")
+    vid3 = df.add_vertex()
+    pid31 = df.add_in_port(vid3, "in")
+
+    df.connect(pid11, pid31)
+    df.connect(pid21, pid31)
+
+    dfs = DataflowState(df)
+    assert dfs.get_stamp(pid10) is None
+    dfs.set_data(pid10, 0)
+    assert dfs.get_stamp(pid10) is not None
+    assert dfs.get_last_evaluation(vid1) is None
+
+    dfs.set_data(pid11, 1)
+    dfs.set_evaluated(vid1)
+    assert dfs.get_stamp(pid11) < dfs.get_last_evaluation(vid1)
+    # pid21 has no data yet
+    assert dfs.get_stamp(pid31) is None
+    dfs.set_data(pid21, 2)
+    assert dfs.get_stamp(pid31) == dfs.get_stamp(pid21)
+
+    dfs.reinit()
+    assert dfs.get_stamp(pid10) is not None
+    assert dfs.get_stamp(pid11) is None
+    assert dfs.get_last_evaluation(vid1) is None
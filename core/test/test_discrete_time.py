@@ -0,0 +1,137 @@
+"""Test the discrete event scheduler of DiscreteTimeEvaluation"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from openalea.core.node import Node
+from openalea.core.compositenode import CompositeNode, CompositeNodeFactory
+from openalea.core.algo.dataflow_evaluation import DiscreteTimeEvaluation
+from openalea.core.system.systemnodes import IterWithDelayNode
+
+
+class Clock(Node):
+    """ Output the number of evaluations, reevaluated after period """
+
+    def __init__(self, period, nb=None):
+        Node.__init__(self, [dict(name='period', value=period)],
+                      [dict(name='count')])
+        self.nb = nb
+        self.resets = 0
+        self.count = 0
+
+    def reset(self):
+        self.count = 0
+        self.resets += 1
+
+    def eval(self):
+        self.outputs[0] = self.count
+        self.count += 1
+        if self.nb is not None and self.count >= self.nb:
+            return False
+        return self.inputs[0]
+
+
+class Collector(Node):
+    """ Record its inputs at each evaluation """
+
+    def __init__(self, nb_inputs=1):
+        Node.__init__(self, [dict(name='in%d' % i) for i in range(nb_inputs)],
+                      [dict(name='out')])
+        self.lazy = False
+        self.values = []
+
+    def __call__(self, inputs):
+        self.values.append(tuple(inputs))
+        return inputs[0]
+
+
+def test_iter_with_delay():
+    cn = CompositeNode()
+    it = IterWithDelayNode([dict(name='generator'), dict(name='delay')],
+                           [dict(name='value')])
+    it.set_input(0, [1, 2, 3])
+    it.set_input(1, 3)
+    vit = cn.add_node(it)
+    vcol = cn.add_node(Collector())
+    cn.connect(vit, 0, vcol, 0)
+    # an independant branch is evaluated once
+    vother = cn.add_node(Collector())
+
+    algo = DiscreteTimeEvaluation(cn)
+    algo.eval()
+    assert cn.node(vcol).values == [(1, ), (2, ), (3, )]
+    assert cn.node(vother).values == [(None, )]
+    assert it.iterable == "Empty"
+
+
+def test_events():
+    cn = CompositeNode()
+    v2 = cn.add_node(Clock(2))
+    v3 = cn.add_node(Clock(3))
+    vcol = cn.add_node(Collector(2))
+    cn.connect(v2, 0, vcol, 0)
+    cn.connect(v3, 0, vcol, 1)
+
+    algo = DiscreteTimeEvaluation(cn, horizon=6)
+    algo.eval()
+    # times 0, 2, 3, 4, 6: the simultaneous events at 6 are processed once
+    assert cn.node(vcol).values == [(0, 0), (1, 0), (1, 1), (2, 1), (3, 2)]
+    # the clocks are reset at the horizon
+    assert cn.node(v2).resets == cn.node(v3).resets == 1
+
+
+def test_horizon():
+    cn = CompositeNode()
+    vclock = cn.add_node(Clock(1))
+    vcol = cn.add_node(Collector())
+    cn.connect(vclock, 0, vcol, 0)
+
+    DiscreteTimeEvaluation(cn, horizon=10).eval()
+    assert len(cn.node(vcol).values) == 11
+
+    # the default horizon is the one of the composite node
+    cn.node(vcol).values = []
+    cn.horizon = 10000
+    algo = DiscreteTimeEvaluation(cn)
+    assert algo.horizon == 10000
+    algo.eval()
+    assert len(cn.node(vcol).values) == 10001
+
+    # it is saved with the factory
+    empty = CompositeNode()
+    empty.horizon = 10000
+    factory = CompositeNodeFactory('clock')
+    empty.to_factory(factory)
+    assert factory.horizon == 10000
+    assert factory.instantiate().horizon == 10000
+    assert 'horizon=10000' in repr(factory.get_writer())
+
+    # no horizon: a node returning no delay after its event stops the
+    # simulation
+    cn.horizon = None
+    cn.node(vcol).values = []
+    cn.node(vclock).nb = 5
+    algo = DiscreteTimeEvaluation(cn)
+    assert algo.horizon is None
+    algo.eval()
+    assert len(cn.node(vcol).values) == 5
+
+
+def test_step():
+    cn = CompositeNode()
+    vclock = cn.add_node(Clock(10))
+    vcol = cn.add_node(Collector())
+    cn.connect(vclock, 0, vcol, 0)
+
+    algo = DiscreteTimeEvaluation(cn, horizon=20)
+    for i in range(3):
+        algo.eval(step=True)
+        assert cn.node(vcol).values[-1] == (i, )
+    assert algo._current_cycle == 20
+    # the next event is after the horizon: the nodes are reset
+    algo.eval(step=True)
+    assert cn.node(vclock).resets == 1
+    assert len(cn.node(vcol).values) == 3
+    # and the simulation starts again
+    algo.eval(step=True)
+    assert cn.node(vcol).values[-1] == (0, )
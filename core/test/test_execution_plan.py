@@ -0,0 +1,101 @@
+"""Test the reuse of the execution plan by the evaluation algorithms"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+
+
+def add_node(cn):
+    func = lambda *args: sum(args)
+    return cn.add_node(FuncNode([dict(name='a', value=1),
+                                 dict(name='b', value=0)],
+                                [dict(name='out')], func))
+
+
+def build():
+    """ a -> c <- b """
+    cn = CompositeNode()
+    a = add_node(cn)
+    b = add_node(cn)
+    c = add_node(cn)
+    cn.connect(a, 0, c, 0)
+    cn.connect(b, 0, c, 1)
+    return cn, (a, b, c)
+
+
+def test_algo_class():
+    cn, (a, b, c) = build()
+    algo = cn.get_eval_algo()
+    # no state is shared between the evaluations
+    assert cn.get_eval_algo() is not algo
+    assert type(cn.get_eval_algo()) is type(algo)
+
+    cn.eval_algo = "BrutEvaluation"
+    algo2 = cn.get_eval_algo()
+    assert algo2.__class__.__name__ == "BrutEvaluation"
+
+
+def test_plan_reuse():
+    cn, (a, b, c) = build()
+    cn.eval_as_expression()
+    assert cn.node(c).get_output(0) == 2
+
+    algo = cn.get_eval_algo()
+    plan = algo.get_plan()
+    cn.eval_as_expression()
+    assert cn.get_eval_algo().get_plan() is plan
+    assert c in plan.leaves() and a not in plan.leaves()
+    assert plan.inputs(c) == [(0, [(cn.node(a), 0)]),
+                              (1, [(cn.node(b), 0)])]
+
+
+def test_plan_positions():
+    cn, (a, b, c) = build()
+    cn.connect(b, 0, c, 0)
+    for vid, x in ((a, 10), (b, 0)):
+        cn.node(vid).get_ad_hoc_dict().set_metadata('position', [x, 0])
+    plan = cn.get_eval_algo().get_plan()
+    assert [nactor for nactor, port in plan.inputs(c)[0][1]] == \
+        [cn.node(b), cn.node(a)]
+
+    # moving a node sorts the parents again
+    cn.node(a).get_ad_hoc_dict().set_metadata('position', [-10, 0])
+    assert not plan.is_valid()
+    plan = cn.get_eval_algo().get_plan()
+    assert [nactor for nactor, port in plan.inputs(c)[0][1]] == \
+        [cn.node(a), cn.node(b)]
+
+    # the positions of the other nodes, or of another dataflow, are not used
+    cn.node(c).get_ad_hoc_dict().set_metadata('position', [5, 5])
+    other, nodes = build()
+    other.node(nodes[0]).get_ad_hoc_dict().set_metadata('position', [1, 1])
+    assert plan.is_valid()
+    assert cn.get_eval_algo().get_plan() is plan
+    plan = cn.get_eval_algo().get_plan()
+    assert [nactor for nactor, port in plan.inputs(c)[0][1]] == \
+        [cn.node(a), cn.node(b)]
+
+
+def test_plan_invalidation():
+    cn, (a, b, c) = build()
+    cn.eval_as_expression()
+    algo = cn.get_eval_algo()
+    plan = algo.get_plan()
+
+    cn.disconnect(b, 0, c, 1)
+    assert not plan.is_valid()
+    cn.node(c).set_input(1, 5)
+    cn.eval_as_expression()
+    assert algo.get_plan() is not plan
+    assert cn.node(c).get_output(0) == 6
+    leaves = algo.get_plan().leaves()
+    assert b in leaves and c in leaves
+
+    d = add_node(cn)
+    cn.connect(c, 0, d, 0)
+    cn.eval_as_expression()
+    assert cn.node(d).get_output(0) == 6
+    leaves = algo.get_plan().leaves()
+    assert d in leaves and c not in leaves
@@ -0,0 +1,73 @@
+"""Test the node executors"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import operator
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode, NodeFactory
+from openalea.core.executor import (is_pure, dumps_call, remote_call,
+                                    ThreadExecutor, ProcessExecutor)
+from openalea.core.algo.dataflow_evaluation import ParallelEvaluation
+
+
+def pid(x):
+    return os.getpid()
+
+
+def pure_node(func, nb_inputs=1):
+    factory = NodeFactory('pure', pure=True)
+    inputs = [dict(name='in%d' % i, value=i) for i in range(nb_inputs)]
+    node = FuncNode(inputs, [dict(name='out')], func)
+    node.factory = factory
+    return node
+
+
+def test_is_pure():
+    node = pure_node(operator.add, 2)
+    assert is_pure(node)
+    node.factory = NodeFactory('impure')
+    assert not is_pure(node)
+    node.factory = None
+    assert not is_pure(node)
+
+
+def test_remote_call():
+    cn = CompositeNode()
+    node = pure_node(operator.add, 2)
+    cn.add_node(node)
+
+    data = dumps_call(node, [1, 2])
+    assert remote_call(data) == 3
+
+
+def test_thread_executor():
+    ex = ThreadExecutor(2)
+    res = []
+    ex.apply_async(operator.add, (1, 2), callback=res.append)
+    ex.close()
+    assert res == [3]
+
+
+def test_process_executor():
+    node = pure_node(pid)
+    ex = ProcessExecutor(2)
+    ex.eval_node(node)
+    ex.close()
+    assert node.get_output(0) != os.getpid()
+    assert not node.modified
+
+
+def test_parallel_eval_process():
+    cn = CompositeNode()
+    vids = [cn.add_node(pure_node(pid)) for i in range(4)]
+    impure = cn.add_node(FuncNode([dict(name='x', value=0)],
+                                  [dict(name='out')], pid))
+
+    ParallelEvaluation(cn, nb_workers=2, executor='process').eval()
+
+    for vid in vids:
+        assert cn.node(vid).get_output(0) != os.getpid()
+    assert cn.node(impure).get_output(0) == os.getpid()
@@ -0,0 +1,113 @@
+"""Test the compact snapshots of graphs and dataflows"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import pickle
+
+from nose.tools import assert_raises
+
+from openalea.core.graph.graph import Graph, InvalidVertex, InvalidEdge
+from openalea.core.dataflow import DataFlow, PortError
+
+
+def same_topology(g, snap):
+    assert sorted(g.vertices()) == list(snap.vertices())
+    assert sorted(g.edges()) == list(snap.edges())
+    for vid in g.vertices():
+        assert sorted(g.in_neighbors(vid)) == list(snap.in_neighbors(vid))
+        assert sorted(g.out_neighbors(vid)) == list(snap.out_neighbors(vid))
+        assert g.nb_in_neighbors(vid) == snap.nb_in_neighbors(vid)
+        assert sorted(g.in_edges(vid)) == list(snap.in_edges(vid))
+        assert sorted(g.out_edges(vid)) == list(snap.out_edges(vid))
+        assert g.nb_edges(vid) == snap.nb_edges(vid)
+    for eid in g.edges():
+        assert g.source(eid) == snap.source(eid)
+        assert g.target(eid) == snap.target(eid)
+
+
+def test_graph():
+    g = Graph()
+    vids = [g.add_vertex() for i in range(6)]
+    g.add_vertex(10)
+    for s, t in [(0, 1), (0, 1), (1, 2), (0, 2), (3, 4), (2, 4)]:
+        g.add_edge((vids[s], vids[t]))
+    g.remove_vertex(vids[5])
+
+    snap = g.snapshot()
+    assert snap.is_valid()
+    assert snap is g.snapshot()
+    same_topology(g, snap)
+    assert snap.nb_out_edges(vids[0]) == 3
+    assert snap.nb_out_neighbors(vids[0]) == 2
+    assert sorted(snap.leaves()) == [vids[4], 10]
+    assert snap.ancestors(vids[2]) == set(vids[:3])
+    assert snap.descendants(vids[1]) == set([vids[1], vids[2], vids[4]])
+
+    order = snap.topological_order()
+    assert sorted(order) == sorted(g.vertices())
+    for eid in g.edges():
+        assert order.index(g.source(eid)) < order.index(g.target(eid))
+
+    assert vids[5] not in snap and 11 not in snap and -1 not in snap
+    assert_raises(InvalidVertex, snap.in_neighbors, vids[5])
+    assert_raises(InvalidVertex, snap.out_edges, 100)
+    assert_raises(InvalidEdge, snap.source, 100)
+    assert not snap.has_edge(-1)
+
+    # rebuilt after a modification
+    eid = g.add_edge((vids[4], 10))
+    assert not snap.is_valid()
+    snap = g.snapshot()
+    same_topology(g, snap)
+    g.remove_edge(eid)
+    same_topology(g, g.snapshot())
+
+    # not pickled
+    g2 = pickle.loads(pickle.dumps(g))
+    assert '_snapshot' not in g2.__dict__
+    same_topology(g2, g2.snapshot())
+
+
+def test_cycle():
+    g = Graph()
+    for i in range(4):
+        g.add_vertex()
+    g.add_edge((0, 1))
+    g.add_edge((1, 2))
+    g.add_edge((2, 1))
+    g.add_edge((0, 3))
+    order = g.snapshot().topological_order()
+    assert order[:2] == [0, 3]
+    assert sorted(order[2:]) == [1, 2]
+
+
+def test_dataflow():
+    df = DataFlow()
+    vid1 = df.add_vertex()
+    pid11 = df.add_out_port(vid1, "out")
+    vid2 = df.add_vertex()
+    pid21 = df.add_in_port(vid2, "in1")
+    pid22 = df.add_in_port(vid2, "in2")
+    pid23 = df.add_out_port(vid2, "res")
+    eid1 = df.connect(pid11, pid21)
+    eid2 = df.connect(pid11, pid22)
+
+    snap = df.snapshot()
+    same_topology(df, snap)
+    assert list(snap.in_ports(vid2)) == [pid21, pid22]
+    assert list(snap.out_ports(vid2)) == [pid23]
+    assert sorted(snap.ports(vid2)) == sorted(df.ports(vid2))
+    assert snap.is_out_port(pid11) and snap.is_in_port(pid21)
+    assert snap.vertex(pid23) == vid2
+    assert snap.local_id(pid22) == "in2"
+    assert list(snap.connected_ports(pid11)) == [pid21, pid22]
+    assert snap.nb_connections(pid23) == 0
+    assert snap.source_port(eid2) == pid11
+    assert snap.target_port(eid1) == pid21
+    assert_raises(PortError, snap.vertex, 100)
+
+    # ports are part of the topology
+    pid24 = df.add_in_port(vid2, "in3")
+    assert not snap.is_valid()
+    assert list(df.snapshot().in_ports(vid2)) == [pid21, pid22, pid24]
@@ -0,0 +1,75 @@
+"""Test the id generator"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import pickle
+from nose.tools import assert_raises
+
+from openalea.core.graph.id_generator import IdGenerator
+
+
+def test_get_id():
+    gen = IdGenerator()
+    assert [gen.get_id() for i in range(3)] == [0, 1, 2]
+    assert gen.get_id(5) == 5
+    # holes are reused lowest first
+    assert gen.get_id() == 3
+    assert gen.get_id() == 4
+    assert gen.get_id() == 6
+    assert_raises(IndexError, lambda: gen.get_id(5))
+
+
+def test_release_id():
+    gen = IdGenerator()
+    gen.get_ids(5)
+    gen.release_id(3)
+    gen.release_id(1)
+    assert gen.get_id() == 1
+    assert gen.get_id() == 3
+    assert gen.get_id() == 5
+
+    assert_raises(IndexError, lambda: gen.release_id(10))
+    gen.release_id(2)
+    assert_raises(IndexError, lambda: gen.release_id(2))
+    assert gen.get_id(2) == 2
+    assert_raises(IndexError, lambda: gen.get_id(2))
+
+
+def test_sparse_ids():
+    gen = IdGenerator()
+    assert gen.get_id(10 ** 9) == 10 ** 9
+    assert len(gen._free) == 1
+    assert gen.get_id(7) == 7
+    assert gen.get_ids(8) == [0, 1, 2, 3, 4, 5, 6, 8]
+
+
+def test_reserve_ids():
+    gen = IdGenerator()
+    gen.reserve_ids([4, 2, 10])
+    assert gen.get_ids(4) == [0, 1, 3, 5]
+    assert_raises(IndexError, lambda: gen.reserve_ids([11, 3]))
+    assert gen.get_id() == 6
+
+
+def test_old_pickle():
+    gen = IdGenerator()
+    gen.__setstate__(dict(_id_max=5, _id_list=[1, 3]))
+    assert gen.get_ids(3) == [1, 3, 5]
+    gen = pickle.loads(pickle.dumps(gen))
+    assert gen.get_id() == 6
+
+
+def test_reserved_ids():
+    gen = IdGenerator()
+    gen.reserve_ids([2, 5])
+    # a reserved id can be taken once
+    assert gen.get_id(5) == 5
+    assert_raises(IndexError, lambda: gen.get_id(5))
+    assert gen.get_ids(3, reserve=True) == [0, 1, 3]
+    assert gen.get_id(1) == 1
+    assert gen.get_id() == 4
+    gen.release_id(2)
+    assert_raises(IndexError, lambda: gen.release_id(2))
+    assert gen.get_id(2) == 2
+    assert_raises(IndexError, lambda: gen.get_id(2))
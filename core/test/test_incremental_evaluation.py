@@ -0,0 +1,105 @@
+"""Test the incremental (dirty propagation) evaluation algorithm"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+from openalea.core.algo.dataflow_evaluation import IncrementalEvaluation
+
+
+def counting_node(calls, name, nb_inputs=1):
+    def func(*args):
+        calls.append(name)
+        return sum(args)
+    inputs = [dict(name='in%d' % i, value=0) for i in range(nb_inputs)]
+    return FuncNode(inputs, [dict(name='out')], func)
+
+
+def build(calls):
+    """
+    a   b
+     \ / \\
+      c   d
+    """
+    cn = CompositeNode()
+    a = cn.add_node(counting_node(calls, 'a'))
+    b = cn.add_node(counting_node(calls, 'b'))
+    c = cn.add_node(counting_node(calls, 'c', 2))
+    d = cn.add_node(counting_node(calls, 'd'))
+    cn.connect(a, 0, c, 0)
+    cn.connect(b, 0, c, 1)
+    cn.connect(b, 0, d, 0)
+    cn.eval_algo = "IncrementalEvaluation"
+    return cn, (a, b, c, d)
+
+
+def test_dirty_propagation():
+    calls = []
+    cn, (a, b, c, d) = build(calls)
+    for vid in (a, b, c, d):
+        assert cn.is_dirty(vid)
+
+    IncrementalEvaluation(cn).eval()
+    assert sorted(calls) == ['a', 'b', 'c', 'd']
+    assert not any(cn.is_dirty(vid) for vid in (a, b, c, d))
+
+    cn.node(a).set_input(0, 1)
+    assert cn.is_dirty(a) and cn.is_dirty(c)
+    assert not cn.is_dirty(b) and not cn.is_dirty(d)
+
+
+def test_incremental_eval():
+    calls = []
+    cn, (a, b, c, d) = build(calls)
+    cn.eval_as_expression()
+    del calls[:]
+
+    cn.node(a).set_input(0, 2)
+    cn.eval_as_expression()
+    assert calls == ['a', 'c']
+    assert cn.node(c).get_output(0) == 2
+
+    del calls[:]
+    cn.node(b).set_input(0, 3)
+    cn.eval_as_expression(d)
+    assert calls == ['b', 'd']
+    # c is still dirty
+    assert cn.is_dirty(c)
+    assert cn.node(d).get_output(0) == 3
+
+    del calls[:]
+    cn.eval_as_expression()
+    assert calls == ['c']
+    assert cn.node(c).get_output(0) == 5
+
+
+def test_incremental_eval_block():
+    calls = []
+    cn, (a, b, c, d) = build(calls)
+    cn.eval_as_expression()
+    del calls[:]
+
+    cn.node(a).block = True
+    cn.node(a).set_input(0, 2)
+    cn.eval_as_expression()
+    assert calls == []
+    # c stays dirty while a is
+    assert cn.is_dirty(a) and cn.is_dirty(c)
+
+    cn.node(a).block = False
+    cn.eval_as_expression()
+    assert calls == ['a', 'c']
+    assert cn.node(c).get_output(0) == 2
+
+
+def test_incremental_connect():
+    calls = []
+    cn, (a, b, c, d) = build(calls)
+    cn.eval_as_expression()
+    del calls[:]
+
+    cn.disconnect(b, 0, d, 0)
+    assert cn.is_dirty(d) and not cn.is_dirty(c)
+    cn.eval_as_expression()
+    assert calls == ['d']
@@ -0,0 +1,139 @@
+"""Test the lazy factories built from a static parse of wralea files"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import sys
+import shutil
+import tempfile
+
+from openalea.core.pkgmanager import PackageManager
+from openalea.core.package import LazyPyPackageReaderWralea
+from openalea.core.package import PyPackageReaderWralea
+from openalea.core import lazyfactory
+from openalea.core.lazyfactory import parse_wralea, LazyFactory
+from openalea.core.node import NodeFactory
+from openalea.core.observer import AbstractListener
+
+class Listener(AbstractListener):
+    def __init__(self):
+        AbstractListener.__init__(self)
+        self.events = []
+
+    def notify(self, sender, event=None):
+        self.events.append(event)
+
+
+wralea_code = """
+from openalea.core import *
+
+__name__ = "pkg_lazy_test"
+__version__ = '0.1'
+__all__ = ['plus', 'neg']
+
+plus = Factory(name="plus",
+               category="Math",
+               description="add two numbers",
+               inputs=(dict(name="a", interface=IInt, value=0),
+                       dict(name="b", interface=IInt(min=0), value=0)),
+               nodemodule="operator",
+               nodeclass="add")
+
+neg = Factory(name="neg",
+              nodemodule="operator",
+              nodeclass="neg")
+
+Alias(plus, "add")
+"""
+
+
+class TestLazyFactory(object):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.wralea = os.path.join(self.tmp, '__wralea__.py')
+        self.write(wralea_code)
+        self.pm = PackageManager()
+
+    def tearDown(self):
+        self.pm.pkgs.pop('pkg_lazy_test', None)
+        shutil.rmtree(self.tmp)
+
+    def write(self, code):
+        f = open(self.wralea, 'w')
+        f.write(code)
+        f.close()
+
+    def test_parse(self):
+        info = parse_wralea(self.wralea, 'lazy_wralea')
+        assert info.__name__ == 'pkg_lazy_test'
+        assert info.__version__ == '0.1'
+
+        plus = info.plus
+        assert isinstance(plus, LazyFactory)
+        assert plus.is_node()
+        assert plus.category == "Math"
+        assert plus.alias == ["add"]
+        assert [p['name'] for p in plus.inputs] == ['a', 'b']
+        assert [p['interface'] for p in plus.inputs] == ['IInt', 'IInt']
+
+    def test_not_parsed(self):
+        self.write(wralea_code + "\nplus.category = 'Other'\n")
+        assert parse_wralea(self.wralea, 'lazy_wralea') is None
+
+        self.write(wralea_code.replace("['plus', 'neg']", "['plus', 'data']")
+                   + "\ndata = DataFactory(name='file.txt')\n")
+        assert parse_wralea(self.wralea, 'lazy_wralea') is None
+
+    def test_register(self):
+        reader = LazyPyPackageReaderWralea(self.wralea)
+        reader.register_packages(self.pm)
+        modname = reader.get_pkg_name()
+        assert modname not in sys.modules
+
+        pkg = self.pm['pkg_lazy_test']
+        factory = pkg['plus']
+        assert pkg['add'] is factory
+        assert factory.package is pkg
+        assert isinstance(factory, LazyFactory)
+        assert factory in self.pm.get_nodes('pkg_lazy_test')
+
+        node = factory.instantiate()
+        assert modname in sys.modules
+        assert isinstance(factory, NodeFactory)
+        assert not isinstance(pkg['neg'], NodeFactory)
+        assert factory.package is pkg
+        node.set_input(0, 1)
+        node.set_input(1, 2)
+        node.eval()
+        assert node.output(0) == 3
+
+        # other attributes also load the module
+        assert pkg['neg'].nodeclass_name == "neg"
+        assert isinstance(pkg['neg'], NodeFactory)
+        sys.modules.pop(modname, None)
+
+    def test_listeners(self):
+        reader = LazyPyPackageReaderWralea(self.wralea)
+        reader.register_packages(self.pm)
+        modname = reader.get_pkg_name()
+        factory = self.pm['pkg_lazy_test']['plus']
+        listener = Listener()
+        listener.initialise(factory)
+
+        # the factory of the module is also observed
+        module = PyPackageReaderWralea(self.wralea).import_module()
+        key = (factory.lazy_wralea, factory.lazy_key)
+        lazyfactory._modules[key] = module
+        other = Listener()
+        other.initialise(module.plus)
+
+        # the listeners registered before the load are kept
+        factory.load()
+        assert isinstance(factory, NodeFactory)
+        factory.notify_listeners(('loaded', ))
+        assert listener.events == [('loaded', )]
+        assert other.events == []
+        lazyfactory._modules.pop(key, None)
+        sys.modules.pop(modname, None)
@@ -154,3 +154,39 @@ def test_node_output():
     n2.eval()
     assert n1.get_output('y') == 1
     assert n2.get_output('y') == [1, 2]
+
+
+def test_lazy_state():
+    import pickle
+    from openalea.core.observer import AbstractListener
+
+    n = Node([dict(name='x')], [dict(name='y')])
+    port = n.input_desc[0]
+    assert '_listeners' not in n.__dict__
+    assert '_listeners' not in port.__dict__
+    assert '_HasAdHoc__ad_hoc_dict' not in n.__dict__
+    assert '_continuous_eval' not in n.__dict__
+    n.set_input(0, 1)
+    assert '_continuous_eval' not in n.__dict__
+
+    # the ad hoc dicts share the types of their slots
+    d1 = n.get_ad_hoc_dict()
+    d2 = Node().get_ad_hoc_dict()
+    assert d1._metaTypes is d2._metaTypes
+    d1.add_metadata('extra', int)
+    assert 'extra' in d1.keys() and 'extra' not in d2.keys()
+
+    class Listener(AbstractListener):
+        events = []
+
+        def notify(self, sender, event):
+            self.events.append(event)
+
+    l = Listener()
+    l.initialise(n.continuous_eval)
+    n.set_input(0, 2)
+    assert l.events == [("node_modified", )]
+
+    n2 = pickle.loads(pickle.dumps(n))
+    assert '_continuous_eval' not in n2.__dict__
+    assert sorted(n2.get_ad_hoc_dict().keys()) == sorted(d1.keys())
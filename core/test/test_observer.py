@@ -6,6 +6,7 @@ __revision__ = " $Id$ "
 
 from openalea.core.observer import *
 import gc
+import threading
 
 
 class NotifyException(Exception):
@@ -86,3 +87,108 @@ def test_lock():
         assert True
     except NotifyException:
         assert False
+
+
+# Test batched notifications
+
+
+class eventlistener(AbstractListener):
+
+    def __init__(self):
+        AbstractListener.__init__(self)
+        self.events = []
+
+    def notify(self, sender, event=None):
+        self.events.append((sender, event))
+
+
+def test_batch():
+    l = eventlistener()
+    o1 = myobserved()
+    o2 = myobserved()
+    l.initialise(o1)
+    l.initialise(o2)
+
+    with observed_batch():
+        o1.notify_listeners(("start_eval", ))
+        o1.notify_listeners(("input_modified", 0))
+        o1.notify_listeners(("input_modified", 1))
+        o1.notify_listeners(("input_modified", 0))
+        o2.notify_listeners(("start_eval", ))
+        o1.notify_listeners(("vertex_added", 1))
+        o1.notify_listeners(("vertex_added", 1))
+        o1.notify_listeners(("data_modified", "caption", "a"))
+        o1.notify_listeners(("data_modified", "caption", "b"))
+        o1.notify_listeners(("stop_eval", ))
+        o1.notify_listeners(("start_eval", ))
+        assert l.events == []
+
+    # the coalesced events are delivered at the position of the last one
+    assert l.events == [(o1, ("input_modified", 1)),
+                        (o1, ("input_modified", 0)),
+                        (o2, ("start_eval", )),
+                        (o1, ("vertex_added", 1)),
+                        (o1, ("vertex_added", 1)),
+                        (o1, ("data_modified", "caption", "b")),
+                        (o1, ("stop_eval", )),
+                        (o1, ("start_eval", ))]
+
+    del l.events[:]
+    o1.notify_listeners(("stop_eval", ))
+    assert l.events == [(o1, ("stop_eval", ))]
+
+
+def test_thread_batch():
+    l = eventlistener()
+    o = myobserved()
+    l.initialise(o)
+
+    # the batch only queues the events of the thread which opened it
+    with observed_batch():
+        o.notify_listeners(("start_eval", ))
+        thread = threading.Thread(target=o.notify_listeners,
+                                  args=(("stop_eval", ), ))
+        thread.start()
+        thread.join()
+        assert l.events == [(o, ("stop_eval", ))]
+    assert l.events == [(o, ("stop_eval", )), (o, ("start_eval", ))]
+
+
+def test_nested_batch():
+    l = eventlistener()
+    o = myobserved()
+    l.initialise(o)
+
+    with observed_batch():
+        with observed_batch():
+            o.notify_listeners("update")
+        assert l.events == []
+        o.notify_listeners("update")
+    assert l.events == [(o, "update")]
+
+
+def test_throttled_batch():
+    l = eventlistener()
+    o = myobserved()
+    l.initialise(o)
+
+    with observed_batch(throttle=0):
+        o.notify_listeners("update")
+        assert l.events == [(o, "update")]
+        o.notify_listeners("update")
+        assert len(l.events) == 2
+
+
+def test_lazy_state():
+    o = myobserved()
+    # nothing is stored until the object is observed
+    assert o.__dict__ == {}
+    o.notify_listeners("update")
+    assert o.__dict__ == {}
+
+    l = eventlistener()
+    l.initialise(o)
+    o.notify_listeners("update")
+    assert l.events == [(o, "update")]
+    assert '_Observed__isNotifying' not in o.__dict__
+    assert '_listeners' not in o.__getstate__()
@@ -0,0 +1,142 @@
+"""Test the parallel evaluation algorithm"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import threading
+
+from nose.tools import assert_raises
+
+from openalea.core.compositenode import CompositeNode, CompositeNodeFactory
+from openalea.core.node import FuncNode
+from openalea.core.algo.dataflow_evaluation import (ParallelEvaluation,
+                                                    EvaluationException)
+
+
+def fan_out(nb):
+    """ One source feeding nb float nodes, all summed by a final node """
+    cn = CompositeNode()
+    src = cn.add_node(FuncNode([dict(name='x', value=1.)],
+                               [dict(name='out')], float))
+    branches = []
+    for i in range(nb):
+        vid = cn.add_node(FuncNode([dict(name='x', value=0.)],
+                                   [dict(name='out')], lambda x: x * 2))
+        cn.connect(src, 0, vid, 0)
+        branches.append(vid)
+
+    tot = cn.add_node(FuncNode([dict(name='x', value=[])],
+                               [dict(name='out')], sum))
+    for vid in branches:
+        cn.connect(vid, 0, tot, 0)
+    return cn, src, branches, tot
+
+
+def test_parallel_eval():
+    cn, src, branches, tot = fan_out(10)
+    cn.eval_algo = "ParallelEvaluation"
+    assert isinstance(cn.get_eval_algo(), ParallelEvaluation)
+
+    cn.node(src).set_input(0, 3.)
+    cn.eval_as_expression(tot)
+    assert cn.node(tot).get_output(0) == 60.
+
+    cn.node(src).set_input(0, 1.)
+    cn.eval_as_expression()
+    assert cn.node(tot).get_output(0) == 20.
+
+
+def test_parallel_eval_concurrent():
+    # each branch waits for the other one: it only ends if they run at
+    # the same time
+    events = [threading.Event(), threading.Event()]
+
+    def meet(i):
+        def f(x):
+            events[i].set()
+            return events[1 - i].wait(10)
+        return f
+
+    cn = CompositeNode()
+    vids = [cn.add_node(FuncNode([dict(name='x', value=0)],
+                                 [dict(name='out')], meet(i)))
+            for i in range(2)]
+    ParallelEvaluation(cn, nb_workers=2).eval()
+    assert [cn.node(vid).get_output(0) for vid in vids] == [True, True]
+
+
+def test_parallel_eval_single_worker():
+    cn, src, branches, tot = fan_out(3)
+    algo = ParallelEvaluation(cn, nb_workers=1)
+    algo.eval()
+    assert cn.node(tot).get_output(0) == 6.
+
+
+def test_parallel_eval_priority():
+    order = []
+
+    def record(name):
+        def f(x):
+            order.append(name)
+            return x
+        return f
+
+    cn = CompositeNode()
+    low = cn.add_node(FuncNode([dict(name='x', value=0)],
+                               [dict(name='out')], record('low')))
+    high = cn.add_node(FuncNode([dict(name='x', value=0)],
+                                [dict(name='out')], record('high')))
+    cn.node(high).internal_data['priority'] = 10
+
+    ParallelEvaluation(cn, nb_workers=1).eval()
+    assert order == ['high', 'low']
+
+
+def test_parallel_eval_block():
+    cn, src, branches, tot = fan_out(2)
+    ParallelEvaluation(cn).eval()
+    assert cn.node(tot).get_output(0) == 4.
+
+    cn.node(branches[0]).block = True
+    cn.node(src).set_input(0, 5.)
+    ParallelEvaluation(cn).eval()
+    # blocked node keeps its previous output
+    assert cn.node(branches[0]).get_output(0) == 2.
+    assert cn.node(tot).get_output(0) == 12.
+
+
+def test_parallel_eval_exception():
+    def fail(x):
+        raise ValueError(x)
+
+    cn, src, branches, tot = fan_out(4)
+    bad = cn.add_node(FuncNode([dict(name='x', value=0)],
+                               [dict(name='out')], fail))
+    cn.connect(src, 0, bad, 0)
+    cn.connect(bad, 0, tot, 0)
+
+    algo = ParallelEvaluation(cn)
+    assert_raises(EvaluationException, algo.eval)
+    assert cn.node(bad).raise_exception
+    assert cn.node(tot).get_output(0) is None
+
+
+def test_parallel_eval_escaping_exception():
+    class Abort(BaseException):
+        pass
+
+    class AbortNode(FuncNode):
+        # not turned into an EvaluationException by eval_vertex_code
+        def eval(self):
+            raise Abort()
+
+    for nb_workers in (1, 4):
+        cn, src, branches, tot = fan_out(4)
+        bad = cn.add_node(AbortNode([dict(name='x', value=0)],
+                                    [dict(name='out')], None))
+        cn.connect(src, 0, bad, 0)
+        cn.connect(bad, 0, tot, 0)
+
+        algo = ParallelEvaluation(cn, nb_workers=nb_workers)
+        assert_raises(Abort, algo.eval)
+        assert cn.node(tot).get_output(0) is None
@@ -0,0 +1,126 @@
+"""Test the on-disk package index"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import sys
+import shutil
+import tempfile
+
+from openalea.core.observer import AbstractListener
+from openalea.core.pkgmanager import PackageManager
+from openalea.core.pkgindex import PackageIndex, loads_packages
+from openalea.core.package import PyPackageReaderWralea
+
+wralea_code = """
+from openalea.core import Factory
+
+__name__ = "pkg_index_test"
+__version__ = '0.0.1'
+__alias__ = ['pkg_index_alias']
+__all__ = ['plus']
+
+plus = Factory(name="plus",
+               category="Math",
+               inputs=(dict(name="a", value=0), dict(name="b", value=0)),
+               nodemodule="operator",
+               nodeclass="add")
+"""
+
+
+class TestPackageIndex(object):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pkgdir = os.path.join(self.tmp, 'idxpkg')
+        os.mkdir(self.pkgdir)
+        self.wralea = os.path.join(self.pkgdir, '__wralea__.py')
+        f = open(self.wralea, 'w')
+        f.write(wralea_code)
+        f.close()
+        self.index_file = os.path.join(self.tmp, 'index.pic')
+        self.pm = PackageManager()
+
+    def tearDown(self):
+        for key in ('pkg_index_test', '#pkg_index_alias'):
+            self.pm.pkgs.pop(key, None)
+        shutil.rmtree(self.tmp)
+
+    def register(self, index):
+        reader = PyPackageReaderWralea(self.wralea)
+        self.pm.register_reader(reader, index)
+        modname = reader.get_pkg_name()
+        imported = modname in sys.modules
+        sys.modules.pop(modname, None)
+        return imported
+
+    def test_register_from_index(self):
+        index = PackageIndex(self.index_file)
+        assert self.register(index)
+        assert 'pkg_index_test' in self.pm
+        index.save()
+
+        del self.pm.pkgs['pkg_index_test']
+        del self.pm.pkgs['#pkg_index_alias']
+
+        class Listener(AbstractListener):
+            events = []
+
+            def notify(self, sender, event):
+                self.events.append(event)
+
+        listener = Listener()
+        listener.initialise(self.pm)
+
+        # the wralea file is not imported again
+        index = PackageIndex(self.index_file)
+        assert not self.register(index)
+        pkg = self.pm['pkg_index_test']
+        assert self.pm['pkg_index_alias'] is pkg
+        factory = pkg['plus']
+        assert factory.package is pkg
+        assert factory.category == "Math"
+        # the packages are added like the ones of an imported file
+        assert "update" in listener.events
+        assert len(self.pm.category) > 0
+
+        node = factory.instantiate()
+        node.set_input(0, 2)
+        node.set_input(1, 3)
+        node.eval()
+        assert node.output(0) == 5
+
+    def test_invalidation(self):
+        index = PackageIndex(self.index_file)
+        assert self.register(index)
+        # the packages registered by the file are indexed
+        packages = loads_packages(index.files[self.wralea][1])
+        assert [key for key, pkg in packages] == \
+            ['#pkg_index_alias', 'pkg_index_test']
+        assert not self.register(index)
+
+        f = open(self.wralea, 'a')
+        f.write("\n# modified\n")
+        f.close()
+        assert self.register(index)
+        assert not self.register(index)
+
+        # the other modules of the package are also checked
+        f = open(os.path.join(self.pkgdir, '__init__.py'), 'w')
+        f.write("# package\n")
+        f.close()
+        assert self.register(index)
+        assert not self.register(index)
+
+    def test_walkfiles(self):
+        index = PackageIndex(self.index_file)
+        files = index.walkfiles(self.tmp, '*wralea*.py')
+        assert files == [self.wralea]
+
+        subdir = os.path.join(self.pkgdir, 'sub')
+        os.mkdir(subdir)
+        other = os.path.join(subdir, 'my_wralea.py')
+        open(other, 'w').close()
+        files = index.walkfiles(self.tmp, '*wralea*.py')
+        assert sorted(files) == sorted([self.wralea, other])
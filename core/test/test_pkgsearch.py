@@ -0,0 +1,129 @@
+"""Test the factory index used by PackageManager.search_node"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from time import time
+
+from openalea.core.node import NodeFactory
+from openalea.core.package import Package
+from openalea.core.pkgsearch import FactoryIndex
+
+
+def factory(name, description='', category='', inputs=(), outputs=()):
+    return NodeFactory(name=name, description=description,
+                       category=category, nodemodule='mod', nodeclass=name,
+                       inputs=[dict(name=n) for n in inputs],
+                       outputs=[dict(name=n) for n in outputs])
+
+
+def package(name, factories):
+    pkg = Package(name, {}, path='.')
+    for f in factories:
+        pkg[f.name] = f
+    return pkg
+
+
+def build():
+    math = package('math', [factory('sum', 'sum of a list', 'math',
+                                    ['values'], ['sum']),
+                            factory('cumsum', 'cumulated sum', 'math',
+                                    ['values'], ['res']),
+                            factory('mult', 'product', 'math',
+                                    ['a', 'b'], ['res'])])
+    data = package('data', [factory('summary', 'describe data', 'stat',
+                                    ['data'], ['mean', 'std']),
+                            factory('reader', 'read a file', 'io',
+                                    ['checksum'], ['data'])])
+    return {'math': math, 'data': data}
+
+
+def names(factories):
+    return [f.name for f in factories]
+
+
+def test_search():
+    pkgs = build()
+    index = FactoryIndex()
+    index.update(pkgs)
+
+    assert names(index.search('sum')) == ['sum', 'summary', 'cumsum',
+                                          'reader']
+    assert names(index.search('SU')) == names(index.search('sum'))
+    assert names(index.search('file')) == ['reader']
+    assert names(index.search('cumulated')) == ['cumsum']
+    assert index.search('nothing') == []
+    assert names(index.search('sum', nb_inputs=1, nb_outputs=2)) == \
+        ['summary']
+    assert names(index.search('file', nb_inputs=2)) == []
+    assert names(index.search('mult', nb_inputs=2)) == ['mult']
+
+    # the factories without inputs are not selected by a number of inputs
+    pkgs['math']['const'] = factory('const', outputs=['value'])
+    index.update(pkgs)
+    assert names(index.search('const')) == ['const']
+    assert names(index.search('const', nb_inputs=0)) == []
+    assert names(index.search('const', nb_outputs=1)) == ['const']
+
+
+def test_update():
+    pkgs = build()
+    index = FactoryIndex()
+    index.update(pkgs)
+
+    pkgs['math']['summation'] = factory('summation')
+    index.update(pkgs)
+    assert 'summation' in names(index.search('summ'))
+
+    del pkgs['data']
+    index.update(pkgs)
+    assert names(index.search('summ')) == ['summation']
+
+    # a factory replaced by another one, the size does not change
+    pkgs['math']['summation'] = factory('summation', 'addition')
+    index.update(pkgs)
+    assert names(index.search('addition')) == ['summation']
+
+    index.remove_package('math')
+    assert index.search('sum') == []
+    assert not index.postings and not index.entries
+
+    index.add_package('#data', package('data', [factory('sum')]))
+    assert index.search('sum') == []
+
+
+def test_package_manager():
+    from openalea.core.pkgmanager import PackageManager
+
+    pkgman = PackageManager()
+    pkg = package('test_pkgsearch', [factory('zzsearchtest')])
+    pkgman.add_package(pkg)
+    try:
+        assert names(pkgman.search_node('zzsearch')) == ['zzsearchtest']
+        pkg2 = package('test_pkgsearch2', [factory('zzsearchtest2')])
+        pkgman.add_package(pkg2)
+        assert names(pkgman.search_node('zzsearch')) == ['zzsearchtest',
+                                                         'zzsearchtest2']
+        del pkgman['test_pkgsearch2']
+    finally:
+        del pkgman['test_pkgsearch']
+    assert pkgman.search_node('zzsearch') == []
+
+
+def test_speed():
+    pkgs = {}
+    for i in range(100):
+        pkgs['pkg%d' % i] = package('pkg%d' % i, [
+            factory('node%d_%d' % (i, j), 'description of node %d' % j,
+                    'category%d' % (j % 7), ['in%d' % k for k in range(3)],
+                    ['out']) for j in range(30)])
+    index = FactoryIndex()
+    index.update(pkgs)
+
+    t0 = time()
+    for i in range(100):
+        res = index.search('node12_2')
+        index.update(pkgs)
+    t = (time() - t0) / 100
+    assert len(res) == 11
+    assert t < 0.005, t
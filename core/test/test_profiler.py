@@ -0,0 +1,149 @@
+"""Test the profiling of the evaluation of dataflows"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import json
+import pstats
+import tempfile
+from StringIO import StringIO
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+from openalea.core.profiler import (Profiler, get_profiler, enable_profiler,
+                                    disable_profiler)
+
+
+def add(cn, func, *args):
+    n = FuncNode([dict(name='x', value=0)], [dict(name='y')], func)
+    vid = cn.add_node(n)
+    if args:
+        cn.connect(args[0], 0, vid, 0)
+    return vid
+
+
+def inner():
+    cn = CompositeNode()
+    add(cn, lambda x: x + 1, add(cn, lambda x: x + 1))
+    return cn
+
+
+def workflow():
+    """ a -> b -> c where b evaluates another dataflow """
+    cn = CompositeNode()
+    sub = inner()
+
+    def b(x):
+        sub.eval_as_expression()
+        return [x] * 100
+
+    va = add(cn, lambda x: x + 1)
+    vb = add(cn, b, va)
+    vc = add(cn, len, vb)
+    return cn, va, vb, vc
+
+
+def test_profiler():
+    cn, va, vb, vc = workflow()
+    assert get_profiler() is None
+
+    with Profiler() as prof:
+        assert get_profiler() is prof
+        cn.eval_as_expression()
+        cn.eval_as_expression()
+    assert get_profiler() is None
+    assert cn.node(vc).get_output(0) == 100
+
+    # the __in__ and __out__ vertices of both dataflows are evaluated
+    stats = prof.vertices
+    assert len(stats) == 9
+    for vid in (va, vb, vc):
+        s = stats[(vid, )]
+        assert s.count == 2
+        assert s.name == 'FuncNode'
+        assert s.wall >= s.call >= 0
+        assert s.notify() == s.wall - s.call
+        assert s.cpu >= 0
+    # nested evaluations
+    assert len([p for p in stats if p[0] == vb]) == 5
+    assert stats[(vb, )].children > 0
+    assert stats[(vb, )].own() <= stats[(vb, )].wall
+    # input and output sizes
+    assert stats[(vc, )].input_size > stats[(va, )].input_size
+    assert stats[(vb, )].output_size > stats[(va, )].output_size
+
+    out = StringIO()
+    prof.print_stats(limit=2, out=out)
+    assert len(out.getvalue().splitlines()) == 3
+
+    # not enabled anymore
+    cn.eval_as_expression()
+    assert stats[(va, )].count == 2
+
+
+def test_enable():
+    cn, va, vb, vc = workflow()
+    prof = enable_profiler()
+    try:
+        cn.eval_as_expression(va)
+    finally:
+        assert disable_profiler() is prof
+    assert (va, ) in prof.vertices and (vb, ) not in prof.vertices
+    prof.clear()
+    assert not prof.vertices
+
+
+def test_export():
+    cn, va, vb, vc = workflow()
+    with Profiler() as prof:
+        cn.eval_as_expression()
+
+    # pstats
+    st = pstats.Stats(prof)
+    assert st.total_calls == 9
+    fd, filename = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        prof.dump_stats(filename)
+        assert pstats.Stats(filename).total_calls == 9
+    finally:
+        os.remove(filename)
+
+    # callgrind
+    entries = prof.getstats()
+    assert len(entries) == 9
+    assert sum(len(e.calls) for e in entries) == 4
+
+    # flame graph
+    tree = prof.flamegraph()
+    assert tree['name'] == 'root'
+    assert len(tree['children']) == 5
+    json.loads(json.dumps(tree))
+    b = [c for c in tree['children'] if len(c['children'])]
+    assert len(b) == 1 and len(b[0]['children']) == 4
+    assert b[0]['value'] >= sum(c['value'] for c in b[0]['children'])
+
+
+def test_dataflow_evaluation():
+    from openalea.core.dataflow import DataFlow
+    from openalea.core.dataflow_state import DataflowState
+    from openalea.core.dataflow_evaluation import BruteEvaluation
+
+    df = DataFlow()
+    vid1 = df.add_vertex()
+    pid1 = df.add_out_port(vid1, "out")
+    vid2 = df.add_vertex()
+    pid2 = df.add_in_port(vid2, "in")
+    df.add_out_port(vid2, "out")
+    df.connect(pid1, pid2)
+    df.set_actor(vid1, FuncNode({}, {}, lambda: 'a' * 1000))
+    df.set_actor(vid2, FuncNode({}, {}, len))
+
+    algo = BruteEvaluation(df)
+    state = DataflowState(df)
+    with Profiler() as prof:
+        algo.eval(None, state)
+    assert sorted(prof.vertices) == [(vid1, ), (vid2, )]
+    assert prof.vertices[(vid2, )].input_size >= 1000
+    assert prof.vertices[(vid1, )].output_size >= 1000
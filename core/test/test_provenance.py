@@ -0,0 +1,122 @@
+"""Test the provenance recorder"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from openalea.core import provenance
+from openalea.core.provenance import (ProvenanceRecorder, enable_provenance,
+                                      disable_provenance, get_recorder)
+from openalea.core.algo import dataflow_evaluation
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+
+
+def build():
+    """ a -> b -> c """
+    cn = CompositeNode()
+    vids = []
+    for i in range(3):
+        node = FuncNode([dict(name='x', value=1)], [dict(name='y')],
+                        lambda x: x + 1)
+        node.set_caption('n%d' % i)
+        vids.append(cn.add_node(node))
+    cn.connect(vids[0], 0, vids[1], 0)
+    cn.connect(vids[1], 0, vids[2], 0)
+    return cn, vids
+
+
+class TestProvenance(object):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.db = os.path.join(self.tmp, 'prov.sq3')
+
+    def tearDown(self):
+        disable_provenance()
+        shutil.rmtree(self.tmp)
+
+    def test_record(self):
+        recorder = enable_provenance(ProvenanceRecorder(self.db,
+                                                        flush_interval=0.01))
+        cn, vids = build()
+        for i in range(3):
+            cn.eval_as_expression()
+        assert cn.node(vids[2]).get_output(0) == 4
+
+        execs = recorder.workflow_executions()
+        assert len(execs) == 3
+        for exec_id, workflow, start, end in execs:
+            assert end >= start
+
+        rows = recorder.node_executions()
+        assert [r[1] for r in rows if r[1] in ('n0', 'n1', 'n2')] == \
+            ['n0', 'n1', 'n2'] * 3
+        rows = recorder.node_executions(execs[0][0])
+        assert set(['n0', 'n1', 'n2']) <= set(r[1] for r in rows)
+        assert recorder.nb_events >= 3 * 5
+        assert recorder.overhead() > 0
+
+    def test_disabled(self):
+        recorder = enable_provenance(ProvenanceRecorder(self.db))
+        disable_provenance()
+        cn, vids = build()
+        cn.eval_as_expression()
+        assert recorder.nb_events == 0
+
+    def test_db_connexion(self):
+        get_database_name = provenance.get_database_name
+        provenance.get_database_name = lambda: self.db
+        try:
+            for i in range(2):
+                provenance.db_conn = None
+                cur = provenance.db_connexion()
+                assert cur is not None
+                cur.execute("SELECT * FROM NodeExec")
+                provenance.db_conn.close()
+        finally:
+            provenance.get_database_name = get_database_name
+            provenance.db_conn = None
+
+    def test_write_error(self):
+        recorder = enable_provenance(ProvenanceRecorder(self.db,
+                                                        flush_interval=0.01))
+        cn, vids = build()
+        cn.eval_as_expression()
+        assert len(recorder.workflow_executions()) == 1
+
+        # the batches which can not be written are dropped
+        conn = sqlite3.connect(self.db)
+        conn.execute("DROP TABLE NodeExec")
+        conn.commit()
+        conn.close()
+        cn.eval_as_expression()
+        recorder.flush()
+        assert not recorder.dead and get_recorder() is recorder
+
+        conn = sqlite3.connect(self.db)
+        provenance.db_create(conn.cursor())
+        conn.commit()
+        conn.close()
+        cn.eval_as_expression()
+        assert len(recorder.workflow_executions()) == 2
+        assert len(recorder.node_executions()) >= 3
+
+    def test_fatal_error(self):
+        db = os.path.join(self.tmp, 'missing', 'prov.sq3')
+        recorder = enable_provenance(ProvenanceRecorder(db, max_pending=2))
+        cn, vids = build()
+        cn.eval_as_expression()
+        assert recorder.dead
+        assert get_recorder() is None
+        assert not dataflow_evaluation.PROVENANCE
+
+        # the events are dropped, nothing waits for the writer
+        for i in range(10):
+            recorder.workflow_end(None)
+        recorder.flush()
+        recorder.close()
@@ -0,0 +1,139 @@
+"""Test the evaluation without notifications and measure what it saves"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import threading
+from time import time
+
+from openalea.core.algo.dataflow_evaluation import ParallelEvaluation
+from openalea.core.compositenode import CompositeNode
+from openalea.core.node import FuncNode
+from openalea.core.observer import AbstractListener, quiet_notifications
+from openalea.core.observer import notifications_enabled
+
+
+class EventListener(AbstractListener):
+
+    def __init__(self):
+        AbstractListener.__init__(self)
+        self.events = []
+
+    def notify(self, sender, event=None):
+        self.events.append(event)
+
+
+def chain(nb_nodes, length=50):
+    """ Return a composite node made of chains x -> x + 1 -> ... of at most
+    length nodes, and the vertex ids of the first chain. """
+    cn = CompositeNode()
+    vids = []
+    for i in range(nb_nodes):
+        n = FuncNode([dict(name='x', value=0)], [dict(name='y')],
+                     lambda x: x + 1)
+        vid = cn.add_node(n)
+        if i % length:
+            cn.connect(vids[-1], 0, vid, 0)
+        vids.append(vid)
+    return cn, vids[:length]
+
+
+def test_quiet():
+    cn, vids = chain(3)
+    listeners = []
+    for vid in vids:
+        l = EventListener()
+        l.initialise(cn.node(vid))
+        l.initialise(cn.node(vid).output_desc[0])
+        listeners.append(l)
+
+    eval_events = set([("start_eval", ), ("stop_eval", ),
+                       ("tooltip_modified", )])
+
+    assert notifications_enabled()
+    cn.eval_as_expression(quiet=True)
+    assert notifications_enabled()
+    assert cn.node(vids[-1]).get_output(0) == 3
+    assert all(not eval_events.intersection(l.events) for l in listeners)
+
+    cn.node(vids[0]).set_input(0, 1)
+    with quiet_notifications():
+        assert not notifications_enabled()
+        # only the evaluation events of the current thread are dropped
+        cn.node(vids[0]).set_input(0, 2)
+        enabled = []
+        thread = threading.Thread(
+            target=lambda: enabled.append(notifications_enabled()))
+        thread.start()
+        thread.join()
+        assert enabled == [True]
+        cn.eval_as_expression()
+    assert cn.node(vids[-1]).get_output(0) == 5
+    events = listeners[0].events
+    assert events.count(("input_modified", 0)) == 2
+    assert not eval_events.intersection(events)
+
+    cn.node(vids[0]).set_input(0, 0)
+    cn.eval_as_expression()
+    assert cn.node(vids[-1]).get_output(0) == 3
+    events = listeners[-1].events
+    assert ("start_eval", ) in events and ("stop_eval", ) in events
+    assert ("tooltip_modified", ) in events
+
+
+def test_quiet_workers():
+    # the quiet mode is passed to the threads evaluating the nodes
+    cn, vids = chain(8, length=2)
+    listeners = []
+    for vid in cn.vertices():
+        l = EventListener()
+        l.initialise(cn.node(vid))
+        listeners.append(l)
+    with quiet_notifications():
+        ParallelEvaluation(cn, nb_workers=4).eval()
+    assert cn.node(vids[-1]).get_output(0) == 2
+    assert all(("start_eval", ) not in l.events for l in listeners)
+
+    cn, vids = chain(1)
+    l = EventListener()
+    l.initialise(cn.node(vids[0]))
+    res = list(cn.map([dict()] * 4, workers=2, quiet=True))
+    assert len(res) == 4 and all(r.error is None for r in res)
+    assert ("start_eval", ) not in l.events
+
+
+def benchmark(nb_nodes=1000, repeat=5, listeners=False):
+    """ Return the best evaluation times (normal, quiet) of a chain of
+    nb_nodes trivial nodes. """
+    cn, vids = chain(nb_nodes)
+    keep = []
+    if listeners:
+        for vid in cn.vertices():
+            l = EventListener()
+            l.initialise(cn.node(vid))
+            keep.append(l)
+
+    times = {}
+    for quiet in (False, True):
+        best = None
+        for i in range(repeat):
+            cn.node(vids[0]).set_input(0, i)
+            t0 = time()
+            cn.eval_as_expression(quiet=quiet)
+            t = time() - t0
+            best = t if best is None else min(best, t)
+        times[quiet] = best
+    return times[False], times[True]
+
+
+def test_benchmark():
+    normal, quiet = benchmark(nb_nodes=50, repeat=2)
+    assert normal > 0 and quiet > 0
+
+
+if __name__ == '__main__':
+    for listeners in (False, True):
+        normal, quiet = benchmark(listeners=listeners)
+        print "1000 nodes%s: normal %.4fs, quiet %.4fs (%.0f%% saved)" % (
+            " with listeners" if listeners else "", normal, quiet,
+            100. * (normal - quiet) / normal)
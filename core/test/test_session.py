@@ -25,6 +25,7 @@ from openalea.core.pkgmanager import PackageManager
 from openalea.core.compositenode import CompositeNodeFactory, CompositeNode
 
 import os
+import shutil
 import openalea
 
 
@@ -49,10 +50,7 @@ def test_save_datapool():
     asession.load('test.pic')
 
     assert asession.datapool['i'] == [1, 2, 3]
-    try:
-        os.remove('test.pic')
-    except:
-        os.remove('test.pic.db')
+    shutil.rmtree('test.pic')
 
 def test_save_workspace():
     pm = PackageManager()
@@ -80,10 +78,7 @@ def test_save_workspace():
 
     asession.workspaces = []
     asession.load('test.pic')
-    try:
-        os.remove('test.pic')
-    except:
-        os.remove('test.pic.db')
+    shutil.rmtree('test.pic')
 
     i = asession.workspaces[0]
     assert type(i) == type(instance)
@@ -0,0 +1,149 @@
+"""Test the incremental store of the sessions"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+import os
+import shutil
+import tempfile
+import cPickle
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises
+
+from openalea.core.compositenode import CompositeNode
+from openalea.core.datapool import DataPool
+from openalea.core.session import Session
+from openalea.core.sessionstore import SessionStore, StoredData
+
+
+def files(dirname):
+    return sorted(os.listdir(os.path.join(dirname, 'objects')) +
+                  os.listdir(os.path.join(dirname, 'arrays')))
+
+
+def save(store, data, workspaces=()):
+    store.start([('os', os.__file__)])
+    for key, value in sorted(data.iteritems()):
+        store.add_data(key, value)
+    for ws in workspaces:
+        store.add_workspace(ws)
+    store.commit()
+    return store.written
+
+
+def test_store():
+    dirname = tempfile.mkdtemp()
+    try:
+        store = SessionStore(os.path.join(dirname, 'session'))
+        data = dict(a=range(10), b='b', c=dict(x=1))
+        assert save(store, data) == 3
+        before = files(store.dirname)
+
+        # nothing has changed
+        assert save(store, data) == 0
+        assert files(store.dirname) == before
+
+        # only the modified entry is written, the previous one removed
+        data['a'] = range(5)
+        assert save(store, data) == 1
+        assert len(files(store.dirname)) == 3
+        assert files(store.dirname) != before
+
+        store = SessionStore(store.dirname)
+        assert store.modules() == [('os', os.__file__)]
+        entries = store.datapool()
+        assert sorted(entries) == ['a', 'b', 'c']
+        assert isinstance(entries['a'], StoredData)
+        assert dict((k, v.load()) for k, v in entries.iteritems()) == data
+
+        # the entries which are not loaded are saved as is
+        entries['d'] = 'd'
+        assert save(store, entries) == 1
+        assert store.datapool()['d'].load() == 'd'
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_arrays():
+    try:
+        import numpy
+    except ImportError:
+        raise SkipTest("numpy is not installed")
+
+    dirname = tempfile.mkdtemp()
+    try:
+        store = SessionStore(dirname)
+        big = numpy.arange(100000.)
+        data = dict(big=big, small=numpy.arange(10), pair=(big, 1))
+        assert save(store, data) == 4
+        assert len(os.listdir(os.path.join(dirname, 'arrays'))) == 1
+
+        values = dict((k, v.load()) for k, v in store.datapool().iteritems())
+        assert isinstance(values['big'], numpy.memmap)
+        assert (values['big'] == big).all()
+        assert (values['small'] == data['small']).all()
+        assert values['pair'][1] == 1
+
+        # the mapped arrays are not written again
+        assert save(store, values) == 0
+        big[0] = -1
+        assert save(store, data) == 3
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_session():
+    dirname = tempfile.mkdtemp()
+    filename = os.path.join(dirname, 'session')
+    pool = DataPool()
+    pool.clear()
+    try:
+        session = Session()
+        cn = CompositeNode(inputs=[dict(name='x', value=1)],
+                           outputs=[dict(name='y')])
+        cn.connect(cn.id_in, 0, cn.id_out, 0)
+        session.workspaces = [cn]
+        pool['x'] = [1, 2]
+        session.save(filename)
+        assert SessionStore.is_store(filename)
+        assert session.get_store().written == 2
+        session.save()
+        assert session.get_store().written == 0
+
+        session.workspaces = []
+        session.load(filename)
+        assert len(session.workspaces) == 1
+        cn = session.workspaces[0]
+        assert cn.get_nb_input() == 1
+        assert list(cn.in_neighbors(cn.id_out)) == [cn.id_in]
+        # the data are unpickled on first access
+        assert isinstance(dict.__getitem__(pool, 'x'), StoredData)
+        assert pool['x'] == [1, 2]
+        assert pool.items() == [('x', [1, 2])]
+    finally:
+        pool.clear()
+        shutil.rmtree(dirname)
+
+
+def test_replace_shelve():
+    dirname = tempfile.mkdtemp()
+    filename = os.path.join(dirname, 'session')
+    try:
+        f = open(filename, 'wb')
+        f.write('shelve')
+        f.close()
+
+        # the previous session is kept if the new one can not be saved
+        store = SessionStore(filename)
+        store.start()
+        assert_raises(cPickle.PicklingError, store.add_data, 'f', lambda: 0)
+        assert os.path.isfile(filename)
+
+        assert save(store, dict(a=1)) == 1
+        assert store.dirname == filename
+        assert SessionStore.is_store(filename)
+        assert os.listdir(dirname) == ['session']
+        assert SessionStore(filename).datapool()['a'].load() == 1
+    finally:
+        shutil.rmtree(dirname)
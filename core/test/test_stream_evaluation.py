@@ -0,0 +1,122 @@
+"""Test the streaming evaluation of generator pipelines"""
+
+__license__ = "Cecill-C"
+__revision__ = " $Id$ "
+
+from nose.tools import assert_raises
+
+from openalea.core.node import Node
+from openalea.core.compositenode import CompositeNode
+from openalea.core.algo.dataflow_evaluation import (GeneratorEvaluation,
+                                                    StreamEvaluation,
+                                                    PrefetchIterator,
+                                                    EvaluationException)
+from openalea.core.system.systemnodes import IterNode
+
+
+class Source(Node):
+    """ Output its input, count its evaluations """
+
+    def __init__(self, value):
+        Node.__init__(self, [dict(name='in', value=value)],
+                      [dict(name='out')])
+        self.lazy = False
+        self.count = 0
+
+    def __call__(self, inputs):
+        self.count += 1
+        return inputs[0]
+
+
+class Collector(Node):
+    """ Record its inputs at each evaluation """
+
+    def __init__(self, nb_inputs=1):
+        Node.__init__(self, [dict(name='in%d' % i) for i in range(nb_inputs)],
+                      [dict(name='out')])
+        self.lazy = False
+        self.values = []
+
+    def __call__(self, inputs):
+        if inputs[0] == 'fail':
+            raise ValueError(inputs[0])
+        self.values.append(tuple(inputs))
+        return inputs[0]
+
+
+def pipeline(items):
+    """ source -> iter -> collector, the collector also reads the source
+    """
+    cn = CompositeNode()
+    vsrc = cn.add_node(Source(items))
+    vit = cn.add_node(IterNode([dict(name='generator')],
+                               [dict(name='value')]))
+    vcol = cn.add_node(Collector(2))
+    cn.connect(vsrc, 0, vit, 0)
+    cn.connect(vit, 0, vcol, 0)
+    cn.connect(vsrc, 0, vcol, 1)
+    return cn, vsrc, vit, vcol
+
+
+def test_stream():
+    items = range(10)
+    expected = [(i, items) for i in items]
+
+    cn, vsrc, vit, vcol = pipeline(items)
+    algo = GeneratorEvaluation(cn)
+    algo.eval()
+    assert cn.node(vcol).values == expected
+    assert cn.node(vsrc).count == len(items)
+    algo.eval()
+    assert cn.node(vcol).values == expected * 2
+
+    # the source is not reevaluated for each item
+    cn, vsrc, vit, vcol = pipeline(items)
+    algo = StreamEvaluation(cn)
+    algo.eval()
+    assert cn.node(vcol).values == expected
+    assert cn.node(vsrc).count == 1
+    assert cn.node(vit).iterable == "Empty"
+    algo.eval()
+    assert cn.node(vcol).values == expected * 2
+
+    # an input which is not iterable is passed as is
+    cn, vsrc, vit, vcol = pipeline(3)
+    StreamEvaluation(cn).eval()
+    assert cn.node(vcol).values == [(3, 3)]
+
+
+def test_prefetch():
+    items = range(1000)
+    cn, vsrc, vit, vcol = pipeline(items)
+    algo = StreamEvaluation(cn, prefetch=8)
+    algo.eval()
+    assert [v[0] for v in cn.node(vcol).values] == range(1000)
+    assert not algo._prefetchers
+
+    # the items which are not processed are kept by the node
+    items = ['a', 'b', 'fail', 'c', 'd']
+    cn, vsrc, vit, vcol = pipeline(items)
+    assert_raises(EvaluationException, StreamEvaluation(cn, prefetch=2).eval)
+    assert cn.node(vcol).values == [('a', items), ('b', items)]
+    assert cn.node(vit).nextval == 'c'
+    assert list(cn.node(vit).iterable) == ['d']
+
+
+def test_prefetch_iterator():
+    it = PrefetchIterator(iter(range(100)), 3)
+    assert [it.next() for i in range(10)] == range(10)
+    assert list(it) == range(10, 100)
+    assert list(it) == []
+
+    it = PrefetchIterator(iter(range(100)), 3)
+    assert it.next() == 0
+    assert list(it.detach()) == range(1, 100)
+
+    def failing():
+        yield 1
+        raise KeyError()
+    it = PrefetchIterator(failing(), 3)
+    assert it.next() == 1
+    assert_raises(KeyError, it.next)
+    assert_raises(StopIteration, it.next)
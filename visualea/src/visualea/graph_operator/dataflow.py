@@ -27,6 +27,7 @@ from openalea.visualea.dialogs import IOConfigDialog
 from openalea.core.compositenode import CompositeNodeFactory
 from openalea.core.pkgmanager import PackageManager
 from openalea.core import export_app
+from openalea.core.observer import observed_batch
 from openalea.core.algo import dataflow_evaluation as evalmodule
 from compositenode_inspector import InspectorView
 
@@ -37,7 +38,9 @@ class DataflowOperators(Base):
     @busy_cursor
     def graph_run(self):
         master = self.master
-        master.get_graph().eval_as_expression()
+        # items are updated once per node at the end of the evaluation
+        with observed_batch():
+            master.get_graph().eval_as_expression()
 
 
     def graph_reset(self):
@@ -27,6 +27,7 @@ from openalea.visualea.dialogs import DictEditor, ShowPortDialog, NodeChooser
 
 from openalea.core.compositenode import CompositeNode
 from openalea.core import observer, node
+from openalea.core.observer import observed_batch
 
 
 INSPECTOR_EDGE_OFFSET = 15
@@ -86,7 +87,8 @@ class VertexOperators(Base):
     @busy_cursor
     def vertex_run(self):
         master = self.master
-        master.get_graph().eval_as_expression(master.get_vertex_item().vertex().get_id())
+        with observed_batch():
+            master.get_graph().eval_as_expression(master.get_vertex_item().vertex().get_id())
 
     def vertex_open(self):
         master = self.master